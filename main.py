@@ -1,4 +1,25 @@
+from src.alerts import configure_from_env as configure_alerts_from_env, get_dispatcher
+from src.utils import load_settings
+from src.utils.instrumentation import DEFAULT_PROFILE_DIR, configure_from_env, dump_profiles
 from src.visualiser import main
 
 if __name__ == '__main__':
-    main()
+    settings = load_settings()
+    # The output settings in config.json, overridden by the ANOMALY_* environment variables
+    environ = settings.output.environ()
+    # Metrics and profiling are off unless ANOMALY_METRICS / ANOMALY_PROFILE are set
+    configure_from_env(environ)
+    # Alerts only reach the plot unless ANOMALY_ALERTS lists sinks
+    configure_alerts_from_env(
+        environ,
+        queue_size=settings.performance.alert_queue_size,
+        batch_size=settings.performance.alert_batch_size
+    )
+    try:
+        main()
+    finally:
+        if get_dispatcher() is not None:
+            get_dispatcher().close()
+        # Profiles collected with ANOMALY_PROFILE are written out for snakeviz or pstats
+        for path in dump_profiles(environ.get("ANOMALY_PROFILE_DIR") or DEFAULT_PROFILE_DIR):
+            print("Profile written to {}".format(path))
@@ -0,0 +1,5 @@
+from .sinks import AlertSink, FileSink, SyslogSink, WebhookSink, UnixSocketSink, sink_from_spec
+from .dispatcher import AlertDispatcher, set_dispatcher, get_dispatcher, submit_alert, configure_from_env
+
+__all__ = ['AlertSink', 'FileSink', 'SyslogSink', 'WebhookSink', 'UnixSocketSink', 'sink_from_spec',
+           'AlertDispatcher', 'set_dispatcher', 'get_dispatcher', 'submit_alert', 'configure_from_env']
@@ -0,0 +1,270 @@
+# Delivers alerts to sinks on background threads so slow sinks never block detection
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+from src.alerts.sinks import sink_from_spec
+from src.utils.instrumentation import count
+
+_dispatcher = None
+
+
+class TokenBucket:
+  """Allows `rate` batches per second on average, with bursts of up to `burst`"""
+  def __init__(self, rate, burst):
+    self.rate = rate
+    self.burst = burst
+    self.tokens = float(burst)
+    self.updated = time.monotonic()
+
+  def wait_time(self):
+    """Seconds until a token is available, taking it if one is available now"""
+    now = time.monotonic()
+    self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+    self.updated = now
+    if self.tokens >= 1:
+      self.tokens -= 1
+      return 0.0
+    return (1 - self.tokens) / self.rate
+
+
+class _SinkWorker:
+  """
+  Owns one sink's bounded queue and delivery thread. When the queue is full
+  the oldest alert is dropped, so an alert storm costs bounded memory and the
+  detection loop never waits for a sink.
+  """
+  def __init__(self, sink, queue_size, batch_size, flush_interval, rate, burst, max_retries, retry_backoff):
+    self.sink = sink
+    self.queue = deque()
+    self.queue_size = queue_size
+    self.batch_size = batch_size
+    self.flush_interval = flush_interval
+    self.bucket = None if rate is None else TokenBucket(rate, burst)
+    self.max_retries = max_retries
+    self.retry_backoff = retry_backoff
+
+    self.condition = threading.Condition()
+    self.closing = False
+    self.stopped = threading.Event() # Interrupts retry and rate limit waits on close
+    self.in_flight = 0
+    self.flushing = 0 # Callers waiting in flush, partial batches are sent straight away
+    self.sent = 0
+    self.dropped = 0
+    self.failed = 0
+    self.thread = threading.Thread(target=self._run, name="alerts-{}".format(sink.name), daemon=True)
+    self.thread.start()
+
+  def put(self, alert):
+    with self.condition:
+      if len(self.queue) >= self.queue_size:
+        self.queue.popleft()
+        self.dropped += 1
+        count("alerts.dropped.{}".format(self.sink.name))
+      self.queue.append(alert)
+      if len(self.queue) >= self.batch_size:
+        self.condition.notify()
+
+  def _next_batch(self):
+    with self.condition:
+      # Wait for a full batch, or send a partial batch after flush_interval
+      deadline = time.monotonic() + self.flush_interval
+      while len(self.queue) < self.batch_size and not (self.closing or self.flushing):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+          break
+        self.condition.wait(remaining)
+      batch = [self.queue.popleft() for _ in range(min(self.batch_size, len(self.queue)))]
+      self.in_flight = len(batch)
+      return batch
+
+  def _wait(self, seconds):
+    """Sleeps unless the dispatcher is closing, returns False if it is"""
+    return not self.stopped.wait(seconds)
+
+  def _deliver(self, batch):
+    for attempt in range(self.max_retries + 1):
+      try:
+        self.sink.send(batch)
+        self.sent += len(batch)
+        count("alerts.sent.{}".format(self.sink.name), len(batch))
+        return
+      except Exception:
+        if attempt == self.max_retries or not self._wait(self.retry_backoff * 2 ** attempt):
+          break
+    self.failed += len(batch)
+    count("alerts.failed.{}".format(self.sink.name), len(batch))
+
+  def _run(self):
+    while True:
+      batch = self._next_batch()
+      if batch:
+        if self.bucket is not None:
+          delay = self.bucket.wait_time()
+          while delay > 0 and self._wait(delay):
+            delay = self.bucket.wait_time()
+        self._deliver(batch)
+      with self.condition:
+        self.in_flight = 0
+        self.condition.notify_all()
+        if self.closing and not self.queue:
+          return
+
+  def flush(self, timeout):
+    """Waits until every queued alert has been delivered or given up on"""
+    deadline = time.monotonic() + timeout
+    with self.condition:
+      self.flushing += 1
+      self.condition.notify_all()
+      try:
+        while self.queue or self.in_flight:
+          remaining = deadline - time.monotonic()
+          if remaining <= 0:
+            return False
+          self.condition.wait(remaining)
+      finally:
+        self.flushing -= 1
+    return True
+
+  def close(self, timeout):
+    with self.condition:
+      self.closing = True
+      self.condition.notify_all()
+    self.stopped.set()
+    self.thread.join(timeout)
+    self.sink.close()
+
+
+class AlertDispatcher:
+  """
+  Fans alerts out to sinks. Each sink has its own thread, bounded queue,
+  batching, rate limit and retries, so a slow or failing sink only delays its
+  own alerts. Alerts repeated within dedup_window seconds are dropped.
+  """
+  def __init__(
+      self,
+      sinks,
+      queue_size=1000,
+      batch_size=20,
+      flush_interval=1.0,
+      rate=5.0,
+      burst=10,
+      max_retries=3,
+      retry_backoff=0.5,
+      dedup_window=300.0,
+      dedup_size=10000
+  ):
+    """
+    :param sinks: AlertSinks to deliver to
+    :param queue_size: Alerts held per sink before the oldest are dropped
+    :param batch_size: Most alerts delivered to a sink at once
+    :param flush_interval: Seconds a partial batch waits for more alerts
+    :param rate: Batches per second delivered to each sink, None for unlimited
+    :param burst: Batches a sink can receive at once after being idle
+    :param max_retries: Retries of a failed batch before it is given up on
+    :param retry_backoff: Seconds before the first retry, doubling after each one
+    :param dedup_window: Seconds an alert key is remembered for
+    :param dedup_size: Most alert keys remembered
+    """
+    if queue_size <= 0 or batch_size <= 0:
+      raise ValueError("ERROR: Alert queue and batch sizes must be positive")
+    self.dedup_window = dedup_window
+    self.dedup_size = dedup_size
+    self.recent = OrderedDict() # Alert key -> time last seen, oldest first
+    self.lock = threading.Lock()
+    self.suppressed = 0
+    self.workers = [
+      _SinkWorker(sink, queue_size, batch_size, flush_interval, rate, burst, max_retries, retry_backoff)
+      for sink in sinks
+    ]
+
+  @staticmethod
+  def alert_key(alert):
+    return (alert.get("terminal"), alert.get("type"), alert.get("start"), alert.get("closed"))
+
+  def _is_duplicate(self, key, now):
+    with self.lock:
+      # Forget keys outside the window, or the oldest ones once the cache is full
+      while self.recent:
+        oldest_key, seen = next(iter(self.recent.items()))
+        if now - seen <= self.dedup_window and len(self.recent) < self.dedup_size:
+          break
+        del self.recent[oldest_key]
+      if key in self.recent:
+        self.recent.move_to_end(key)
+        self.recent[key] = now
+        return True
+      self.recent[key] = now
+      return False
+
+  def submit(self, alert):
+    """
+    Queues an alert for every sink without blocking.
+
+    :param alert: JSON serialisable dictionary, e.g. AnomalyEvent.to_dict()
+    :return: False if the alert was a duplicate
+    """
+    if self._is_duplicate(self.alert_key(alert), time.monotonic()):
+      self.suppressed += 1
+      count("alerts.suppressed")
+      return False
+    for worker in self.workers:
+      worker.put(alert)
+    return True
+
+  def flush(self, timeout=10.0):
+    """Waits for every sink to deliver its queued alerts, returns False on timeout"""
+    deadline = time.monotonic() + timeout
+    return all([worker.flush(max(deadline - time.monotonic(), 0)) for worker in self.workers])
+
+  def close(self, timeout=10.0):
+    """Delivers the remaining alerts, then stops the sink threads"""
+    self.flush(timeout)
+    for worker in self.workers:
+      worker.close(timeout)
+
+  def stats(self):
+    return {
+      "suppressed": self.suppressed,
+      "sinks": {
+        worker.sink.name: {"sent": worker.sent, "dropped": worker.dropped, "failed": worker.failed,
+                           "queued": len(worker.queue)}
+        for worker in self.workers
+      }
+    }
+
+
+def set_dispatcher(dispatcher):
+  """Sets the dispatcher alerts are submitted to, None turns alerting off. Returns the previous dispatcher."""
+  global _dispatcher
+  previous = _dispatcher
+  _dispatcher = dispatcher
+  return previous
+
+
+def get_dispatcher():
+  return _dispatcher
+
+
+def submit_alert(alert):
+  """Submits an alert to the dispatcher, no-op when alerting is off"""
+  if _dispatcher is not None:
+    return _dispatcher.submit(alert)
+  return False
+
+
+def configure_from_env(environ=None, **dispatcher_params):
+  """
+  Turns on alerting from the ANOMALY_ALERTS environment variable, a comma
+  separated list of sinks, e.g. "file:alerts.jsonl,webhook:http://localhost:8080/alerts"
+
+  :param environ: Variables to read, os.environ by default
+  :param dispatcher_params: Keyword arguments of the AlertDispatcher, e.g. queue_size
+  :return: The dispatcher that was set, or None
+  """
+  environ = os.environ if environ is None else environ
+  specs = [spec.strip() for spec in environ.get("ANOMALY_ALERTS", "").split(",") if spec.strip()]
+  if specs:
+    set_dispatcher(AlertDispatcher([sink_from_spec(spec) for spec in specs], **dispatcher_params))
+  return _dispatcher
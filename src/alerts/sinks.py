@@ -0,0 +1,144 @@
+# Destinations alerts are delivered to, each receives batches of alert dictionaries
+import json
+import logging
+import logging.handlers
+import socket
+import threading
+import urllib.request
+
+
+class AlertSink:
+  """Delivers a batch of alerts, raising an exception if delivery failed so it can be retried"""
+  name = "sink"
+
+  def send(self, alerts):
+    raise NotImplementedError
+
+  def close(self):
+    pass
+
+
+class FileSink(AlertSink):
+  """Appends every alert to a file as a JSON line"""
+  name = "file"
+
+  def __init__(self, path):
+    self.path = path
+    self.file = open(path, "a")
+
+  def send(self, alerts):
+    self.file.write("".join(json.dumps(alert) + "\n" for alert in alerts))
+    self.file.flush()
+
+  def close(self):
+    self.file.close()
+
+
+class _RaisingSysLogHandler(logging.handlers.SysLogHandler):
+  """SysLogHandler that raises delivery errors instead of printing them, so the dispatcher retries"""
+
+  def handleError(self, record):
+    # Called from emit's except block, so this re-raises the delivery error
+    raise
+
+
+class SyslogSink(AlertSink):
+  """Sends every alert to syslog as a warning"""
+  name = "syslog"
+
+  def __init__(self, address="/dev/log", facility=logging.handlers.SysLogHandler.LOG_USER):
+    self.handler = _RaisingSysLogHandler(address=address, facility=facility)
+    self.handler.setFormatter(logging.Formatter("anomaly-detection: %(message)s"))
+
+  def send(self, alerts):
+    for alert in alerts:
+      record = logging.LogRecord("anomaly-detection", logging.WARNING, __file__, 0, json.dumps(alert), None, None)
+      self.handler.emit(record)
+
+  def close(self):
+    self.handler.close()
+
+
+class WebhookSink(AlertSink):
+  """POSTs each batch as a JSON list to an HTTP endpoint"""
+  name = "webhook"
+
+  def __init__(self, url, timeout=5.0, headers=None):
+    self.url = url
+    self.timeout = timeout
+    self.headers = {"Content-Type": "application/json"}
+    self.headers.update(headers or {})
+
+  def send(self, alerts):
+    request = urllib.request.Request(self.url, data=json.dumps(alerts).encode(), headers=self.headers, method="POST")
+    # urlopen raises HTTPError for 4xx and 5xx responses
+    with urllib.request.urlopen(request, timeout=self.timeout) as response:
+      response.read()
+
+
+class UnixSocketSink(AlertSink):
+  """Writes every alert as a JSON line to a Unix stream socket, reconnecting after failures"""
+  name = "unix"
+
+  def __init__(self, path, timeout=5.0):
+    self.path = path
+    self.timeout = timeout
+    self.socket = None
+    self.lock = threading.Lock()
+
+  def _connect(self):
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    connection.settimeout(self.timeout)
+    try:
+      connection.connect(self.path)
+    except OSError:
+      connection.close()
+      raise
+    return connection
+
+  def send(self, alerts):
+    payload = "".join(json.dumps(alert) + "\n" for alert in alerts).encode()
+    with self.lock:
+      if self.socket is None:
+        self.socket = self._connect()
+      try:
+        self.socket.sendall(payload)
+      except OSError:
+        self.socket.close()
+        self.socket = None
+        raise
+
+  def close(self):
+    with self.lock:
+      if self.socket is not None:
+        self.socket.close()
+        self.socket = None
+
+
+def sink_from_spec(spec):
+  """
+  Creates a sink from a string, e.g. "file:alerts.jsonl", "syslog", "syslog:host:514",
+  "webhook:http://localhost:8080/alerts" or "unix:/tmp/alerts.sock"
+
+  :param spec: Sink kind, optionally followed by a colon and its argument
+  :return: AlertSink
+  """
+  kind, _, argument = spec.partition(":")
+  if kind == "file":
+    return FileSink(argument or "alerts.jsonl")
+  if kind == "syslog":
+    if not argument:
+      return SyslogSink()
+    host, _, port = argument.rpartition(":")
+    if host and port.isdigit():
+      return SyslogSink(address=(host, int(port)))
+    return SyslogSink(address=argument)
+  if kind == "webhook":
+    if not argument:
+      raise ValueError("Webhook alert sink needs a URL")
+    return WebhookSink(argument)
+  if kind == "unix":
+    if not argument:
+      raise ValueError("Unix socket alert sink needs a path")
+    return UnixSocketSink(argument)
+  raise ValueError("Unknown alert sink {}".format(kind))
@@ -0,0 +1,5 @@
+from .evaluation import evaluate, flags_from_indices, label_events
+from .benchmark import run_benchmarks, benchmark_detector, prepare_datasets, DETECTORS
+
+__all__ = ['evaluate', 'flags_from_indices', 'label_events', 'run_benchmarks', 'benchmark_detector',
+           'prepare_datasets', 'DETECTORS']
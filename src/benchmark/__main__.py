@@ -0,0 +1,4 @@
+from src.benchmark.benchmark import main
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,238 @@
+# Re-scores a recorded stream offline, sharding its days across a process pool
+import argparse
+import copy
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.benchmark.benchmark import DETECTORS
+from src.benchmark.evaluation import evaluate
+from src.detector import get_detector
+from src.storage import StreamStore, load_checkpoint, record_simulation, replay
+
+# Detector copied into each pool process once, rather than pickled with every chunk
+_worker_detector = None
+
+
+def score_days(detector, store: StreamStore, days: Sequence[int], warmup_days: Sequence[int] = ()) -> Tuple[np.ndarray, np.ndarray]:
+  """
+  Pushes stored days through a detector in order, after warming it up on
+  earlier days whose verdicts are thrown away.
+
+  Args:
+      detector: Detector to run, changed in place
+      store: StreamStore holding the days
+      days: Consecutive stored days to score
+      warmup_days: Days pushed first, e.g. the days before the first one scored
+
+  Returns:
+      Tuple of (scores, flags) with a value per minute of the days, scores are NaN
+      where the detector can't score yet
+  """
+  minutes_per_day = store.minutes_per_day
+  for day in warmup_days:
+    detector.push(np.asarray(store.read_day(day)), day * minutes_per_day)
+
+  scores = np.full((len(days), minutes_per_day), np.nan)
+  flags = np.zeros((len(days), minutes_per_day), dtype=np.bool_)
+  for row, day in enumerate(days):
+    values = np.asarray(store.read_day(day))
+    start = day * minutes_per_day
+    try:
+      scores[row] = detector.score_batch(values, start)
+    except ValueError:
+      pass # Still warming up
+    offsets = np.asarray(detector.push(values, start), dtype=np.int64) - start
+    flags[row, offsets[(offsets >= 0) & (offsets < minutes_per_day)]] = True
+  return scores.ravel(), flags.ravel()
+
+
+def _init_worker(name: str, params: Dict, state: Optional[dict]) -> None:
+  global _worker_detector
+  _worker_detector = get_detector(name, **params)
+  if state is not None:
+    _worker_detector.load_state(state)
+
+
+def _score_chunk(path: str, days: List[int], warmup_days: List[int]) -> Tuple[np.ndarray, np.ndarray]:
+  # Every chunk starts from the same fitted detector, so the result doesn't depend on which process ran it
+  return score_days(copy.deepcopy(_worker_detector), StreamStore(path), days, warmup_days)
+
+
+def plan_chunks(days: Sequence[int], chunk_days: int, warmup_days: int, stored_days: Sequence[int]) -> List[Tuple[List[int], List[int]]]:
+  """
+  Splits days into chunks of consecutive days, each with the stored days
+  before it to warm a stateful detector up on.
+
+  Args:
+      days: Days to score, sorted
+      chunk_days: Days per chunk, 1 shards a stateless or per day detector by day
+      warmup_days: Days before each chunk to push first
+      stored_days: Every day in the store, warm up days can come from before the range scored
+
+  Returns:
+      List of (days, warm up days)
+  """
+  if chunk_days < 1 or warmup_days < 0:
+    raise ValueError("Chunks need at least 1 day and warm up can't be negative")
+  stored_days = sorted(stored_days)
+  chunks = []
+  for offset in range(0, len(days), chunk_days):
+    chunk = list(days[offset:offset + chunk_days])
+    earlier = [day for day in stored_days if day < chunk[0]]
+    chunks.append((chunk, earlier[-warmup_days:] if warmup_days else []))
+  return chunks
+
+
+def _save_results(path: str, results: Dict[str, np.ndarray]) -> None:
+  """Writes the columns to an .npz file next to path then moves it into place"""
+  tmp_path = path + ".tmp"
+  with open(tmp_path, "wb") as file:
+    np.savez(file, **results)
+  os.replace(tmp_path, path)
+
+
+def backfill(
+    dataset: str,
+    output: str,
+    detector: str,
+    params: Optional[Dict] = None,
+    start_day: Optional[int] = None,
+    days: Optional[int] = None,
+    training: Optional[str] = None,
+    checkpoint: Optional[str] = None,
+    chunk_days: int = 30,
+    warmup_days: int = 7,
+    workers: Optional[int] = None,
+    seed: Optional[int] = None
+) -> Dict:
+  """
+  Scores a range of a recorded stream with a detector, in chunks of days
+  spread over a process pool. Each chunk starts from the same fitted detector
+  and is first warmed up on the days before it, so a stateful detector like
+  the EMA detector gives close to the flags of one pass over the whole range,
+  while a detector that only needs its fit can use 1 day chunks without warm up.
+
+  Args:
+      dataset: StreamStore path, the simulation of days from start_day is recorded to it first if it's empty
+      output: .npz file the minutes, scores, flags and any labels are written to as columns
+      detector: Registered detector name, see DETECTORS
+      params: Keyword arguments of the detector, defaults to its own defaults
+      start_day: First day to score, defaults to the first stored day
+      days: Days to score, defaults to every stored day from start_day
+      training: Recorded nominal dataset to fit the detector on before scoring
+      checkpoint: Checkpoint file whose detector state to start from instead, e.g. a model fitted live
+      chunk_days: Days scored in order by one process
+      warmup_days: Days pushed before each chunk without keeping their verdicts
+      workers: Processes in the pool, one per core if not given, 1 scores in this process
+      seed: Seed of the simulation when one is recorded
+
+  Returns:
+      Dictionary of the run's size, speed, flag count and accuracy if the dataset is labelled
+  """
+  store = StreamStore(dataset)
+  if not store.days:
+    if days is None:
+      raise ValueError("ERROR: {} has no recording, give the days to simulate".format(dataset))
+    store = record_simulation(dataset, start_day or 0, days, seed)
+
+  selected = [day for day in store.days if (start_day is None or day >= start_day)]
+  if days is not None:
+    selected = [day for day in selected if day < selected[0] + days] if selected else []
+  if not selected:
+    raise ValueError("ERROR: No stored days to score in {}".format(dataset))
+  if selected != list(range(selected[0], selected[-1] + 1)):
+    raise ValueError("ERROR: Days {} to {} aren't all stored".format(selected[0], selected[-1]))
+
+  template = get_detector(detector, **(params or {}))
+  if checkpoint is not None:
+    state = load_checkpoint(checkpoint)
+    if state is None:
+      raise ValueError("ERROR: No checkpoint at {}".format(checkpoint))
+    if state["detector_name"] != getattr(template, "name", type(template).__name__):
+      raise ValueError("ERROR: Checkpoint {} is for {} from day {}".format(
+        checkpoint, state["detector_name"], state["start_day"]))
+    template.load_state(state["detector"])
+  elif training is not None:
+    template.fit(np.concatenate(list(replay(training))))
+
+  chunks = plan_chunks(selected, chunk_days, warmup_days, store.days)
+  workers = workers or os.cpu_count() or 1
+  start = time.perf_counter()
+  if workers == 1:
+    results = [score_days(copy.deepcopy(template), store, chunk, warmup) for chunk, warmup in chunks]
+  else:
+    with ProcessPoolExecutor(
+        max_workers=min(workers, len(chunks)),
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(detector, params or {}, template.state())
+    ) as pool:
+      futures = [pool.submit(_score_chunk, store.path, chunk, warmup) for chunk, warmup in chunks]
+      results = [future.result() for future in futures]
+  elapsed = time.perf_counter() - start
+
+  minutes_per_day = store.minutes_per_day
+  columns = {
+    "minutes": np.arange(selected[0] * minutes_per_day, (selected[-1] + 1) * minutes_per_day, dtype=np.int64),
+    "scores": np.concatenate([scores for scores, _ in results]),
+    "flags": np.concatenate([flags for _, flags in results])
+  }
+  labelled = all("labels" in store.columns(day) for day in selected)
+  if labelled:
+    columns["labels"] = store.read_range(columns["minutes"][0], columns["minutes"][-1] + 1, "labels")
+  _save_results(output, columns)
+
+  return {
+    "detector": detector,
+    "output": output,
+    "days": len(selected),
+    "points": len(columns["minutes"]),
+    "chunks": len(chunks),
+    "workers": workers,
+    "seconds": elapsed,
+    "points_per_second": len(columns["minutes"]) / elapsed if elapsed else None,
+    "flagged": int(np.count_nonzero(columns["flags"])),
+    "accuracy": evaluate(columns["flags"], columns["labels"]) if labelled else None
+  }
+
+
+def load_results(path: str) -> Dict[str, np.ndarray]:
+  """Reads the columns written by backfill"""
+  with np.load(path) as results:
+    return {column: results[column] for column in results.files}
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description="Score a recorded or simulated range of days offline with a detector")
+  parser.add_argument("dataset", help="StreamStore directory, recorded from the simulation first if empty")
+  parser.add_argument("--detector", choices=list(DETECTORS), default="EMA_detector", help="Detector to score with")
+  parser.add_argument("--params", type=json.loads, default=None, help="Detector parameters as a JSON object")
+  parser.add_argument("--start-day", type=int, default=None, help="First day to score")
+  parser.add_argument("--days", type=int, default=None, help="Days to score, every stored day if not given")
+  parser.add_argument("--training", default=None, help="Recorded nominal dataset to fit the detector on")
+  parser.add_argument("--checkpoint", default=None, help="Checkpoint file with a fitted detector to start from")
+  parser.add_argument("--chunk-days", type=int, default=30, help="Days each process scores in order")
+  parser.add_argument("--warmup-days", type=int, default=7, help="Days pushed before each chunk to warm it up")
+  parser.add_argument("--workers", type=int, default=None, help="Processes to use, one per core by default")
+  parser.add_argument("--seed", type=int, default=None, help="Seed of the simulation if one is recorded")
+  parser.add_argument("--output", default="backfill.npz", help="Columnar .npz file to write results to")
+  args = parser.parse_args(argv)
+
+  summary = backfill(
+    args.dataset, args.output, args.detector, args.params, args.start_day, args.days, args.training,
+    args.checkpoint, args.chunk_days, args.warmup_days, args.workers, args.seed
+  )
+  print("Scored {} days in {:.1f}s with {} workers, {} minutes flagged".format(
+    summary["days"], summary["seconds"], summary["workers"], summary["flagged"]))
+  print("Results written to {}".format(args.output))
+  return summary
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,211 @@
+# Runs each detector on fixed seeded datasets and records throughput, latency, memory and accuracy
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+import numpy as np
+
+try:
+  import resource
+except ImportError:  # Not available on Windows
+  resource = None
+
+from src.benchmark.evaluation import evaluate, flags_from_indices
+from src.detector import available_detectors, get_detector
+from src.storage import StreamStore, record_simulation, replay
+
+DEFAULT_DATA_DIR = os.path.join(tempfile.gettempdir(), "anomaly_detection_benchmarks")
+# Far more anomalies than the live simulation so every type is represented in a month of data
+BENCHMARK_ANOMALY_THRESHOLD = 0.3
+
+
+# Every registered detector can be benchmarked
+DETECTORS = available_detectors()
+
+
+def prepare_datasets(
+    data_dir: str = DEFAULT_DATA_DIR,
+    seed: int = 0,
+    duration: int = 30,
+    training_duration: int = 7,
+    anomaly_threshold: float = BENCHMARK_ANOMALY_THRESHOLD
+):
+  """
+  Records the seeded evaluation and training datasets, reusing earlier recordings.
+
+  Args:
+      data_dir: Directory the datasets are cached in
+      seed: Seed of the evaluation dataset, the training dataset uses seed + 1
+      duration: Days in the evaluation dataset
+      training_duration: Days in the training dataset
+      anomaly_threshold: Daily chance of an anomaly in the evaluation dataset, training data has none
+
+  Returns:
+      Tuple of (dataset path, training path)
+  """
+  paths = []
+  datasets = (("eval", seed, duration, anomaly_threshold), ("train", seed + 1, training_duration, 0))
+  for name, dataset_seed, days, threshold in datasets:
+    path = os.path.join(data_dir, "{}_seed{}_days{}_rate{}".format(name, dataset_seed, days, threshold))
+    if not os.path.exists(path) or len(StreamStore(path).days) != days:
+      # Re-record from scratch if an earlier recording was interrupted
+      if os.path.exists(path):
+        for root, _, files in os.walk(path, topdown=False):
+          for file in files:
+            os.remove(os.path.join(root, file))
+          os.rmdir(root)
+      record_simulation(path, duration=days, seed=dataset_seed, anomaly_threshold=threshold)
+    paths.append(path)
+  return tuple(paths)
+
+
+def _peak_rss_mb() -> Optional[float]:
+  if resource is None:
+    return None
+  peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  # Linux reports kilobytes, macOS reports bytes
+  return peak / (1024 * 1024) if platform.system() == "Darwin" else peak / 1024
+
+
+def benchmark_detector(name: str, dataset: str, training: str, duration: int, params: Optional[Dict] = None) -> Dict:
+  """
+  Fits a single detector on the training dataset, then pushes the evaluation dataset through it a day at a time.
+
+  Args:
+      name: Registered detector name, see DETECTORS
+      dataset: Path of the recorded evaluation dataset
+      training: Path of the recorded training dataset
+      duration: Number of days to run for
+      params: Keyword arguments of the detector, defaults to its own defaults
+
+  Returns:
+      Dictionary of benchmark results, JSON serialisable
+  """
+  detector = get_detector(name, **(params or {}))
+  store = StreamStore(dataset)
+  minutes_per_day = store.minutes_per_day
+
+  training_values = np.concatenate(list(replay(training)))
+  start = time.perf_counter()
+  detector.fit(training_values)
+  retrain_seconds = time.perf_counter() - start
+
+  flags = []
+  latencies = []
+  start = time.perf_counter()
+  previous = start
+  for day, values in enumerate(replay(dataset, duration=duration)):
+    anomalies = detector.push(values, day * minutes_per_day)
+    now = time.perf_counter()
+    latencies.append(now - previous)
+    previous = now
+    flags.append(flags_from_indices([minute - day * minutes_per_day for minute in anomalies], minutes_per_day))
+  elapsed = previous - start
+
+  first_day = store.days[0]
+  labels = store.read_range(
+    first_day * store.minutes_per_day,
+    (first_day + len(flags)) * store.minutes_per_day,
+    "labels"
+  )
+  points = len(flags) * store.minutes_per_day
+
+  return {
+    "days": len(flags),
+    "points": points,
+    "seconds": elapsed,
+    "points_per_second": points / elapsed if elapsed else None,
+    "day_latency": {
+      "mean": float(np.mean(latencies)),
+      "p50": float(np.percentile(latencies, 50)),
+      "p95": float(np.percentile(latencies, 95)),
+      "max": float(np.max(latencies))
+    },
+    "retrain_seconds": retrain_seconds,
+    "peak_rss_mb": _peak_rss_mb(),
+    "accuracy": evaluate(np.concatenate(flags), labels)
+  }
+
+
+def _git_commit() -> Optional[str]:
+  try:
+    result = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    return result.stdout.strip()
+  except (OSError, subprocess.CalledProcessError):
+    return None
+
+
+def run_benchmarks(
+    detectors: Optional[List[str]] = None,
+    duration: int = 30,
+    training_duration: int = 7,
+    seed: int = 0,
+    data_dir: str = DEFAULT_DATA_DIR,
+    isolate: bool = True
+) -> Dict:
+  """
+  Benchmarks each detector on the same seeded datasets.
+
+  Args:
+      detectors: Names of detectors to run, defaults to all of them
+      duration: Days in the evaluation dataset
+      training_duration: Days in the training dataset
+      seed: Dataset seed
+      data_dir: Directory the datasets are cached in
+      isolate: Run each detector in a fresh process so peak RSS is per detector
+
+  Returns:
+      Dictionary of results for every detector
+  """
+  detectors = detectors or list(DETECTORS)
+  for name in detectors:
+    if name not in DETECTORS:
+      raise ValueError("Unknown detector {}, expected one of {}".format(name, list(DETECTORS)))
+
+  dataset, training = prepare_datasets(data_dir, seed, duration, training_duration)
+  results = {
+    "commit": _git_commit(),
+    "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    "dataset": {"seed": seed, "days": duration, "training_days": training_duration},
+    "detectors": {}
+  }
+
+  for name in detectors:
+    print("Benchmarking {}".format(name))
+    if isolate:
+      with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+        results["detectors"][name] = pool.submit(benchmark_detector, name, dataset, training, duration).result()
+    else:
+      results["detectors"][name] = benchmark_detector(name, dataset, training, duration)
+
+  return results
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description="Benchmark the anomaly detectors on seeded labelled datasets")
+  parser.add_argument("--detectors", nargs="+", choices=list(DETECTORS), help="Detectors to run, defaults to all")
+  parser.add_argument("--days", type=int, default=30, help="Days in the evaluation dataset")
+  parser.add_argument("--training-days", type=int, default=7, help="Days in the training dataset")
+  parser.add_argument("--seed", type=int, default=0, help="Dataset seed")
+  parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR, help="Directory the datasets are cached in")
+  parser.add_argument("--output", default="benchmark_results.json", help="JSON file to write results to")
+  parser.add_argument("--no-isolate", action="store_true", help="Run every detector in this process")
+  args = parser.parse_args(argv)
+
+  results = run_benchmarks(args.detectors, args.days, args.training_days, args.seed, args.data_dir, not args.no_isolate)
+  with open(args.output, "w") as file:
+    json.dump(results, file, indent=2)
+  print("Results written to {}".format(args.output))
+  return results
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,112 @@
+# Accuracy of detector flags against the injected anomaly labels
+import numpy as np
+from typing import Dict, List, Optional, Sequence
+
+from src.simulator import ANOMALY_TYPES
+
+
+def flags_from_indices(indices: Sequence[int], length: int = 1440) -> np.ndarray:
+  """Converts a list of anomalous minute indices into a boolean flag per minute."""
+  flags = np.zeros(length, dtype=bool)
+  indices = np.asarray(indices, dtype=int)
+  flags[indices[(indices >= 0) & (indices < length)]] = True
+  return flags
+
+
+def _f1(precision: float, recall: float) -> float:
+  if precision + recall == 0:
+    return 0.0
+  return 2 * precision * recall / (precision + recall)
+
+
+def _ratio(numerator: int, denominator: int) -> Optional[float]:
+  return numerator / denominator if denominator else None
+
+
+def label_events(labels: np.ndarray) -> List[Dict]:
+  """
+  Splits labels into runs of the same anomaly type.
+
+  Args:
+      labels: Label per minute, 0 for normal
+
+  Returns:
+      List of {"type", "start", "end"} dicts, end is exclusive
+  """
+  labels = np.asarray(labels)
+  if len(labels) == 0:
+    return []
+  boundaries = np.flatnonzero(np.diff(labels)) + 1
+  starts = np.concatenate(([0], boundaries))
+  ends = np.concatenate((boundaries, [len(labels)]))
+  return [
+    {"type": int(labels[start]), "start": int(start), "end": int(end)}
+    for start, end in zip(starts, ends)
+    if labels[start] != 0
+  ]
+
+
+def evaluate(flags: np.ndarray, labels: np.ndarray) -> Dict:
+  """
+  Minute level precision, recall and F1 overall and per anomaly type, with the
+  delay between the start of each injected anomaly and its first flagged minute.
+
+  Per type precision counts flags on that type's minutes as true positives and
+  flags on normal minutes as false positives, ignoring other anomaly types.
+
+  Args:
+      flags: Boolean detector verdict per minute
+      labels: Ground truth label per minute (0 normal, ANOMALY_TYPES index + 1)
+
+  Returns:
+      Dictionary of accuracy metrics, JSON serialisable
+  """
+  flags = np.asarray(flags, dtype=bool)
+  labels = np.asarray(labels)
+  if flags.shape != labels.shape:
+    raise ValueError("Flags and labels must be the same length")
+
+  anomalous = labels > 0
+  false_positives = int(np.sum(flags & ~anomalous))
+  true_positives = int(np.sum(flags & anomalous))
+  precision = _ratio(true_positives, true_positives + false_positives)
+  recall = _ratio(true_positives, int(anomalous.sum()))
+
+  results = {
+    "overall": {
+      "precision": precision,
+      "recall": recall,
+      "f1": _f1(precision or 0.0, recall or 0.0),
+      "flagged": int(flags.sum()),
+      "anomalous": int(anomalous.sum()),
+      "false_positives": false_positives
+    },
+    "types": {}
+  }
+
+  events = label_events(labels)
+  for code, name in enumerate(ANOMALY_TYPES, 1):
+    in_type = labels == code
+    type_positives = int(np.sum(flags & in_type))
+    type_precision = _ratio(type_positives, type_positives + false_positives)
+    type_recall = _ratio(type_positives, int(in_type.sum()))
+
+    delays = []
+    type_events = [event for event in events if event["type"] == code]
+    for event in type_events:
+      hits = np.flatnonzero(flags[event["start"]:event["end"]])
+      if len(hits):
+        delays.append(int(hits[0]))
+
+    results["types"][name] = {
+      "precision": type_precision,
+      "recall": type_recall,
+      "f1": _f1(type_precision or 0.0, type_recall or 0.0),
+      "minutes": int(in_type.sum()),
+      "events": len(type_events),
+      "events_detected": len(delays),
+      "mean_detection_delay": float(np.mean(delays)) if delays else None,
+      "max_detection_delay": max(delays) if delays else None
+    }
+
+  return results
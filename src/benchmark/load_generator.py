@@ -0,0 +1,293 @@
+# Emits many simulated streams at a target aggregate rate, to find the rate each detector saturates at
+import argparse
+import copy
+import json
+import multiprocessing
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from src.benchmark.benchmark import DETECTORS, _git_commit
+from src.detector import get_detector
+from src.simulator.anomalies import ANOMALY_THRESHOLD, SimulationState, inject_day_anomalies
+from src.simulator.simulator import MINUTES_PER_DAY, expected_flow_surface, generate_days, setup
+
+SATURATION_FRACTION = 0.95 # Share of the target rate a paced run must achieve to be keeping up
+DEFAULT_MAX_LATENCY = 1.0 # p99 latency in seconds above which a paced run is saturated
+
+
+class LoadStream:
+  """
+  One simulated stream, generated a day at a time with generate_days and the
+  simulator's anomaly injection, then handed out in chunks.
+  """
+  def __init__(
+      self,
+      seed: int,
+      start_day: int = 0,
+      anomaly_threshold: float = ANOMALY_THRESHOLD,
+      surface: Optional[np.ndarray] = None
+  ):
+    """
+    Args:
+        seed: Seed of the stream's values and anomalies
+        start_day: Day of the year the stream starts on
+        anomaly_threshold: Daily chance of an anomaly starting
+        surface: expected_flow_surface of the baseline, shared between streams
+    """
+    self.rng = np.random.default_rng(seed)
+    self.random = random.Random(seed)
+    self.state = SimulationState()
+    self.start_day = start_day
+    self.anomaly_threshold = anomaly_threshold
+    self.surface = expected_flow_surface(setup()) if surface is None else surface
+    self.values = np.empty(0)
+    self.labels = np.empty(0, dtype=np.int8)
+    self.offset = 0 # Position of the next chunk in the current day
+
+  def next_chunk(self, size: int):
+    """
+    Args:
+        size: Values in the chunk, a divisor of a day so chunks don't span days
+
+    Returns:
+        Tuple of (values, labels, minute of values[0] counted from the start of the stream)
+    """
+    if self.offset == len(self.values):
+      values = generate_days([self.start_day + self.state.day], self.rng, self.surface)[0]
+      self.values, self.labels = inject_day_anomalies(values, self.state, self.anomaly_threshold, self.random)
+      self.state.day += 1
+      self.offset = 0
+    start = self.offset
+    self.offset += size
+    minute = (self.state.day - 1) * MINUTES_PER_DAY + start
+    return self.values[start:self.offset], self.labels[start:self.offset], minute
+
+
+def _stream_seeds(seed: int, streams: int) -> List[int]:
+  return [int(child.generate_state(1)[0]) for child in np.random.SeedSequence(seed).spawn(streams)]
+
+
+def _run_streams(
+    name: str,
+    params: Dict,
+    seeds: Sequence[int],
+    rate: Optional[float],
+    seconds: float,
+    chunk: int,
+    training_days: int,
+    anomaly_threshold: float,
+    start_day: int
+) -> Dict:
+  """
+  Runs a share of the streams in this process, each with its own copy of a
+  detector fitted on nominal days. Chunks go round the streams in turn, each
+  emitted at its scheduled time when paced. Latency is from that scheduled
+  time, not from when the chunk was actually pushed, so a detector falling
+  behind shows up as growing latency rather than as a slower schedule.
+  """
+  surface = expected_flow_surface(setup())
+  template = get_detector(name, **params)
+  if training_days:
+    days = range(start_day - training_days, start_day)
+    template.fit(generate_days(days, np.random.default_rng(seeds[0]), surface).ravel())
+  streams = [LoadStream(seed, start_day, anomaly_threshold, surface) for seed in seeds]
+  detectors = [copy.deepcopy(template) for _ in seeds]
+
+  interval = chunk / rate if rate else 0.0
+  latencies = []
+  points = flagged = anomalous = 0
+  start = time.perf_counter()
+  deadline = start + seconds
+  emitted = verdict = start
+  sent = 0
+  while True:
+    index = sent % len(streams)
+    values, labels, minute = streams[index].next_chunk(chunk)
+    now = time.perf_counter()
+    if rate:
+      emitted = start + sent * interval
+      if emitted >= deadline or now >= deadline:
+        break
+      if emitted > now:
+        time.sleep(emitted - now)
+    else:
+      if now >= deadline:
+        break
+      emitted = now
+    anomalies = detectors[index].push(values, minute)
+    verdict = time.perf_counter()
+
+    latencies.append(verdict - emitted)
+    points += len(values)
+    flagged += len(anomalies)
+    anomalous += int(np.count_nonzero(labels))
+    sent += 1
+
+  return {
+    "points": points,
+    "seconds": verdict - start,
+    # How far the last chunk pushed was behind its schedule
+    "lag_seconds": max(0.0, time.perf_counter() - emitted) if rate else 0.0,
+    "flagged": flagged,
+    "anomalous": anomalous,
+    "latencies": np.asarray(latencies)
+  }
+
+
+def run_load(
+    detector: str,
+    streams: int = 10,
+    rate: Optional[float] = None,
+    seconds: float = 10.0,
+    chunk: int = 60,
+    workers: int = 1,
+    params: Optional[Dict] = None,
+    training_days: int = 1,
+    seed: int = 0,
+    anomaly_threshold: float = ANOMALY_THRESHOLD,
+    start_day: int = 0,
+    max_latency: float = DEFAULT_MAX_LATENCY
+) -> Dict:
+  """
+  Emits streams concurrent streams through a detector for a number of
+  seconds, recording the latency from each chunk's emission to the
+  detector's verdict on it.
+
+  Args:
+      detector: Registered detector name, see DETECTORS
+      streams: Number of streams, each with its own detector
+      rate: Aggregate points per second across the streams, paced to wall clock time, or as fast as possible if None
+      seconds: Wall clock seconds to run for
+      chunk: Points pushed at once per stream, a divisor of 1440
+      workers: Processes the streams are split between, each with its share of the rate
+      params: Keyword arguments of the detector, defaults to its own defaults
+      training_days: Nominal days every stream's detector is fitted on before the run
+      seed: Seed of the streams
+      anomaly_threshold: Daily chance of an anomaly starting in each stream
+      start_day: Day of the year the streams start on
+      max_latency: p99 latency in seconds above which a paced run is saturated
+
+  Returns:
+      Dictionary of results, JSON serialisable
+  """
+  if chunk < 1 or MINUTES_PER_DAY % chunk:
+    raise ValueError("The chunk size must divide a day of {} minutes".format(MINUTES_PER_DAY))
+  if workers < 1 or streams < workers:
+    raise ValueError("Need at least one stream per worker")
+  if rate is not None and rate <= 0:
+    raise ValueError("The rate must be positive")
+
+  seeds = _stream_seeds(seed, streams)
+  shards = [seeds[worker::workers] for worker in range(workers)]
+  jobs = [(
+    detector, params or {}, shard, rate * len(shard) / streams if rate else None, seconds, chunk,
+    training_days, anomaly_threshold, start_day
+  ) for shard in shards]
+  if workers == 1:
+    results = [_run_streams(*jobs[0])]
+  else:
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+      results = [future.result() for future in [pool.submit(_run_streams, *job) for job in jobs]]
+
+  latencies = np.concatenate([result["latencies"] for result in results])
+  points = sum(result["points"] for result in results)
+  elapsed = max(result["seconds"] for result in results)
+  achieved = points / elapsed if elapsed else None
+  summary = {
+    "detector": detector,
+    "streams": streams,
+    "workers": workers,
+    "chunk": chunk,
+    "paced": rate is not None,
+    "target_points_per_second": rate,
+    "points": points,
+    "seconds": elapsed,
+    "points_per_second": achieved,
+    "lag_seconds": max(result["lag_seconds"] for result in results),
+    "latency": {
+      "mean": float(np.mean(latencies)) if len(latencies) else None,
+      "p50": float(np.percentile(latencies, 50)) if len(latencies) else None,
+      "p95": float(np.percentile(latencies, 95)) if len(latencies) else None,
+      "p99": float(np.percentile(latencies, 99)) if len(latencies) else None,
+      "max": float(np.max(latencies)) if len(latencies) else None
+    },
+    "flagged": sum(result["flagged"] for result in results),
+    "anomalous": sum(result["anomalous"] for result in results)
+  }
+  if rate is not None:
+    summary["saturated"] = (
+      achieved is None or achieved < SATURATION_FRACTION * rate
+      or summary["latency"]["p99"] is None or summary["latency"]["p99"] > max_latency
+    )
+  return summary
+
+
+def find_saturation(detector: str, rates: Sequence[float], **params) -> Dict:
+  """
+  Runs paced loads at increasing rates until the detector can't keep up.
+
+  Args:
+      detector: Registered detector name
+      rates: Aggregate points per second to try
+      params: Keyword arguments of run_load
+
+  Returns:
+      Dictionary of each run and the highest rate the detector kept up with, None if it kept up with none
+  """
+  runs = []
+  saturation_rate = None
+  for rate in sorted(rates):
+    print("Loading {} at {:g} points/s".format(detector, rate))
+    result = run_load(detector, rate=rate, **params)
+    runs.append(result)
+    if result["saturated"]:
+      break
+    saturation_rate = rate
+  return {"detector": detector, "saturation_rate": saturation_rate, "runs": runs}
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description="Stress test a detector with many simulated streams at a target rate")
+  parser.add_argument("--detector", choices=list(DETECTORS), default="EMA_detector", help="Detector to load")
+  parser.add_argument("--streams", type=int, default=10, help="Concurrent streams, each with its own detector")
+  parser.add_argument("--rates", type=float, nargs="+",
+                      help="Aggregate points per second to try in turn, unpaced if not given")
+  parser.add_argument("--seconds", type=float, default=10.0, help="Seconds to run each rate for")
+  parser.add_argument("--chunk", type=int, default=60, help="Points pushed at once per stream")
+  parser.add_argument("--workers", type=int, default=1, help="Processes to split the streams between")
+  parser.add_argument("--training-days", type=int, default=1, help="Nominal days each detector is fitted on")
+  parser.add_argument("--seed", type=int, default=0, help="Seed of the streams")
+  parser.add_argument("--max-latency", type=float, default=DEFAULT_MAX_LATENCY,
+                      help="p99 latency in seconds above which a rate is saturated")
+  parser.add_argument("--output", default="load_results.json", help="JSON file to write results to")
+  args = parser.parse_args(argv)
+
+  load = {
+    "streams": args.streams,
+    "seconds": args.seconds,
+    "chunk": args.chunk,
+    "workers": args.workers,
+    "training_days": args.training_days,
+    "seed": args.seed
+  }
+  if args.rates:
+    results = find_saturation(args.detector, args.rates, max_latency=args.max_latency, **load)
+  else:
+    results = {"detector": args.detector, "runs": [run_load(args.detector, **load)]}
+  results["commit"] = _git_commit()
+  results["timestamp"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+
+  with open(args.output, "w") as file:
+    json.dump(results, file, indent=2)
+  for run in results["runs"]:
+    print("{:.0f} points/s, p99 latency {:.4f}s".format(run["points_per_second"] or 0, run["latency"]["p99"] or 0))
+  print("Results written to {}".format(args.output))
+  return results
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,247 @@
+# Searches detector parameters in parallel on cached datasets, reporting the accuracy/throughput Pareto front
+import argparse
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+from src.benchmark.benchmark import DEFAULT_DATA_DIR, DETECTORS, _git_commit, benchmark_detector, prepare_datasets
+
+# Parameters searched by default, around each detector's hand picked defaults. A list is a set of
+# choices, a {"low", "high", "log"} range is sampled by random search only, as an integer if both ends are.
+SEARCH_SPACES = {
+  "EMA_detector": {
+    "threshold_std": [4.0, 6.0, 8.0, 10.0, 12.0],
+    "pattern_update_alpha": [0.01, 0.05, 0.1],
+    "seasonal_update_alpha": [0.005, 0.01, 0.05]
+  },
+  "IF3": {
+    "n_estimators": [50, 100, 200],
+    "contamination": [0.005, 500 / (1440 * 7), 0.1]
+  },
+  "IF_detector2": {
+    "n_estimators": [50, 100, 200],
+    "contamination": [0.001, 0.005, 0.02]
+  },
+  "IF_detector": {
+    "threshold": [0.7, 0.8, 0.9, 0.95],
+    "n_trees": [50, 100, 200]
+  },
+  "change_point": {
+    "threshold": [10.0, 20.0, 30.0, 50.0],
+    "slack": [1.0, 2.0, 3.0]
+  }
+}
+
+
+def grid(space: Dict) -> List[Dict]:
+  """
+  Every combination of the choices in a search space.
+
+  Args:
+      space: Dictionary of parameter names to lists of values
+
+  Returns:
+      List of parameter dictionaries
+  """
+  ranges = [name for name, values in space.items() if not isinstance(values, list)]
+  if ranges:
+    raise ValueError("A grid needs a list of values for {}, ranges need random search".format(ranges))
+  names = list(space)
+  return [dict(zip(names, values)) for values in itertools.product(*(space[name] for name in names))]
+
+
+def _sample(values, rng: random.Random):
+  if isinstance(values, list):
+    return rng.choice(values)
+  low, high = values["low"], values["high"]
+  if isinstance(low, int) and isinstance(high, int):
+    return rng.randint(low, high)
+  if values.get("log"):
+    return float(10 ** rng.uniform(math.log10(low), math.log10(high)))
+  return rng.uniform(low, high)
+
+
+def random_search(space: Dict, trials: int, seed: int = 0) -> List[Dict]:
+  """
+  Parameters drawn at random from a search space, without repeats.
+
+  Args:
+      space: Dictionary of parameter names to lists of values or {"low", "high", "log"} ranges
+      trials: Most parameter sets to draw, fewer if the space has fewer combinations
+      seed: Seed of the draws
+
+  Returns:
+      List of parameter dictionaries
+  """
+  rng = random.Random(seed)
+  drawn = []
+  for _ in range(trials * 10):
+    params = {name: _sample(values, rng) for name, values in space.items()}
+    if params not in drawn:
+      drawn.append(params)
+      if len(drawn) == trials:
+        break
+  return drawn
+
+
+def pareto_front(trials: List[Dict], accuracy: str = "f1") -> List[Dict]:
+  """
+  Trials that no other trial beats on both accuracy and throughput.
+
+  Args:
+      trials: Results of run_sweep's trials
+      accuracy: Overall accuracy metric to maximise, e.g. "f1", "precision" or "recall"
+
+  Returns:
+      The front, most accurate first
+  """
+  scored = [trial for trial in trials if trial.get(accuracy) is not None and trial.get("points_per_second")]
+  front = [
+    trial for trial in scored
+    if not any(
+      other[accuracy] >= trial[accuracy] and other["points_per_second"] >= trial["points_per_second"]
+      and (other[accuracy] > trial[accuracy] or other["points_per_second"] > trial["points_per_second"])
+      for other in scored
+    )
+  ]
+  return sorted(front, key=lambda trial: (-trial[accuracy], -trial["points_per_second"]))
+
+
+def _run_trial(name: str, dataset: str, training: str, duration: int, params: Dict, workers: int) -> Dict:
+  # Trials running at once share the machine, so throughputs are only comparable at the same worker count
+  trial = {"params": params, "workers": workers}
+  try:
+    result = benchmark_detector(name, dataset, training, duration, params)
+  except (ValueError, ArithmeticError) as error:
+    # A parameter set the detector rejects or can't run with is recorded rather than ending the sweep
+    trial["error"] = "{}: {}".format(type(error).__name__, error)
+    return trial
+  overall = result["accuracy"]["overall"]
+  trial.update({
+    "f1": overall["f1"],
+    "precision": overall["precision"],
+    "recall": overall["recall"],
+    "points_per_second": result["points_per_second"],
+    "retrain_seconds": result["retrain_seconds"],
+    "p95_day_latency": result["day_latency"]["p95"],
+    "recall_by_type": {anomaly: stats["recall"] for anomaly, stats in result["accuracy"]["types"].items()}
+  })
+  return trial
+
+
+def run_sweep(
+    detector: str,
+    space: Optional[Dict] = None,
+    search: str = "grid",
+    trials: int = 20,
+    duration: int = 30,
+    training_duration: int = 7,
+    seed: int = 0,
+    data_dir: str = DEFAULT_DATA_DIR,
+    workers: Optional[int] = None,
+    accuracy: str = "f1"
+) -> Dict:
+  """
+  Benchmarks a detector with every parameter set of a search on the same
+  seeded datasets. They're recorded once and cached in data_dir, so each
+  trial only replays them from disk.
+
+  Trials running at once compete for memory bandwidth, caches and any shared
+  cores, which lowers the points per second they measure. Half the cores are
+  used by default to keep that small, and each trial records the worker count
+  it ran with. Give workers=1 for throughputs comparable with run_benchmarks.
+
+  Args:
+      detector: Registered detector name, see DETECTORS
+      space: Search space, SEARCH_SPACES[detector] if not given
+      search: "grid" for every combination or "random" for trials random draws
+      trials: Parameter sets drawn by random search
+      duration: Days in the evaluation dataset
+      training_duration: Days in the training dataset
+      seed: Seed of the datasets and the random search
+      data_dir: Directory the datasets are cached in
+      workers: Processes trials run in at once, half the cores if not given, 1 runs them in this process
+      accuracy: Overall accuracy metric the front maximises
+
+  Returns:
+      Dictionary of every trial and the Pareto front of accuracy against points per second
+  """
+  if space is None:
+    if detector not in SEARCH_SPACES:
+      raise ValueError("No default search space for {}, give one".format(detector))
+    space = SEARCH_SPACES[detector]
+  if search == "grid":
+    candidates = grid(space)
+  elif search == "random":
+    candidates = random_search(space, trials, seed)
+  else:
+    raise ValueError("Unknown search {}, expected grid or random".format(search))
+
+  dataset, training = prepare_datasets(data_dir, seed, duration, training_duration)
+  workers = workers or max(1, (os.cpu_count() or 1) // 2)
+  start = time.perf_counter()
+  if workers == 1:
+    results = [_run_trial(detector, dataset, training, duration, params, workers) for params in candidates]
+  else:
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+      futures = [pool.submit(_run_trial, detector, dataset, training, duration, params, workers) for params in candidates]
+      results = [future.result() for future in futures]
+
+  return {
+    "detector": detector,
+    "search": search,
+    "space": space,
+    "workers": workers,
+    "seconds": time.perf_counter() - start,
+    "trials": results,
+    "front": pareto_front(results, accuracy)
+  }
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description="Search detector parameters on seeded labelled datasets")
+  parser.add_argument("--detectors", nargs="+", choices=list(DETECTORS), default=list(SEARCH_SPACES),
+                      help="Detectors to tune, defaults to those with a default search space")
+  parser.add_argument("--space", type=json.loads, default=None,
+                      help="Search space as a JSON object, the detector's default if not given")
+  parser.add_argument("--search", choices=["grid", "random"], default="grid", help="Search method")
+  parser.add_argument("--trials", type=int, default=20, help="Parameter sets drawn by random search")
+  parser.add_argument("--days", type=int, default=30, help="Days in the evaluation dataset")
+  parser.add_argument("--training-days", type=int, default=7, help="Days in the training dataset")
+  parser.add_argument("--seed", type=int, default=0, help="Dataset and search seed")
+  parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR, help="Directory the datasets are cached in")
+  parser.add_argument("--workers", type=int, default=None, help="Trials run at once, half the cores by default, 1 for uncontended throughputs")
+  parser.add_argument("--accuracy", choices=["f1", "precision", "recall"], default="f1",
+                      help="Accuracy metric of the Pareto front")
+  parser.add_argument("--output", default="sweep_results.json", help="JSON file to write results to")
+  args = parser.parse_args(argv)
+
+  results = {
+    "commit": _git_commit(),
+    "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    "dataset": {"seed": args.seed, "days": args.days, "training_days": args.training_days},
+    "detectors": {}
+  }
+  for name in args.detectors:
+    print("Sweeping {}".format(name))
+    sweep = run_sweep(name, args.space, args.search, args.trials, args.days, args.training_days, args.seed,
+                      args.data_dir, args.workers, args.accuracy)
+    results["detectors"][name] = sweep
+    for trial in sweep["front"]:
+      print("  {} {:.3f}, {:.0f} points/s: {}".format(args.accuracy, trial[args.accuracy],
+                                                       trial["points_per_second"], trial["params"]))
+
+  with open(args.output, "w") as file:
+    json.dump(results, file, indent=2)
+  print("Results written to {}".format(args.output))
+  return results
+
+
+if __name__ == "__main__":
+  main()
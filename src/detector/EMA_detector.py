@@ -1,8 +1,14 @@
+from itertools import islice
+
 import numpy as np
-from typing import List, Tuple, Optional
-from collections import deque
+from typing import List, Tuple, Optional, Iterator, Generator
 
 from src.simulator import anomalous_simulator
+from src.simulator.windowing import Window, split_by_day
+from src.utils import instrument, count
+from src.detector.registry import register_detector
+from src.detector.features import batch_features
+from src.detector.ema_kernel import ema_loop, python_ema_loop
 
 
 def initialize_baseline(first_day_data: List[float]) -> Tuple[np.ndarray, float]:
@@ -28,6 +34,46 @@ def update_ema(current: float, previous: float, alpha: float) -> float:
   return alpha * current + (1 - alpha) * previous
 
 
+class DayCarry:
+  """
+  Running state of the current day, carried between calls when a day
+  arrives in several chunks (e.g. sliding windows). The deviations are kept
+  contiguous in an array, so the threshold window is a view for np.std and
+  the compiled loop.
+  """
+  def __init__(self, history_window: int = 1440 * 7):
+    self.history_window = history_window
+    self.buffer = np.empty(min(history_window, 1440))
+    self.start = 0
+    self.end = 0
+    self.total = 0.0
+    self.count = 0
+    self.max = -np.inf
+
+  @property
+  def deviations(self) -> np.ndarray:
+    """The deviations in the threshold window, oldest first"""
+    return self.buffer[self.start:self.end]
+
+  def reserve(self, n: int) -> None:
+    """Makes room for n more deviations, dropping those that have left the window"""
+    if self.end + n <= len(self.buffer):
+      return
+    window = self.deviations
+    if len(window) + n > len(self.buffer):
+      self.buffer = np.empty(max(len(window) + n, 2 * len(self.buffer)))
+    self.buffer[:len(window)] = window.copy()
+    self.start, self.end = 0, len(window)
+
+  def extend(self, deviations: List[float]) -> None:
+    deviations = np.asarray(deviations, dtype=float)[-self.history_window:]
+    self.reserve(len(deviations))
+    self.buffer[self.end:self.end + len(deviations)] = deviations
+    self.end += len(deviations)
+    self.start = max(self.start, self.end - self.history_window)
+
+
+@instrument("EMA_detector.detect")
 def detect_anomalies(
     new_data: List[float],
     base_pattern: np.ndarray,
@@ -36,13 +82,16 @@ def detect_anomalies(
     ema_alpha: float = 0.1,
     pattern_update_alpha: float = 0.05,
     seasonal_update_alpha: float = 0.01,
-    history_window: int = 1440 * 7  # 7 days of history
-) -> Tuple[List[bool], np.ndarray, float]:
+    history_window: int = 1440 * 7,  # 7 days of history
+    start_minute: int = 0,
+    carry: Optional[DayCarry] = None,
+    jit: Optional[bool] = None
+) -> Tuple[List[int], np.ndarray, float]:
   """
   Detect anomalies in new data while adapting to changing patterns and seasonality.
 
   Args:
-      new_data: List of new measurements (1440 points for one day)
+      new_data: List of new measurements (1440 points for one day, or part of a day)
       base_pattern: Current baseline daily pattern
       seasonal_rate: Current seasonal rate
       threshold_std: Number of standard deviations for anomaly threshold
@@ -50,87 +99,67 @@ def detect_anomalies(
       pattern_update_alpha: Learning rate for updating the base pattern
       seasonal_update_alpha: Learning rate for updating seasonal rate
       history_window: Number of historical points to keep for threshold calculation
+      start_minute: Minute of the day of new_data[0]
+      carry: State of the day so far when the day is processed in chunks, a new day if not given
+      jit: Run the per point loop compiled with Numba (True), in Python (False), or compiled
+           if Numba is installed (None). Both give identical results.
 
   Returns:
-      Tuple of (anomaly flags, updated base pattern, updated seasonal rate)
+      Tuple of (anomalous minutes of the day, updated base pattern, updated seasonal rate)
   """
-  anomalies = []
   updated_pattern = base_pattern.copy()
-  updated_seasonal_rate = seasonal_rate
-
-  # Initialize historical deviations storage
-  historical_deviations = deque(maxlen=history_window)
-
-  # Process each point in the new data
-  for i, value in enumerate(new_data):
-    # Calculate expected value
-    expected = calculate_expected_value(i, updated_pattern, updated_seasonal_rate)
-
-    # Calculate deviation
-    deviation = abs(value - expected)
-    historical_deviations.append(deviation)
-
-    # Calculate dynamic threshold using historical deviations
-    threshold = np.std(historical_deviations) * threshold_std
-
-    # Detect anomaly
-    is_anomaly = deviation > threshold
-    #anomalies.append(is_anomaly)
-
-    # Update pattern and seasonality only if not an anomaly
-    if not is_anomaly:
-      # Update base pattern
-      normalized_value = value / updated_seasonal_rate
-      updated_pattern[i] = update_ema(normalized_value, updated_pattern[i], pattern_update_alpha)
-
-      # Update seasonal rate
-      daily_avg = np.mean(new_data[:i + 1])
-      daily_max = np.max(new_data[:i + 1])
-      new_seasonal_rate = max(0.85, 1 - (daily_avg / daily_max))
-      updated_seasonal_rate = update_ema(
-        new_seasonal_rate,
-        updated_seasonal_rate,
-        seasonal_update_alpha
-      )
-    else:
-      anomalies.append(i)
 
+  # Historical deviations and the day's running mean and max
+  if carry is None:
+    carry = DayCarry(history_window)
+  carry.reserve(len(new_data))
+
+  loop = ema_loop(jit)
+  if loop is not python_ema_loop:
+    new_data = np.asarray(new_data, dtype=float)
+  flags, updated_seasonal_rate, carry.start, carry.end, carry.total, carry.count, carry.max = loop(
+    new_data, updated_pattern, seasonal_rate, carry.buffer, carry.start, carry.end, carry.history_window,
+    carry.total, carry.count, carry.max, threshold_std, pattern_update_alpha, seasonal_update_alpha, start_minute
+  )
+
+  anomalies = (start_minute + np.flatnonzero(flags)).tolist()
+  count("EMA_detector.anomalies", len(anomalies))
   return anomalies, updated_pattern, updated_seasonal_rate
 
-def generate_simulation_data(start_day=0, duration=365):
+def generate_simulation_data(start_day=0, duration=365, source=None):
   """
   Generate all simulation data upfront to avoid reset issues.
 
   Args:
       start_day: day to start at in year (int)
       duration: Number of days to process
+      source: Optional iterator of daily data (e.g. a replay), defaults to the anomalous simulator
 
   Returns:
-      List of daily data lists
+      List of daily data lists, fewer than duration if the source ends first
   """
-  sim = anomalous_simulator(start_day, duration)
-  all_days = []
-
-  for _ in range(duration):
-    day_data = next(sim)
-    all_days.append(day_data)
+  sim = source if source is not None else anomalous_simulator(start_day, duration)
+  all_days = list(islice(sim, duration))
+  if not all_days:
+    raise ValueError("ERROR: The source has no days to process")
 
   return all_days
 
 
-def process_simulation(start_day=0, duration=365):
+def process_simulation(start_day=0, duration=365, source=None):
   """
   Process multiple days of simulation data.
 
   Args:
       start_day: day to start at in year (int)
       duration: Number of days to process
+      source: Optional iterator of daily data (e.g. a replay), defaults to the anomalous simulator
 
   Yields:
       Tuple of (day_data, anomalies) for each day
   """
   # Get all simulation data upfront
-  all_days = generate_simulation_data(start_day, duration)
+  all_days = generate_simulation_data(start_day, duration, source)
 
   # Initialize with first day
   first_day = all_days[0]
@@ -155,6 +184,137 @@ def process_simulation(start_day=0, duration=365):
     )
     yield day_data, anomalies
 
+@register_detector("EMA_detector")
+class EMADetector:
+  """
+  Adaptive EMA detector behind the common Detector interface. The baseline is
+  initialised from the first full day, either given to fit or buffered from
+  the stream, and the pattern and seasonal rate carry on across batches and days.
+  """
+  def __init__(
+      self,
+      threshold_std: float = 8.0,
+      ema_alpha: float = 0.1,
+      pattern_update_alpha: float = 0.05,
+      seasonal_update_alpha: float = 0.01,
+      history_window: int = 1440 * 7,
+      jit: Optional[bool] = None
+  ):
+    self.params = {
+      "threshold_std": threshold_std,
+      "ema_alpha": ema_alpha,
+      "pattern_update_alpha": pattern_update_alpha,
+      "seasonal_update_alpha": seasonal_update_alpha,
+      "history_window": history_window,
+      "jit": jit
+    }
+    self.base_pattern = None
+    self.seasonal_rate = None
+    self.carry = None
+    self.warmup = []
+
+  def fit(self, values: List[float], start_minute: int = 0) -> None:
+    """Initialises the baseline from the first day of values, then adapts it to the rest"""
+    batch = batch_features(values, start_minute)
+    if batch.start_minute % 1440 != 0 or len(batch) < 1440:
+      raise ValueError("The EMA detector is fitted on whole days")
+    self.base_pattern, self.seasonal_rate = initialize_baseline(batch.values[:1440])
+    self.carry = None
+    self.warmup = []
+    self.push(batch)
+
+  def partial_fit(self, values: List[float], start_minute: int = 0) -> None:
+    # The pattern and seasonal rate only learn from points that aren't anomalous
+    self.push(values, start_minute)
+
+  def score_batch(self, values: List[float], start_minute: int = 0) -> np.ndarray:
+    """Deviation from the expected value as a multiple of the current threshold, above 1 is anomalous"""
+    if self.base_pattern is None:
+      raise ValueError("The EMA detector needs a day of data before scoring")
+    batch = batch_features(values, start_minute)
+    deviations = np.abs(batch.values - self.base_pattern[batch.minute_of_day] * self.seasonal_rate)
+    history = self.carry.deviations if self.carry is not None and len(self.carry.deviations) else deviations
+    threshold = np.std(history) * self.params["threshold_std"]
+    with np.errstate(divide="ignore", invalid="ignore"):
+      return np.where(deviations > 0, deviations / threshold, 0.0)
+
+  def push(self, values: List[float], start_minute: int = 0) -> List[int]:
+    batch = batch_features(values, start_minute)
+    anomalies = []
+    for minute, start, chunk in split_by_day(batch.start_minute, batch.value_list()):
+      day_start = start - minute
+
+      # Buffer the first day to initialise the baseline from, as process_simulation does
+      if self.base_pattern is None:
+        self.warmup.extend(chunk)
+        if len(self.warmup) == 1440:
+          self.base_pattern, self.seasonal_rate = initialize_baseline(self.warmup)
+          found, self.base_pattern, self.seasonal_rate = detect_anomalies(
+            self.warmup, self.base_pattern, self.seasonal_rate, **self.params
+          )
+          anomalies.extend(day_start + i for i in found)
+          self.warmup = []
+        continue
+
+      if minute == 0 or self.carry is None:
+        self.carry = DayCarry(self.params["history_window"])
+      found, self.base_pattern, self.seasonal_rate = detect_anomalies(
+        chunk, self.base_pattern, self.seasonal_rate, start_minute=minute, carry=self.carry, **self.params
+      )
+      anomalies.extend(day_start + i for i in found)
+    return anomalies
+
+  def state(self) -> dict:
+    carry = None
+    if self.carry is not None:
+      carry = {
+        "deviations": self.carry.deviations.copy(),
+        "total": self.carry.total,
+        "count": self.carry.count,
+        "max": self.carry.max
+      }
+    return {
+      "params": dict(self.params),
+      "base_pattern": None if self.base_pattern is None else self.base_pattern.copy(),
+      "seasonal_rate": self.seasonal_rate,
+      "warmup": list(self.warmup),
+      "carry": carry
+    }
+
+  def load_state(self, state: dict) -> None:
+    self.params = {"jit": None, **state["params"]}
+    self.base_pattern = None if state["base_pattern"] is None else np.array(state["base_pattern"])
+    self.seasonal_rate = state["seasonal_rate"]
+    self.warmup = list(state["warmup"])
+    self.carry = None
+    if state["carry"] is not None:
+      self.carry = DayCarry(self.params["history_window"])
+      self.carry.extend(state["carry"]["deviations"])
+      self.carry.total = state["carry"]["total"]
+      self.carry.count = state["carry"]["count"]
+      self.carry.max = state["carry"]["max"]
+
+
+def process_windows(
+    windows: Iterator[Window],
+    **detector_params
+) -> Generator[Tuple[np.ndarray, List[int]], None, None]:
+  """
+  Process a stream of sliding windows, detecting anomalies in each window's new points.
+  The EMA state is carried across windows and day boundaries, so results match
+  processing whole days. The first day is buffered to initialise the baseline.
+
+  Args:
+      windows: Iterator of Window, e.g. from sliding_windows
+      detector_params: Keyword arguments for detect_anomalies
+
+  Yields:
+      Tuple of (new values of the window, anomalous minutes counted from the start of the stream)
+  """
+  detector = EMADetector(**detector_params)
+  for window in windows:
+    yield window.new_values, detector.push(window.new_values, window.new_start)
+
 if __name__ == '__main__':
   # Example usage
   for day_data, anomalies in process_simulation(start_day=0, duration=365):
@@ -1,8 +1,13 @@
 from sklearn.ensemble import IsolationForest
 from sklearn.preprocessing import StandardScaler
 import numpy as np
-from typing import List, Tuple, Generator
+from typing import List, Tuple, Generator, Iterator, Optional
 from src.simulator import simulator, anomalous_simulator, ANOMALY_THRESHOLD
+from src.simulator.windowing import Window
+from src.utils import instrument, count
+from src.detector.registry import register_detector
+from src.detector.features import batch_features
+from src.utils.buffers import ArrayBuffer
 
 
 class AnomalyDetector:
@@ -24,22 +29,19 @@ class AnomalyDetector:
     self.scaler = StandardScaler()
     self.is_fitted = False
 
-  def prepare_data(self, data: List[Tuple[float, int]]) -> np.ndarray:
+  @instrument("IF3.prepare")
+  def prepare_data(self, data: np.ndarray) -> np.ndarray:
     """
     Convert data to the correct format and scale features.
 
     Args:
-        data: List of (value, timestamp) tuples
+        data: Array of (value, timestamp) rows, or a list of tuples
 
     Returns:
         Scaled numpy array of features
     """
-    # Convert to numpy array and reshape for 2D features
-    values = np.array([x[0] for x in data]).reshape(-1, 1)
-    timestamps = np.array([x[1] for x in data]).reshape(-1, 1)
-
-    # Combine features
-    features = np.hstack([values, timestamps])
+    # Features are the (value, timestamp) columns
+    features = np.asarray(data, dtype=float).reshape(-1, 2)
 
     # Scale the features
     if not self.is_fitted:
@@ -50,12 +52,13 @@ class AnomalyDetector:
 
     return features
 
-  def train(self, training_data: List[Tuple[float, int]]) -> None:
+  @instrument("IF3.fit")
+  def train(self, training_data: np.ndarray) -> None:
     """
     Train the Isolation Forest model on new data.
 
     Args:
-        training_data: List of (value, timestamp) tuples for training
+        training_data: Array of (value, timestamp) rows for training
     """
     if len(training_data) < 100:  # Minimum sample size check
       raise ValueError("Not enough training data")
@@ -63,69 +66,209 @@ class AnomalyDetector:
     features = self.prepare_data(training_data)
     self.model.fit(features)
 
-  def detect(self, data: List[Tuple[float, int]]) -> List[Tuple[float, int]]:
+  @instrument("IF3.predict")
+  def detect(self, data: np.ndarray) -> np.ndarray:
     """
     Detect anomalies in new data.
 
     Args:
-        data: List of (value, timestamp) tuples to check for anomalies
+        data: Array of (value, timestamp) rows to check for anomalies
 
     Returns:
-        List of anomalous points (value, timestamp)
+        Array of anomalous (value, timestamp) rows
     """
     features = self.prepare_data(data)
     predictions = self.model.predict(features)
-    return [point for point, pred in zip(data, predictions) if pred == -1]
+    count("IF3.anomalies", int((predictions == -1).sum()))
+    return np.asarray(data, dtype=float).reshape(-1, 2)[predictions == -1]
 
 
-def generate_training_data(num_days: int = 7) -> List[Tuple[float, int]]:
+def generate_training_data(num_days: int = 7, source: Optional[Iterator[List[float]]] = None) -> np.ndarray:
   """
   Generate training data from the nominal simulator.
 
   Args:
       num_days: Number of days of data to generate
+      source: Optional iterator of daily data to use instead of the simulator
 
   Returns:
-      List of (value, timestamp) tuples
+      Array of (value, timestamp) rows
   """
-  sim = simulator()
-  training_data = []
-  for day in range(num_days):
-    data = next(sim)
-    data_2d = [(value, index + (1440 * day)) for index, value in enumerate(data)]
-    training_data.extend(data_2d)
-  return training_data
+  sim = source if source is not None else simulator()
+  training_data = [
+    np.column_stack((data, np.arange(len(data)) + (1440 * day))) for day, data in zip(range(num_days), sim)
+  ]
+  return np.concatenate(training_data) if training_data else np.empty((0, 2))
+
 
+def run_detector(
+    source: Optional[Iterator[List[float]]] = None,
+    training_source: Optional[Iterator[List[float]]] = None,
+    duration: int = 365,
+    retrain_interval: int = 7
+) -> Generator[Tuple[List[float], List[int]], None, None]:
+  """
+  Run anomaly detection on live data, retraining on the last week every week.
+
+  Args:
+      source: Optional iterator of daily data (e.g. a replay), defaults to the anomalous simulator
+      training_source: Optional iterator of nominal daily data for the initial training
+      duration: Number of days to process
+      retrain_interval: Days between retraining
 
-def main():
+  Yields:
+      Tuple of (day_data, indices of anomalous minutes within the day)
+  """
   # Initialize detector with a very low contamination factor
   detector = AnomalyDetector(n_estimators=100, contamination=500 / (1440 * 7))
 
   # Train initial model on nominal data
-  initial_training_data = generate_training_data()
+  initial_training_data = generate_training_data(source=training_source)
   detector.train(initial_training_data)
 
   # Run anomaly detection on live data
-  sim = anomalous_simulator()
-  last_week_data = []
+  sim = source if source is not None else anomalous_simulator()
+  last_week_data = ArrayBuffer(columns=2, maxlen=1440 * 7)  # Keep only last 7 days
 
-  for day in range(365):
-    # Get new data
-    data = next(sim)
-    data_2d = [(value, index + (1440 * day)) for index, value in enumerate(data)]
+  # Stops early if the source runs out of days
+  for day, data in zip(range(duration), sim):
+    data_2d = np.column_stack((data, np.arange(len(data)) + (1440 * day)))
 
     # Detect anomalies
     anomalies = detector.detect(data_2d)
-    print(f"Day {day}: Anomalous points: {len(anomalies)}")
 
     # Update training window
     last_week_data.extend(data_2d)
-    if len(last_week_data) > 1440 * 7:  # Keep only last 7 days
-      last_week_data = last_week_data[-1440 * 7:]
 
     # Retrain weekly
-    if day % 7 == 0 and day > 0:
-      detector.train(last_week_data)
+    if day % retrain_interval == 0 and day > 0:
+      detector.train(last_week_data.view())
+
+    yield data, (anomalies[:, 1].astype(int) - (1440 * day)).tolist()
+
+
+@register_detector("IF3")
+class IF3Detector:
+  """
+  AnomalyDetector behind the common Detector interface, with (value, minute)
+  features. It keeps the last week of points and retrains on them every
+  retrain_interval days of the stream, as run_detector does.
+  """
+  def __init__(
+      self,
+      n_estimators: int = 100,
+      contamination: float = 500 / (1440 * 7),
+      retrain_interval: int = 7,
+      history_size: int = 1440 * 7,
+      training_days: int = 7
+  ):
+    self.params = {
+      "n_estimators": n_estimators,
+      "contamination": contamination,
+      "retrain_interval": retrain_interval,
+      "history_size": history_size,
+      "training_days": training_days
+    }
+    self.detector = AnomalyDetector(n_estimators=n_estimators, contamination=contamination)
+    self.history = ArrayBuffer(columns=2, maxlen=history_size)
+    self.first_day = None
+    self.days_complete = None
+    self.trained = False
+
+  @staticmethod
+  def _points(values: List[float], start_minute: int = 0) -> np.ndarray:
+    """(value, minute) rows, computed once per batch when the batch is shared"""
+    batch = batch_features(values, start_minute)
+    return batch.cached("IF3.points", lambda batch: np.column_stack((batch.values, batch.minutes)))
+
+  def fit(self, values: List[float], start_minute: int = 0) -> None:
+    self.detector.train(self._points(values, start_minute))
+    self.trained = True
+
+  def partial_fit(self, values: List[float], start_minute: int = 0) -> None:
+    """Adds the values to the training window and retrains on it"""
+    self.history.extend(self._points(values, start_minute))
+    self.detector.train(self.history.view())
+    self.trained = True
+
+  def score_batch(self, values: List[float], start_minute: int = 0) -> np.ndarray:
+    if not self.trained:
+      raise ValueError("The IF3 detector must be fitted before scoring")
+    features = self.detector.prepare_data(self._points(values, start_minute))
+    return -self.detector.model.score_samples(features)
+
+  def push(self, values: List[float], start_minute: int = 0) -> List[int]:
+    # Train on the nominal simulator when no training data was given, as run_detector does
+    if not self.trained:
+      self.detector.train(generate_training_data(self.params["training_days"]))
+      self.trained = True
+
+    batch = batch_features(values, start_minute)
+    start_minute = batch.start_minute
+    data_2d = self._points(batch)
+    anomalies = self.detector.detect(data_2d)
+
+    # Update training window
+    self.history.extend(data_2d)
+
+    # Retrain at the end of every retrain_interval days since the stream started
+    if self.days_complete is None:
+      self.first_day = self.days_complete = start_minute // 1440
+    while self.days_complete < (start_minute + len(batch)) // 1440:
+      elapsed = self.days_complete - self.first_day
+      if elapsed % self.params["retrain_interval"] == 0 and elapsed > 0:
+        self.detector.train(self.history.view())
+      self.days_complete += 1
+
+    return anomalies[:, 1].astype(int).tolist()
+
+  def state(self) -> dict:
+    return {
+      "params": dict(self.params),
+      "detector": self.detector,
+      "history": self.history.view().copy(),
+      "first_day": self.first_day,
+      "days_complete": self.days_complete,
+      "trained": self.trained
+    }
+
+  def load_state(self, state: dict) -> None:
+    self.params = dict(state["params"])
+    self.detector = state["detector"]
+    self.history = ArrayBuffer(columns=2, maxlen=self.params["history_size"])
+    self.history.extend(state["history"])
+    self.first_day = state["first_day"]
+    self.days_complete = state["days_complete"]
+    self.trained = state["trained"]
+
+
+def run_windowed_detector(
+    windows: Iterator[Window],
+    training_source: Optional[Iterator[List[float]]] = None,
+    retrain_interval: int = 7
+) -> Generator[Tuple[np.ndarray, List[int]], None, None]:
+  """
+  Detect anomalies in the new points of each sliding window in one batch.
+  Features and weekly retraining match run_detector.
+
+  Args:
+      windows: Iterator of Window, e.g. from sliding_windows
+      training_source: Optional iterator of nominal daily data for the initial training
+      retrain_interval: Days between retraining
+
+  Yields:
+      Tuple of (new values of the window, anomalous minutes counted from the start of the stream)
+  """
+  detector = IF3Detector(retrain_interval=retrain_interval)
+  detector.fit(generate_training_data(source=training_source)[:, 0])
+
+  for window in windows:
+    yield window.new_values, detector.push(window.new_values, window.new_start)
+
+
+def main(source: Optional[Iterator[List[float]]] = None, training_source: Optional[Iterator[List[float]]] = None):
+  for day, (data, anomaly_indices) in enumerate(run_detector(source, training_source)):
+    print(f"Day {day}: Anomalous points: {len(anomaly_indices)}")
 
 
 if __name__ == "__main__":
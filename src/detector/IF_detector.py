@@ -1,9 +1,21 @@
 from dataclasses import dataclass
-from typing import List, Optional, Tuple, Callable
+from typing import List, Optional, Tuple, Callable, Sequence, Iterator, Generator
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import atexit
+import multiprocessing
+import threading
 from src.simulator import anomalous_simulator
+from src.simulator.windowing import Window
+from src.utils import timed, instrument, count
+from src.detector.registry import register_detector
+from src.detector.features import batch_features
+import numpy as np
+import os
 import random
 import math
 from statistics import mean
+from src.utils.buffers import ArrayBuffer
 
 sim = anomalous_simulator()
 
@@ -43,9 +55,9 @@ def get_batch():
   return next(sim)
 
 
-def convert_to_timepoints(data: List[float]) -> List[TimePoint]:
+def convert_to_timepoints(data: List[float], start_minute: int = 0) -> List[TimePoint]:
   """Convert raw values to TimePoints with minute-of-day context"""
-  return [TimePoint(value, minute % 1440) for minute, value in enumerate(data)]
+  return [TimePoint(value, minute % 1440) for minute, value in enumerate(data, start_minute)]
 
 
 def get_expected_range(minute: int, window_size: int = 60) -> Tuple[int, int]:
@@ -69,8 +81,8 @@ def get_data_bounds(timepoints: List[TimePoint]) -> Tuple[float, float]:
   return min(values), max(values)
 
 
-def gen_split_value(min_val: float, max_val: float) -> float:
-  return random.uniform(min_val, max_val)
+def gen_split_value(min_val: float, max_val: float, rng: random.Random = random) -> float:
+  return rng.uniform(min_val, max_val)
 
 
 def split_data(timepoints: List[TimePoint], split_value: float) -> Tuple[List[TimePoint], List[TimePoint]]:
@@ -80,7 +92,12 @@ def split_data(timepoints: List[TimePoint], split_value: float) -> Tuple[List[Ti
   return below, above
 
 
-def build_isolation_tree(timepoints: List[TimePoint], max_depth: int, current_depth: int = 0) -> IsolationNode:
+def build_isolation_tree(
+    timepoints: List[TimePoint],
+    max_depth: int,
+    current_depth: int = 0,
+    rng: random.Random = random
+) -> IsolationNode:
   n_samples = len(timepoints)
 
   if current_depth >= max_depth or n_samples <= 1:
@@ -108,7 +125,7 @@ def build_isolation_tree(timepoints: List[TimePoint], max_depth: int, current_de
       size=n_samples
     )
 
-  split_value = gen_split_value(min_val, max_val)
+  split_value = gen_split_value(min_val, max_val, rng)
   below_data, above_data = split_data(timepoints, split_value)
 
   # Calculate time window for current node
@@ -118,44 +135,245 @@ def build_isolation_tree(timepoints: List[TimePoint], max_depth: int, current_de
   return IsolationNode(
     split_value=split_value,
     time_window=time_window,
-    below=build_isolation_tree(below_data, max_depth, current_depth + 1),
-    above=build_isolation_tree(above_data, max_depth, current_depth + 1),
+    below=build_isolation_tree(below_data, max_depth, current_depth + 1, rng),
+    above=build_isolation_tree(above_data, max_depth, current_depth + 1, rng),
     size=n_samples
   )
 
 
-def sample_data(timepoints: List[TimePoint], sample_size: int) -> List[TimePoint]:
-  return random.sample(timepoints, min(sample_size, len(timepoints)))
+def sample_data(timepoints: List[TimePoint], sample_size: int, rng: random.Random = random) -> List[TimePoint]:
+  return rng.sample(timepoints, min(sample_size, len(timepoints)))
 
+
+def build_seeded_tree(timepoints: List[TimePoint], sample_size: int, max_depth: int, seed: int) -> IsolationTree:
+  """Build one tree from its own seed, so the result doesn't depend on which process builds it"""
+  rng = random.Random(seed)
+  return IsolationTree(
+    root=build_isolation_tree(sample_data(timepoints, sample_size, rng), max_depth, rng=rng),
+    max_depth=max_depth
+  )
+
+
+def derive_tree_seeds(seed: int, n_trees: int) -> List[int]:
+  """Per tree seeds derived from one master seed"""
+  return [int(tree_seed) for tree_seed in np.random.SeedSequence(seed).generate_state(n_trees, dtype=np.uint64)]
+
+
+def derive_batch_seed(seed: Optional[int], batch: int) -> Optional[int]:
+  """Seed for one batch of a stream, None stays None"""
+  if seed is None:
+    return None
+  return int(np.random.SeedSequence([seed, batch]).generate_state(1, dtype=np.uint64)[0])
+
+
+# Process pools are reused between batches, keyed by worker count
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def resolve_n_jobs(n_jobs: int) -> int:
+  """n_jobs of -1 uses every core"""
+  if n_jobs is None or n_jobs == 0:
+    return 1
+  if n_jobs < 0:
+    return max(1, (os.cpu_count() or 1) + 1 + n_jobs)
+  return n_jobs
+
+
+def _get_pool(n_jobs: int) -> ProcessPoolExecutor:
+  # Created from whichever thread scores first, e.g. an ensemble member's while the alert sinks' threads run.
+  # Forking a process with other threads can deadlock the children on a lock held at the fork, so they're spawned
+  with _pools_lock:
+    if n_jobs not in _pools:
+      _pools[n_jobs] = ProcessPoolExecutor(max_workers=n_jobs, mp_context=multiprocessing.get_context("spawn"))
+    return _pools[n_jobs]
+
+
+@atexit.register
+def shutdown_pools() -> None:
+  """Stops the worker processes of the parallel batches, the next parallel batch starts new ones"""
+  with _pools_lock:
+    pools = list(_pools.values())
+    _pools.clear()
+  for pool in pools:
+    pool.shutdown()
+
+
+def _share_array(data: Sequence) -> shared_memory.SharedMemory:
+  """Copies data into a new shared memory block of float64 values"""
+  values = np.asarray(data, dtype=np.float64)
+  shm = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+  np.ndarray(values.shape, dtype=np.float64, buffer=shm.buf)[:] = values
+  return shm
+
+
+def _read_shared_array(name: str, shape: Tuple[int, ...]) -> list:
+  """Reads a shared block in a worker, only the creating process unlinks it"""
+  shm = shared_memory.SharedMemory(name=name)
+  try:
+    return np.ndarray(shape, dtype=np.float64, buffer=shm.buf).tolist()
+  finally:
+    shm.close()
+
+
+def _build_trees_worker(name: str, length: int, sample_size: int, max_depth: int, seeds: List[int]) -> List[IsolationTree]:
+  values, minutes = _read_shared_array(name, (2, length))
+  timepoints = [TimePoint(value, int(minute)) for value, minute in zip(values, minutes)]
+  return [build_seeded_tree(timepoints, sample_size, max_depth, seed) for seed in seeds]
+
+
+def _score_worker(name: str, length: int, start: int, end: int, forest: 'IsolationForest', start_minute: int) -> List[float]:
+  data = _read_shared_array(name, (length,))
+  return [compute_anomaly_score(data[index], (start_minute + index) % 1440, forest) for index in range(start, end)]
+
+
+def _shards(n_items: int, n_shards: int) -> List[Tuple[int, int]]:
+  """Splits range(n_items) into contiguous (start, end) shards"""
+  bounds = np.linspace(0, n_items, min(n_shards, n_items) + 1).astype(int)
+  return [(int(start), int(end)) for start, end in zip(bounds[:-1], bounds[1:])]
+
+
+def build_trees(
+    timepoints: List[TimePoint],
+    n_trees: int,
+    sample_size: int,
+    seed: int,
+    n_jobs: int = 1
+) -> Tuple[IsolationTree, ...]:
+  """
+  Build trees from TimePoints, optionally sharding them across a process pool.
+
+  Args:
+      timepoints: Points to sample each tree from
+      n_trees: Number of trees to build
+      sample_size: Points sampled for each tree
+      seed: Master seed, trees are identical for a seed whatever n_jobs is
+      n_jobs: Worker processes, -1 for every core
+
+  Returns:
+      Tuple of IsolationTree
+  """
+  n_jobs = resolve_n_jobs(n_jobs)
+  max_depth = int(math.ceil(math.log2(max(sample_size, 2))))
+  tree_seeds = derive_tree_seeds(seed, n_trees)
+
+  if n_jobs == 1 or n_trees == 0:
+    return tuple(build_seeded_tree(timepoints, sample_size, max_depth, tree_seed) for tree_seed in tree_seeds)
+
+  shm = _share_array([[tp.value for tp in timepoints], [tp.minute for tp in timepoints]])
+  try:
+    futures = [
+      _get_pool(n_jobs).submit(_build_trees_worker, shm.name, len(timepoints), sample_size, max_depth, tree_seeds[start:end])
+      for start, end in _shards(n_trees, n_jobs)
+    ]
+    return tuple(tree for future in futures for tree in future.result())
+  finally:
+    shm.close()
+    shm.unlink()
+
+
+@instrument("IF_detector.fit")
 def build_isolation_forest(
     data: List[float],
     n_trees: int = 100,
-    sample_size: Optional[int] = None
+    sample_size: Optional[int] = None,
+    n_jobs: int = 1,
+    seed: Optional[int] = None,
+    start_minute: int = 0
 ) -> IsolationForest:
-  timepoints = convert_to_timepoints(data)
-
-  if sample_size is None:
-    sample_size = min(256, len(timepoints))
+  """
+  Build the forest, optionally sharding the trees across a process pool.
 
-  max_depth = int(math.ceil(math.log2(sample_size)))
+  Args:
+      data: Values of the batch
+      n_trees: Number of trees in the forest
+      sample_size: Points sampled for each tree
+      n_jobs: Worker processes, -1 for every core
+      seed: Master seed, trees are identical for a seed whatever n_jobs is.
+            Drawn from the global random state when not given.
+      start_minute: Minute of data[0], only its minute of the day is used
 
-  trees = tuple(
-    IsolationTree(
-      root=build_isolation_tree(
-        sample_data(timepoints, sample_size),
-        max_depth
-      ),
-      max_depth=max_depth
-    )
-    for _ in range(n_trees)
-  )
+  Returns:
+      IsolationForest
+  """
+  if sample_size is None:
+    sample_size = min(256, len(data))
+  if seed is None:
+    seed = random.getrandbits(64)
 
   return IsolationForest(
-    trees=trees,
+    trees=build_trees(convert_to_timepoints(data, start_minute), n_trees, sample_size, seed, n_jobs),
     sample_size=sample_size,
     n_trees=n_trees
   )
 
+
+@instrument("IF_detector.partial_fit")
+def update_forest(
+    forest: IsolationForest,
+    timepoints: List[TimePoint],
+    replace_fraction: float = 0.1,
+    n_jobs: int = 1,
+    seed: Optional[int] = None
+) -> IsolationForest:
+  """
+  Streaming update of a forest: the oldest trees are replaced with trees
+  built from recent points, so each batch costs a partial fit.
+
+  Args:
+      forest: Current forest, trees are ordered oldest first
+      timepoints: Recent normal points to build the new trees from
+      replace_fraction: Fraction of the trees to replace
+      n_jobs: Worker processes, -1 for every core
+      seed: Master seed for the new trees
+
+  Returns:
+      New IsolationForest with the same number of trees
+  """
+  if not 0 <= replace_fraction <= 1:
+    raise ValueError("replace_fraction must be between 0 and 1")
+  n_replace = min(forest.n_trees, int(math.ceil(forest.n_trees * replace_fraction)))
+  if n_replace == 0 or len(timepoints) < 2:
+    return forest
+  if seed is None:
+    seed = random.getrandbits(64)
+
+  new_trees = build_trees(timepoints, n_replace, min(forest.sample_size, len(timepoints)), seed, n_jobs)
+  return IsolationForest(
+    trees=forest.trees[n_replace:] + new_trees,
+    sample_size=forest.sample_size,
+    n_trees=forest.n_trees
+  )
+
+
+def score_batch(data: List[float], forest: IsolationForest, n_jobs: int = 1, start_minute: int = 0) -> List[float]:
+  """
+  Anomaly score of every point in a batch, optionally sharded across a process pool.
+
+  Args:
+      data: Values of the batch
+      forest: Forest to score against
+      n_jobs: Worker processes, -1 for every core
+      start_minute: Minute of the day of data[0]
+
+  Returns:
+      List of scores in the same order as data
+  """
+  n_jobs = resolve_n_jobs(n_jobs)
+  if n_jobs == 1 or len(data) < n_jobs:
+    return [compute_anomaly_score(value, (start_minute + index) % 1440, forest) for index, value in enumerate(data)]
+
+  shm = _share_array(data)
+  try:
+    futures = [
+      _get_pool(n_jobs).submit(_score_worker, shm.name, len(data), start, end, forest, start_minute)
+      for start, end in _shards(len(data), n_jobs)
+    ]
+    return [score for future in futures for score in future.result()]
+  finally:
+    shm.close()
+    shm.unlink()
+
 def average_path_length(n: int) -> float:
   """
   Compute average path length in unsuccessful search in BST.
@@ -226,16 +444,15 @@ def find_anomalies(
     data: List[float],
     threshold: float = 0.8,  # Increased threshold to be even more conservative
     n_trees: int = 100,
-    sample_size: Optional[int] = None
+    sample_size: Optional[int] = None,
+    n_jobs: int = 1,
+    seed: Optional[int] = None
 ) -> Tuple[List[float], List[float]]:
   """Find anomalies considering time-of-day patterns and noise tolerance"""
-  forest = build_isolation_forest(data, n_trees, sample_size)
+  forest = build_isolation_forest(data, n_trees, sample_size, n_jobs, seed)
 
   # Score each point with its time context
-  scored_data = [
-    (value, compute_anomaly_score(value, minute % 1440, forest))
-    for minute, value in enumerate(data)
-  ]
+  scored_data = list(zip(data, score_batch(data, forest, n_jobs)))
 
   # First filter: basic threshold
   potential_anomalies = [
@@ -287,68 +504,226 @@ from statistics import mean
 # Keep all existing classes and helper functions...
 # (TimePoint, IsolationNode, IsolationTree, IsolationForest definitions remain the same)
 
+@register_detector("IF_detector")
+class TimeAwareForestDetector:
+  """
+  The time aware forest behind the common Detector interface. By default a new
+  forest is built from each batch pushed and the batch is scored against it.
+  With replace_fraction set the forest is kept between batches: each batch is
+  scored against the forest trained on recent normal history, then that
+  fraction of the oldest trees is rebuilt from the history including the
+  batch's normal points.
+  """
+  def __init__(
+      self,
+      threshold: float = 0.95,
+      n_trees: int = 100,
+      sample_size: Optional[int] = None,
+      n_jobs: int = 1,
+      seed: Optional[int] = None,
+      replace_fraction: Optional[float] = None,
+      history_size: int = 1440 * 7
+  ):
+    self.params = {
+      "threshold": threshold,
+      "n_trees": n_trees,
+      "sample_size": sample_size,
+      "n_jobs": n_jobs,
+      "seed": seed,
+      "replace_fraction": replace_fraction,
+      "history_size": history_size
+    }
+    self.forest = None
+    self.batch = 0
+    self.history = ArrayBuffer(columns=2, maxlen=history_size) # (value, minute of the day) rows
+
+  def _history_timepoints(self) -> List[TimePoint]:
+    """TimePoints of the history, only built when trees are"""
+    return [TimePoint(value, int(minute)) for value, minute in self.history.view().tolist()]
+
+  def _build(self, values: List[float], start_minute: int) -> IsolationForest:
+    return build_isolation_forest(
+      values, self.params["n_trees"], self.params["sample_size"], self.params["n_jobs"],
+      derive_batch_seed(self.params["seed"], self.batch), start_minute
+    )
+
+  def fit(self, values: List[float], start_minute: int = 0) -> None:
+    batch = batch_features(values, start_minute)
+    self.forest = self._build(batch.value_list(), batch.start_minute)
+    self.history.extend(np.column_stack((batch.values, batch.minute_of_day)))
+
+  def partial_fit(self, values: List[float], start_minute: int = 0) -> None:
+    batch = batch_features(values, start_minute)
+    if self.forest is None:
+      self.fit(batch)
+      return
+    self.history.extend(np.column_stack((batch.values, batch.minute_of_day)))
+    self.forest = update_forest(
+      self.forest, self._history_timepoints(), self.params["replace_fraction"] or 0.1, self.params["n_jobs"],
+      derive_batch_seed(self.params["seed"], self.batch)
+    )
+
+  def score_batch(self, values: List[float], start_minute: int = 0) -> np.ndarray:
+    if self.forest is None:
+      raise ValueError("The IF_detector detector must be fitted before scoring")
+    batch = batch_features(values, start_minute)
+    return np.array(score_batch(batch.value_list(), self.forest, self.params["n_jobs"], batch.start_minute % 1440))
+
+  def push(self, values: List[float], start_minute: int = 0) -> List[int]:
+    batch = batch_features(values, start_minute)
+    values, start_minute = batch.value_list(), batch.start_minute
+    replace_fraction = self.params["replace_fraction"]
+
+    # Streaming mode only builds a full forest on the first batch
+    if replace_fraction is None or self.forest is None:
+      self.forest = self._build(values, start_minute)
+    self.batch += 1
+
+    # Score each point with its time context
+    with timed("IF_detector.score"):
+      scores = score_batch(values, self.forest, self.params["n_jobs"], start_minute % 1440)
+
+    # Flag points over the threshold that are also outside the expected pattern
+    flagged = [
+      index
+      for index, (value, score) in enumerate(zip(values, scores))
+      if score > self.params["threshold"] and not is_within_normal_bounds(TimePoint(value, (start_minute + index) % 1440))
+    ]
+
+    # Learn from the normal points of this batch for the next one
+    if replace_fraction is not None:
+      normal = np.ones(len(batch), dtype=bool)
+      normal[flagged] = False
+      self.history.extend(np.column_stack((batch.values, batch.minute_of_day))[normal])
+      self.forest = update_forest(
+        self.forest, self._history_timepoints(), replace_fraction, self.params["n_jobs"],
+        derive_batch_seed(self.params["seed"], self.batch)
+      )
+
+    count("IF_detector.anomalies", len(flagged))
+    return [start_minute + index for index in flagged]
+
+  def state(self) -> dict:
+    return {
+      "params": dict(self.params),
+      "forest": self.forest,
+      "batch": self.batch,
+      "history": self.history.view().copy()
+    }
+
+  def close(self) -> None:
+    """Stops the worker processes n_jobs ran on, which are shared with any other TimeAwareForestDetector"""
+    shutdown_pools()
+
+  def load_state(self, state: dict) -> None:
+    self.params = dict(state["params"])
+    self.forest = state["forest"]
+    self.batch = state["batch"]
+    self.history = ArrayBuffer(columns=2, maxlen=self.params["history_size"])
+    self.history.extend(state["history"])
+
+
 def continuous_anomaly_detection(
     data_generator: Iterator[List[float]],
     threshold: float = 0.8,
     n_trees: int = 100,
-    sample_size: Optional[int] = None
+    sample_size: Optional[int] = None,
+    n_jobs: int = 1,
+    seed: Optional[int] = None,
+    replace_fraction: Optional[float] = None,
+    history_size: int = 1440 * 7
 ) -> Generator[Tuple[List[float], List[int]], None, None]:
   """
   Continuously process batches of data and yield both the data and anomaly indices.
 
+  By default a new forest is built from each batch and the batch is scored against it.
+  With replace_fraction set the forest is kept between batches: each batch is scored
+  against the forest trained on recent normal history, then that fraction of the
+  oldest trees is rebuilt from the history including the batch's normal points.
+  A long outage can no longer become normal for its own model, and each batch costs
+  a partial fit instead of a full one.
+
   Args:
       data_generator: Generator/Iterator that yields batches of data
       threshold: Anomaly score threshold
       n_trees: Number of trees in the isolation forest
       sample_size: Sample size for building trees
+      n_jobs: Worker processes for building and scoring, -1 for every core
+      seed: Master seed, results for a seed are the same whatever n_jobs is
+      replace_fraction: Fraction of trees replaced per batch, None builds a new forest per batch
+      history_size: Number of recent normal points kept to build trees from
 
   Yields:
       Tuple containing:
       - List[float]: The original data batch
       - List[int]: Indices of detected anomalies in the batch
   """
-  while True:
-    try:
-      # Get next batch of data
-      data = next(data_generator)
-
-      # Build forest and get anomaly scores
-      forest = build_isolation_forest(data, n_trees, sample_size)
-
-      # Score each point with its time context and track indices
-      scored_data = [
-        (value, compute_anomaly_score(value, minute % 1440, forest), minute)
-        for minute, value in enumerate(data)
-      ]
-
-      # First filter: basic threshold
-      potential_anomalies = [
-        (value, minute)
-        for value, score, minute in scored_data
-        if score > threshold
-      ]
-
-      # Second filter: check against expected pattern and collect indices
-      anomaly_indices = [
-        minute
-        for value, minute in potential_anomalies
-        if not is_within_normal_bounds(TimePoint(value, minute % 1440))
-      ]
-
-      yield data, sorted(anomaly_indices)
-
-    except StopIteration:
-      break
-
-def run_sim_anomaly_detector(start_day=0,duration = 365):
-  # Create the simulator
-  sim = anomalous_simulator(start_day, duration)
+  detector = TimeAwareForestDetector(threshold, n_trees, sample_size, n_jobs, seed, replace_fraction, history_size)
+  start_minute = 0
+  for data in data_generator:
+    anomaly_minutes = detector.push(data, start_minute)
+    yield data, [minute - start_minute for minute in anomaly_minutes]
+    start_minute += len(data)
+
+def windowed_anomaly_detection(
+    windows: Iterator[Window],
+    threshold: float = 0.8,
+    n_trees: int = 100,
+    sample_size: Optional[int] = None,
+    n_jobs: int = 1,
+    seed: Optional[int] = None
+) -> Generator[Tuple[List[float], List[int]], None, None]:
+  """
+  Builds a forest from each sliding window, with the true minute of the day as
+  time context, and scores the window's new points against it in one batch.
+
+  Args:
+      windows: Iterator of Window, e.g. from sliding_windows
+      threshold: Anomaly score threshold
+      n_trees: Number of trees in the isolation forest
+      sample_size: Sample size for building trees, defaults to the window length up to 256
+      n_jobs: Worker processes for building and scoring, -1 for every core
+      seed: Master seed, results for a seed are the same whatever n_jobs is
+
+  Yields:
+      Tuple of (new values of the window, anomalous minutes counted from the start of the stream)
+  """
+  for batch, window in enumerate(windows):
+    timepoints = [TimePoint(value, (window.start + index) % 1440) for index, value in enumerate(window.values.tolist())]
+    window_sample_size = sample_size if sample_size is not None else min(256, len(timepoints))
+    batch_seed = derive_batch_seed(seed, batch)
+    if batch_seed is None:
+      batch_seed = random.getrandbits(64)
+    forest = IsolationForest(
+      trees=build_trees(timepoints, n_trees, window_sample_size, batch_seed, n_jobs),
+      sample_size=window_sample_size,
+      n_trees=n_trees
+    )
+
+    new_values = window.new_values.tolist()
+    with timed("IF_detector.score"):
+      scores = score_batch(new_values, forest, n_jobs, window.new_start % 1440)
+
+    anomaly_minutes = [
+      window.new_start + index
+      for index, (value, score) in enumerate(zip(new_values, scores))
+      if score > threshold and not is_within_normal_bounds(TimePoint(value, (window.new_start + index) % 1440))
+    ]
+    count("IF_detector.anomalies", len(anomaly_minutes))
+    yield new_values, anomaly_minutes
+
+def run_sim_anomaly_detector(start_day=0,duration = 365, source=None, n_jobs=1, seed=None, replace_fraction=None):
+  # Create the simulator, or stream from a given source such as a replay
+  sim = source if source is not None else anomalous_simulator(start_day, duration)
 
   # Create the continuous detector
   detector = continuous_anomaly_detection(
     data_generator=sim,
     threshold=0.95,  # More conservative threshold
-    n_trees=100
+    n_trees=100,
+    n_jobs=n_jobs,
+    seed=seed,
+    replace_fraction=replace_fraction
   )
 
   # Process multiple batches
@@ -1,61 +1,157 @@
+from itertools import islice
+import numpy as np
 from sklearn.ensemble import IsolationForest
 from src.simulator import simulator, anomalous_simulator, ANOMALY_THRESHOLD
+from src.utils import timed, instrument, count
+from src.detector.registry import register_detector
+from src.detector.features import batch_features
+from src.utils.buffers import ArrayBuffer
 
-def generate_test_data():
-    """ Generates the initial year of data to train the model"""
-    sim = anomalous_simulator()
-    # Get 1 week of data
-    test_data_2d = []
-    for day in range(365):
-        test_data_24 = next(sim)
-        test_data_2d = test_data_2d + [(value, index + (1440 * day)%365) for index, value in enumerate(test_data_24)]
+def generate_test_data(source=None, days=365):
+    """
+    Generates the initial year of data to train the model, from the simulator or a given source,
+    as a float32 array of (value, timestamp) rows
+    """
+    sim = source if source is not None else anomalous_simulator()
+    # One block of features per day, joined once instead of concatenating lists every day
+    test_data_2d = [
+        np.column_stack((test_data_24, np.arange(len(test_data_24)) + (1440 * day) % 365)).astype(np.float32)
+        for day, test_data_24 in zip(range(days), sim)
+    ]
 
     ## Manually insert anomaly
     #test_data_2d[50:550] = [(20, i) for i in range(50,550)]
     del sim
 
-    return test_data_2d
+    return np.concatenate(test_data_2d) if test_data_2d else np.empty((0, 2), dtype=np.float32)
 
-def train_model(test_data, contamination=ANOMALY_THRESHOLD):
-    """ Trains the model with the given test data"""
-    model = IsolationForest(n_estimators=100, max_samples='auto', contamination=ANOMALY_THRESHOLD, max_features=1.0)
+@instrument("IF_detector2.fit")
+def train_model(test_data, contamination=ANOMALY_THRESHOLD, n_estimators=100, random_state=None):
+    """ Trains the model with the given test data, an array or list of (value, timestamp) rows"""
+    model = IsolationForest(n_estimators=n_estimators, max_samples='auto', contamination=contamination,
+                            max_features=1.0, random_state=random_state)
     model.fit(test_data)
     return model
 
-def detector(duration=1000):
-    """ Runs the simulation and predicts anomalous data for each day"""
-    sim = anomalous_simulator(duration=duration)
-    test_data = generate_test_data()
-    IF = train_model(test_data, 500 / (1440 * 7))
+def to_features(values, start_minute=0):
+    """ (value, timestamp) feature array of values starting at a minute counted from the start of the stream"""
+    batch = batch_features(values, start_minute)
+    return batch.cached(
+        "IF_detector2.features",
+        lambda batch: np.column_stack((batch.values, batch.minute_of_day + (1440 * (batch.minutes // 1440)) % 365))
+    )
 
-    #last_week_data = []
+@register_detector("IF_detector2")
+class IF2Detector:
+    """
+    The sklearn isolation forest of detector behind the common Detector interface.
+    Every point seen is kept, and the model is retrained on all of them every
+    retrain_interval minutes of the stream. The points are kept as float32, which
+    is what the sklearn forest computes in, so they take 8 bytes each.
+    """
+    def __init__(self, contamination=ANOMALY_THRESHOLD, n_estimators=100, retrain_interval=1440 * 30,
+                 training_days=365, seed=None):
+        self.params = {
+            "contamination": contamination,
+            "n_estimators": n_estimators,
+            "retrain_interval": retrain_interval,
+            "training_days": training_days,
+            "seed": seed
+        }
+        self.model = None
+        self.test_data = ArrayBuffer(columns=2, dtype=np.float32)
+        self.since_training = 0
 
-    day = 0
-    for _ in range(duration):
-        # Get batch of data from the sim
-        data = next(sim)
-        data_2d = [(value, index + (1440 * day)%365) for index, value in enumerate(data)]
-        day += 1
+    def _train(self):
+        self.model = train_model(self.test_data.view(), self.params["contamination"], self.params["n_estimators"],
+                                 self.params["seed"])
 
-        ## Retrains the IF every week
-        #if day % 7 == 0:
-        #    IF = train_model(last_week_data)
-        #    last_week_data = data_2d
-        #else:
-        #    last_week_data = last_week_data + data_2d
+    def fit(self, values, start_minute=0):
+        self.test_data.clear()
+        self.test_data.extend(to_features(values, start_minute))
+        self.since_training = 0
+        self._train()
+
+    def partial_fit(self, values, start_minute=0):
+        """ Adds the values to the training data and retrains straight away"""
+        self.test_data.extend(to_features(values, start_minute))
+        self.since_training = 0
+        self._train()
+
+    def score_batch(self, values, start_minute=0):
+        if self.model is None:
+            raise ValueError("The IF_detector2 detector must be fitted before scoring")
+        return -self.model.score_samples(to_features(values, start_minute))
+
+    def push(self, values, start_minute=0):
+        # Train on a year of simulation when no training data was given, as detector does
+        if self.model is None:
+            self.fit(generate_test_data(days=self.params["training_days"])[:, 0])
+
+        with timed("IF_detector2.prepare"):
+            batch = batch_features(values, start_minute)
+            data_2d = to_features(batch)
 
         # Anomaly detect
-        predictions = IF.predict(data_2d)
-        anomaly_indices = [index + (1440*day) for (value, index), label in zip(data_2d, predictions) if label == -1]
+        with timed("IF_detector2.predict"):
+            predictions = self.model.predict(data_2d)
+        anomaly_indices = (batch.start_minute + np.flatnonzero(predictions == -1)).tolist()
+        count("IF_detector2.anomalies", len(anomaly_indices))
 
         # Update the prediction model with new data
-        test_data = test_data + data_2d
-        # Only do once every 30 days
-        if day % 30 == 0:
-            IF = train_model(test_data, 500 / (1440 * 7))
+        self.test_data.extend(data_2d)
+        self.since_training += len(data_2d)
+        if self.since_training >= self.params["retrain_interval"]:
+            self._train()
+            self.since_training -= self.params["retrain_interval"]
+
+        return anomaly_indices
+
+    def state(self):
+        return {
+            "params": dict(self.params),
+            "model": self.model,
+            "test_data": self.test_data.view().copy(),
+            "since_training": self.since_training
+        }
+
+    def load_state(self, state):
+        self.params = dict(state["params"])
+        self.model = state["model"]
+        self.test_data = ArrayBuffer(columns=2, dtype=np.float32, capacity=len(state["test_data"]))
+        self.test_data.extend(state["test_data"])
+        self.since_training = state["since_training"]
+
+def detector(duration=1000, source=None, training_source=None):
+    """
+    Runs the simulation and predicts anomalous data for each day, retraining every 30 days.
+    A replayed dataset can be given as the source and training source instead of simulating.
+    """
+    sim = source if source is not None else anomalous_simulator(duration=duration)
+    IF = IF2Detector()
+    IF.fit(generate_test_data(training_source)[:, 0])
+
+    # Get batch of data from the sim, stopping early if the source runs out of days
+    for day, data in enumerate(islice(sim, duration)):
+        # Minutes since the start of the run
+        yield data, IF.push(data, 1440 * day)
+
+def windowed_detector(windows, training_source=None, retrain_interval=1440 * 30):
+    """
+    Predicts the new points of each sliding window in one batch, so anomalies are
+    reported every window step instead of once a day. Features and retraining
+    match detector, with retraining counted in minutes instead of days.
+
+    :param windows: Iterator of Window, e.g. from sliding_windows
+    :param training_source: Optional iterator of daily data for the initial training
+    :param retrain_interval: Minutes of new data between retraining
+    :return: Generator of (new values of the window, anomalous minutes counted from the start of the stream)
+    """
+    IF = IF2Detector(retrain_interval=retrain_interval)
+    IF.fit(generate_test_data(training_source)[:, 0])
 
-        yield data, anomaly_indices
-        #print(f"Day {day}: Anomalous points: {len(anomalies)}")
+    for window in windows:
+        yield window.new_values, IF.push(window.new_values, window.new_start)
 
 if __name__ == '__main__':
     pass
@@ -1,3 +1,20 @@
-from .IF_detector2 import detector
+from .registry import (
+  Detector, register_detector, get_detector, available_detectors, detector_from_config, run_stream,
+  check_detector_settings, detector_from_settings, reconfigure_detector
+)
+from .EMA_detector import EMADetector
+from .IF3 import IF3Detector
+from .IF_detector2 import IF2Detector, detector, windowed_detector
+from .IF_detector import TimeAwareForestDetector
+from .ensemble import EnsembleDetector
+from .quantiles import P2Quantile, QuantileThreshold, QuantileThresholdDetector
+from .change_point import ChangePointDetector
+from .events import AnomalyEvent, EventAggregator
 
-__all__ = ['detector']
\ No newline at end of file
+__all__ = [
+  'Detector', 'register_detector', 'get_detector', 'available_detectors', 'detector_from_config', 'run_stream',
+  'check_detector_settings', 'detector_from_settings', 'reconfigure_detector',
+  'EMADetector', 'IF3Detector', 'IF2Detector', 'TimeAwareForestDetector', 'EnsembleDetector',
+  'P2Quantile', 'QuantileThreshold', 'QuantileThresholdDetector', 'ChangePointDetector',
+  'detector', 'windowed_detector', 'AnomalyEvent', 'EventAggregator'
+]
@@ -0,0 +1,215 @@
+# Two sided CUSUM change point detector for sustained level shifts, e.g. leaks and surges
+from functools import lru_cache
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+from src.detector.features import MINUTES_PER_DAY, batch_features
+from src.detector.registry import register_detector
+from src.simulator.simulator import expected_flow_surface, setup
+from src.utils import count
+
+MAD_TO_STD = 1.4826 # Standard deviation of normal residuals from their median absolute deviation
+MEAN_AD_TO_STD = float(np.sqrt(np.pi / 2)) # and from their mean absolute deviation
+
+
+@lru_cache(maxsize=1)
+def _daily_baseline() -> np.ndarray:
+  return np.asarray(setup(), dtype=float)
+
+
+@lru_cache(maxsize=None)
+def _expected_day_of_year(day: int) -> np.ndarray:
+  # A surface per day of the year, so streams don't recompute it for every batch
+  expected = expected_flow_surface(_daily_baseline()[day])[0]
+  expected.setflags(write=False)
+  return expected
+
+
+def expected_day(day: int, baseline: Optional[np.ndarray] = None) -> np.ndarray:
+  """
+  Noise free flow of every minute of a day of the year, from the same
+  expected value surface the simulator draws its values around.
+
+  :param day: Day of the year, wrapping after 365 as the simulator does
+  :param baseline: Daily baseline, the simulator's lookup table if not given
+  :return: Array of 1440 expected values, read only when from the simulator's baseline
+  """
+  if baseline is None:
+    return _expected_day_of_year(day % len(_daily_baseline()))
+  baseline = np.asarray(baseline, dtype=float)
+  return expected_flow_surface(baseline[day % len(baseline)])[0]
+
+
+class CusumState:
+  """
+  Everything the detector carries between points, a handful of floats, so
+  each point costs O(1) time and memory however long the stream runs.
+  """
+  def __init__(self, level: float = 0.0, scale: float = 0.01):
+    self.level = level # Reference level of the relative residuals, following slow drift
+    self.scale = scale # Standard deviation of the relative residuals
+    self.upper = 0.0 # CUSUM of upward shifts, in standard deviations
+    self.lower = 0.0 # CUSUM of downward shifts
+    self.upper_start = 0 # Minute the upper sum last left zero, the estimated start of a surge
+    self.lower_start = 0
+    self.alarm = 0 # 1 during an upward shift, -1 during a downward shift
+    self.alarm_start = 0 # Minute the current shift was estimated to start
+    self.alarm_level = 0.0 # Level of the residuals during the shift
+
+  def copy(self) -> "CusumState":
+    state = CusumState()
+    state.__dict__.update(self.__dict__)
+    return state
+
+
+def initialize_state(residuals: np.ndarray) -> CusumState:
+  """Starts the reference level and noise scale from residuals, robust to a few anomalies in them"""
+  residuals = residuals[np.isfinite(residuals)]
+  level = float(np.median(residuals))
+  scale = float(np.median(np.abs(residuals - level))) * MAD_TO_STD
+  return CusumState(level, max(scale, 1e-6))
+
+
+@register_detector("change_point")
+class ChangePointDetector:
+  """
+  Page's two sided CUSUM on the residuals of the stream relative to its
+  expected value from the baseline. A leak or surge multiplies the flow for
+  hours, so each value is only a few percent off, but the sums of the
+  residuals past the slack grow until they cross the threshold. The shift is
+  then flagged from the minute the sum last left zero until the values return
+  to the reference level.
+
+  The reference level and noise scale follow slow drift from the baseline, but
+  not during a shift, so a long leak doesn't become the new normal unless it
+  outlasts max_alarm.
+  """
+  def __init__(
+      self,
+      threshold: float = 30.0,
+      slack: float = 2.0,
+      level_alpha: float = 0.001,
+      scale_alpha: float = 0.001,
+      max_alarm: Optional[int] = 1440 * 4,
+      start_day: int = 0
+  ):
+    """
+    :param threshold: CUSUM, in standard deviations, above which a shift is flagged
+    :param slack: Residual, in standard deviations, allowed per point before it adds to a sum
+    :param level_alpha: Learning rate of the reference level, per minute
+    :param scale_alpha: Learning rate of the noise scale, per minute
+    :param max_alarm: Minutes a shift is flagged for before it's taken as the new level, never if None
+    :param start_day: Day of the year of the stream's minute 0, to line it up with the baseline
+    """
+    self.params = {
+      "threshold": threshold,
+      "slack": slack,
+      "level_alpha": level_alpha,
+      "scale_alpha": scale_alpha,
+      "max_alarm": max_alarm,
+      "start_day": start_day
+    }
+    self.cusum = None
+
+  def residuals(self, batch) -> np.ndarray:
+    """Relative residual of each value from its expected value"""
+    def compute(batch):
+      days = batch.minutes // MINUTES_PER_DAY
+      expected = np.empty(len(batch))
+      for day in np.unique(days).tolist():
+        in_day = days == day
+        expected[in_day] = expected_day(self.params["start_day"] + day)[batch.minute_of_day[in_day]]
+      with np.errstate(divide="ignore", invalid="ignore"):
+        return batch.values / expected - 1
+    return batch.cached("change_point.residuals.{}".format(self.params["start_day"]), compute)
+
+  def _run(self, state: CusumState, batch, learn: bool):
+    """
+    Runs the CUSUM over a batch, updating state in place.
+
+    :return: (sum in the direction of the larger shift over the threshold at each point,
+              whether each point is in a shift)
+    """
+    threshold = self.params["threshold"]
+    slack = self.params["slack"]
+    level_alpha = self.params["level_alpha"]
+    scale_alpha = self.params["scale_alpha"]
+    max_alarm = self.params["max_alarm"]
+
+    scores = np.empty(len(batch))
+    flags = np.zeros(len(batch), dtype=bool)
+    minute = batch.start_minute
+    for i, residual in enumerate(self.residuals(batch).tolist()):
+      if not np.isfinite(residual):
+        residual = state.level # No expected value to compare with
+      z = (residual - state.level) / state.scale
+
+      # The sums are capped at the threshold, so they fall back to zero soon after a shift ends
+      if state.upper == 0:
+        state.upper_start = minute
+      if state.lower == 0:
+        state.lower_start = minute
+      state.upper = min(max(0.0, state.upper + z - slack), threshold)
+      state.lower = min(max(0.0, state.lower - z - slack), threshold)
+
+      if state.alarm == 0:
+        if state.upper >= threshold or state.lower >= threshold:
+          state.alarm = 1 if state.upper >= state.lower else -1
+          state.alarm_start = state.upper_start if state.alarm == 1 else state.lower_start
+          state.alarm_level = residual
+          # Flag back to the estimated start of the shift, within this batch
+          flags[max(0, state.alarm_start - batch.start_minute):i] = True
+        elif learn and state.upper == 0 and state.lower == 0:
+          # Only values that aren't part of a possible shift update the reference
+          state.level += level_alpha * (residual - state.level)
+          state.scale += scale_alpha * (abs(residual - state.level) * MEAN_AD_TO_STD - state.scale)
+      elif (state.upper if state.alarm == 1 else state.lower) == 0:
+        state.alarm = 0
+      else:
+        state.alarm_level += level_alpha * (residual - state.alarm_level)
+        if max_alarm is not None and minute - state.alarm_start >= max_alarm:
+          # The shift has lasted too long to be an anomaly, carry on from its level
+          state.level = state.alarm_level
+          state.upper = state.lower = 0.0
+          state.alarm = 0
+
+      flags[i] = state.alarm != 0
+      scores[i] = max(state.upper, state.lower) / threshold
+      minute += 1
+    return scores, flags
+
+  def fit(self, values: Sequence[float], start_minute: int = 0) -> None:
+    """Estimates the reference level and noise scale from nominal values, then adapts them to the values in turn"""
+    batch = batch_features(values, start_minute)
+    self.cusum = initialize_state(self.residuals(batch))
+    self._run(self.cusum, batch, learn=True)
+    self.cusum.upper = self.cusum.lower = 0.0
+    self.cusum.alarm = 0
+
+  def partial_fit(self, values: Sequence[float], start_minute: int = 0) -> None:
+    # The reference only learns from points that aren't in a shift
+    self.push(values, start_minute)
+
+  def score_batch(self, values: Sequence[float], start_minute: int = 0) -> np.ndarray:
+    """CUSUM of the larger shift at each point as a multiple of the threshold, 1 is a shift"""
+    state = self.cusum.copy() if self.cusum is not None else CusumState()
+    scores, _ = self._run(state, batch_features(values, start_minute), learn=False)
+    return scores
+
+  def push(self, values: Sequence[float], start_minute: int = 0) -> List[int]:
+    batch = batch_features(values, start_minute)
+    if self.cusum is None:
+      # Without fitting, the reference starts at the baseline and the scale is learnt from the stream
+      self.cusum = CusumState()
+    _, flags = self._run(self.cusum, batch, learn=True)
+    anomalies = (batch.start_minute + np.flatnonzero(flags)).tolist()
+    count("change_point.anomalies", len(anomalies))
+    return anomalies
+
+  def state(self) -> dict:
+    return {"params": dict(self.params), "cusum": None if self.cusum is None else self.cusum.copy()}
+
+  def load_state(self, state: dict) -> None:
+    self.params.update(state["params"])
+    self.cusum = None if state["cusum"] is None else state["cusum"].copy()
@@ -1,20 +1,28 @@
-from src.simulator.simulator import simulator
+import argparse
+import json
 import matplotlib.pyplot as plt
-import seaborn as sns
+from src.simulator.simulator import simulator
+from src.storage import DistributionProfile, StreamStore, plot_density
 # LEAVING THIS FILE IN HERE TO DEMONSTRATE HOW I GOT THE DISTRIBUTION FOR THE REPORT
 
-# Runs the simulation for 1 year to get the density plot for my report
+# Profiles a year of the simulation (or a recorded stream) to get the density plot for my report
 if __name__ == "__main__":
-  sim = simulator()
-  dataset = []
-  for _ in range(365):
-    dataset = dataset + next(sim)
-  #print(len(dataset)) # 525600, which is correct (365*1440)
+  parser = argparse.ArgumentParser(description="Density plot and moments of the simulated or a recorded stream")
+  parser.add_argument("--days", type=int, default=365, help="Days of the simulation to profile")
+  parser.add_argument("--store", default=None, help="StreamStore to profile instead of simulating")
+  parser.add_argument("--by", choices=["month", "hour", "minute_of_day"], default=None,
+                      help="Also profile each month, hour or minute of the day")
+  args = parser.parse_args()
+
+  if args.store is not None:
+    profile = DistributionProfile.from_store(StreamStore(args.store), by=args.by)
+  else:
+    # Each day is added to the histograms as it's simulated, so memory doesn't grow with the days
+    profile = DistributionProfile(by=args.by)
+    for day, values in zip(range(args.days), simulator(duration=args.days)):
+      profile.extend(values, day * 1440)
+  print(json.dumps(profile.summary()["overall"], indent=2))
 
   # Create the density plot
-  sns.kdeplot(dataset)
-  plt.title('Density Plot of Gas Flow Data')
-  plt.xlabel('Gas Flow (mcm/day)')
-  plt.ylabel('Density')
+  plot_density(profile, groups=profile.group_labels() if args.by == "month" else None)
   plt.show()
-
@@ -0,0 +1,147 @@
+# Per point update loop of the EMA detector, compiled with Numba when it's installed
+import numpy as np
+
+try:
+  import numba
+except ImportError:
+  numba = None
+
+PW_BLOCKSIZE = 128 # Block size of NumPy's pairwise summation
+
+
+def _njit(function):
+  """Compiles a function called by the compiled loop, or leaves it as Python without Numba"""
+  return numba.njit(cache=True)(function) if numba is not None else function
+
+
+@_njit
+def pairwise_sum(values: np.ndarray, start: int, n: int) -> float:
+  """
+  Sum of values[start:start + n] in the same order as NumPy's pairwise
+  summation, so a compiled kernel gets bit for bit the same results as np.sum.
+  """
+  if n < 8:
+    total = -0.0
+    for i in range(start, start + n):
+      total += values[i]
+    return total
+  elif n <= PW_BLOCKSIZE:
+    r0, r1, r2, r3 = values[start], values[start + 1], values[start + 2], values[start + 3]
+    r4, r5, r6, r7 = values[start + 4], values[start + 5], values[start + 6], values[start + 7]
+    i = 8
+    while i < n - n % 8:
+      r0 += values[start + i]
+      r1 += values[start + i + 1]
+      r2 += values[start + i + 2]
+      r3 += values[start + i + 3]
+      r4 += values[start + i + 4]
+      r5 += values[start + i + 5]
+      r6 += values[start + i + 6]
+      r7 += values[start + i + 7]
+      i += 8
+    total = ((r0 + r1) + (r2 + r3)) + ((r4 + r5) + (r6 + r7))
+    while i < n:
+      total += values[start + i]
+      i += 1
+    return total
+  else:
+    n2 = n // 2
+    n2 -= n2 % 8
+    return pairwise_sum(values, start, n2) + pairwise_sum(values, start + n2, n - n2)
+
+
+@_njit
+def pairwise_std(values: np.ndarray, start: int, end: int, scratch: np.ndarray) -> float:
+  """
+  np.std(values[start:end]) computed as NumPy does, for the compiled kernel.
+  The squared differences go in scratch, which needs room for end - start values.
+  Running sums would make this O(1) a point but round differently to np.std.
+  """
+  n = end - start
+  mean = pairwise_sum(values, start, n) / n
+  for k in range(n):
+    difference = values[start + k] - mean
+    scratch[k] = difference * difference
+  return np.sqrt(pairwise_sum(scratch, 0, n) / n)
+
+
+def numpy_std(values: np.ndarray, start: int, end: int, scratch: np.ndarray) -> float:
+  return np.std(values[start:end])
+
+
+def make_ema_loop(window_std):
+  """
+  Builds the per point loop of detect_anomalies around a standard deviation
+  of the deviation window. Each point's pattern and seasonal rate update depends
+  on whether the previous point was anomalous, so the loop is sequential.
+
+  :param window_std: Function of (deviations, start, end, scratch) giving their standard deviation, with
+    scratch an array of history_window values it can overwrite
+  :return: The loop, see ema_loop
+  """
+  def ema_loop(values, pattern, seasonal_rate, deviations, window_start, window_end, history_window,
+               total, count, day_max, threshold_std, pattern_update_alpha, seasonal_update_alpha, start_minute):
+    """
+    :param values: Values of the day, or part of it
+    :param pattern: Base pattern, updated in place
+    :param seasonal_rate: Current seasonal rate
+    :param deviations: Buffer of the day's deviations, with room for every value
+    :param window_start: Index of the oldest deviation in the threshold window
+    :param window_end: Index after the newest deviation
+    :param history_window: Deviations the threshold is calculated from
+    :param total: Sum of the day's values so far
+    :param count: Number of the day's values so far
+    :param day_max: Maximum of the day's values so far
+    :param start_minute: Minute of the day of values[0]
+    :return: (anomalous flag of each value, seasonal rate, window start, window end, total, count, maximum)
+    """
+    flags = np.zeros(len(values), dtype=np.bool_)
+    # Allocated once a call rather than a point, the window is up to a week of minutes
+    scratch = np.empty(history_window)
+    for offset in range(len(values)):
+      value = values[offset]
+      i = start_minute + offset
+      deviation = abs(value - pattern[i] * seasonal_rate)
+      deviations[window_end] = deviation
+      window_end += 1
+      if window_end - window_start > history_window:
+        window_start += 1
+      threshold = window_std(deviations, window_start, window_end, scratch) * threshold_std
+
+      total += value
+      count += 1
+      day_max = max(day_max, value)
+
+      # Update pattern and seasonality only if not an anomaly
+      if deviation > threshold:
+        flags[offset] = True
+      else:
+        pattern[i] = pattern_update_alpha * (value / seasonal_rate) + (1 - pattern_update_alpha) * pattern[i]
+        # On a day of zeros so far NumPy's 0 / 0 is NaN, which max(0.85, NaN) makes 0.85. Compiled or with
+        # Python floats it would raise, so the branch keeps every path identical
+        new_seasonal_rate = max(0.85, 1 - (total / count / day_max)) if day_max > 0 else 0.85
+        seasonal_rate = seasonal_update_alpha * new_seasonal_rate + (1 - seasonal_update_alpha) * seasonal_rate
+    return flags, seasonal_rate, window_start, window_end, total, count, day_max
+
+  return ema_loop
+
+
+python_ema_loop = make_ema_loop(numpy_std)
+
+if numba is not None:
+  # NumPy's pairwise summation is reproduced so the compiled thresholds are identical
+  compiled_ema_loop = numba.njit(make_ema_loop(pairwise_std))
+else:
+  compiled_ema_loop = None
+
+
+def ema_loop(jit=None):
+  """
+  :param jit: True for the compiled loop, False for Python, None compiles it if Numba is installed
+  :return: The loop
+  """
+  if jit is None:
+    jit = compiled_ema_loop is not None
+  if jit and compiled_ema_loop is None:
+    raise ValueError("The compiled EMA loop needs numba to be installed")
+  return compiled_ema_loop if jit else python_ema_loop
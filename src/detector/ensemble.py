@@ -0,0 +1,195 @@
+# Combines several registered detectors into one, sharing each batch's features between them
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence, Union
+
+import numpy as np
+from sklearn.linear_model import LogisticRegression
+
+from src.detector.features import batch_features
+from src.detector.registry import get_detector, register_detector
+from src.simulator.baseline_calculator import RunningStats
+from src.utils import timed, count
+
+ENSEMBLE_METHODS = ("vote", "weighted", "stacking")
+
+
+@register_detector("ensemble")
+class EnsembleDetector:
+  """
+  Runs member detectors on the same BatchFeatures, so the NumPy conversion,
+  minute features and each detector family's features are computed once per
+  batch. Members run on a thread pool, which overlaps the members that release
+  the GIL (the sklearn forests and NumPy scoring).
+
+  Methods of combining the members:
+    vote: a point is anomalous when at least min_votes members flag it
+    weighted: weighted average of each member's score, standardised by the
+              running mean and deviation of its scores, over score_threshold
+    stacking: logistic regression on the members' scores, trained on labelled
+              data with fit_combiner
+  """
+  def __init__(
+      self,
+      members: Union[Sequence, Dict[str, dict]] = ("EMA_detector", "IF_detector2", "IF_detector"),
+      method: str = "vote",
+      weights: Optional[Sequence[float]] = None,
+      min_votes: Optional[int] = None,
+      score_threshold: float = 3.0,
+      n_threads: Optional[int] = None
+  ):
+    """
+    :param members: Registered detector names, a dictionary of names to their
+                    parameters, or Detector instances
+    :param method: "vote", "weighted" or "stacking"
+    :param weights: Weight of each member for the weighted method, equal by default
+    :param min_votes: Members that must flag a point for the vote method, a majority by default
+    :param score_threshold: Weighted standardised score above which a point is anomalous
+    :param n_threads: Threads members run on, one per member by default, 1 runs them in turn
+    """
+    if method not in ENSEMBLE_METHODS:
+      raise ValueError("Unknown ensemble method {}, expected one of {}".format(method, ENSEMBLE_METHODS))
+    if isinstance(members, dict):
+      members = [(name, params) for name, params in members.items()]
+    self.members = [
+      get_detector(member) if isinstance(member, str)
+      else get_detector(member[0], **member[1]) if isinstance(member, tuple)
+      else member
+      for member in members
+    ]
+    if not self.members:
+      raise ValueError("An ensemble needs at least one member")
+    if weights is not None and len(weights) != len(self.members):
+      raise ValueError("An ensemble needs one weight per member")
+
+    self.params = {
+      "members": [getattr(member, "name", type(member).__name__) for member in self.members],
+      "method": method,
+      "weights": list(weights) if weights is not None else [1.0] * len(self.members),
+      "min_votes": min_votes if min_votes is not None else len(self.members) // 2 + 1,
+      "score_threshold": score_threshold,
+      "n_threads": n_threads
+    }
+    self.score_stats = [RunningStats() for _ in self.members]
+    self.combiner = None
+    threads = n_threads if n_threads is not None else len(self.members)
+    self.pool = ThreadPoolExecutor(max_workers=threads) if threads > 1 else None
+
+  def _map(self, function) -> list:
+    if self.pool is None:
+      return [function(member) for member in self.members]
+    return list(self.pool.map(function, self.members))
+
+  def _member_scores(self, batch) -> np.ndarray:
+    """Scores of every member, one row each. Members that can't score yet (e.g. still warming up) are NaN."""
+    def score(member):
+      try:
+        return np.asarray(member.score_batch(batch), dtype=float)
+      except ValueError:
+        return np.full(len(batch), np.nan)
+    return np.vstack(self._map(score))
+
+  def _standardise(self, scores: np.ndarray) -> np.ndarray:
+    standardised = np.full(scores.shape, np.nan)
+    for index, (row, stats) in enumerate(zip(scores, self.score_stats)):
+      # Until a member has a history of scores, standardise against the batch itself
+      mean, std = (stats.mean, stats.std) if stats.count >= 2 else (np.nanmean(row), np.nanstd(row))
+      if np.isfinite(std) and std > 0:
+        standardised[index] = (row - mean) / std
+    return standardised
+
+  def _combine(self, scores: np.ndarray) -> np.ndarray:
+    """Weighted average of the standardised scores, ignoring members without a score"""
+    standardised = self._standardise(scores)
+    weights = np.array(self.params["weights"])[:, None] * np.isfinite(standardised)
+    total = weights.sum(axis=0)
+    with np.errstate(invalid="ignore"):
+      combined = np.nansum(standardised * weights, axis=0) / total
+    return np.where(total > 0, combined, 0.0)
+
+  def _stack(self, scores: np.ndarray) -> np.ndarray:
+    if self.combiner is None:
+      raise ValueError("The stacking ensemble must be trained with fit_combiner first")
+    return self.combiner.predict_proba(np.nan_to_num(scores).T)[:, 1]
+
+  def fit(self, values: Sequence[float], start_minute: int = 0) -> None:
+    batch = batch_features(values, start_minute)
+    self._map(lambda member: member.fit(batch))
+
+  def partial_fit(self, values: Sequence[float], start_minute: int = 0) -> None:
+    batch = batch_features(values, start_minute)
+    self._map(lambda member: member.partial_fit(batch))
+
+  def fit_combiner(self, values: Sequence[float], labels: Sequence[int], start_minute: int = 0) -> None:
+    """
+    Trains the stacking combiner on the fitted members' scores of a labelled batch.
+
+    :param values: Values of the batch
+    :param labels: Ground truth of each value, non zero is anomalous
+    :param start_minute: Minute of values[0], counted from the start of the stream
+    """
+    scores = self._member_scores(batch_features(values, start_minute))
+    labels = np.asarray(labels) != 0
+    if labels.all() or not labels.any():
+      raise ValueError("The stacking combiner needs both normal and anomalous labels")
+    self.combiner = LogisticRegression(class_weight="balanced").fit(np.nan_to_num(scores).T, labels)
+
+  def score_batch(self, values: Sequence[float], start_minute: int = 0) -> np.ndarray:
+    """Probability of an anomaly when stacking, otherwise the weighted standardised score"""
+    scores = self._member_scores(batch_features(values, start_minute))
+    if self.params["method"] == "stacking":
+      return self._stack(scores)
+    return self._combine(scores)
+
+  def push(self, values: Sequence[float], start_minute: int = 0) -> List[int]:
+    batch = batch_features(values, start_minute)
+    method = self.params["method"]
+
+    # Scores come from the members' state before they learn from this batch
+    scores = self._member_scores(batch) if method != "vote" else None
+    member_flags = self._map(lambda member: member.push(batch))
+
+    with timed("ensemble.combine"):
+      if method == "vote":
+        votes = np.zeros(len(batch), dtype=int)
+        for flagged in member_flags:
+          # Members can flag earlier minutes late, e.g. the EMA detector once its warm up day is complete
+          offsets = np.asarray(flagged, dtype=int) - batch.start_minute
+          votes[offsets[(offsets >= 0) & (offsets < len(batch))]] += 1
+        anomalous = votes >= self.params["min_votes"]
+      elif method == "weighted":
+        anomalous = self._combine(scores) > self.params["score_threshold"]
+      else:
+        anomalous = self._stack(scores) >= 0.5
+
+      if scores is not None:
+        for row, stats in zip(scores, self.score_stats):
+          stats.update(row[np.isfinite(row)])
+
+    anomalies = (batch.start_minute + np.flatnonzero(anomalous)).tolist()
+    count("ensemble.anomalies", len(anomalies))
+    return anomalies
+
+  def state(self) -> dict:
+    return {
+      "params": dict(self.params),
+      "members": [member.state() for member in self.members],
+      "score_stats": [vars(stats).copy() for stats in self.score_stats],
+      "combiner": self.combiner
+    }
+
+  def load_state(self, state: dict) -> None:
+    if len(state["members"]) != len(self.members):
+      raise ValueError("The state has {} members, the ensemble has {}".format(len(state["members"]), len(self.members)))
+    self.params.update(state["params"])
+    for member, member_state in zip(self.members, state["members"]):
+      member.load_state(member_state)
+    for stats, values in zip(self.score_stats, state["score_stats"]):
+      vars(stats).update(values)
+    self.combiner = state["combiner"]
+
+  def close(self) -> None:
+    if self.pool is not None:
+      self.pool.shutdown()
+    for member in self.members:
+      if hasattr(member, "close"):
+        member.close()
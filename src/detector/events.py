@@ -0,0 +1,172 @@
+# Collapses per minute anomaly flags into anomaly events
+import copy
+from dataclasses import dataclass, field
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+MINUTES_PER_DAY = 1440
+OUTAGE_RATIO = 0.1 # Flow below 10% of expected is an outage
+SENSOR_FAULT_RATIO_STD = 0.5 # Sensor faults scatter far more than the daily peak pattern
+
+
+@dataclass
+class AnomalyEvent:
+  """A run of flagged minutes, allowing short gaps between flags"""
+  start: int # First flagged minute, counted from the start of the stream
+  end: int # Last flagged minute
+  flagged: int = 0 # Number of flagged minutes
+  peak_score: Optional[float] = None
+  closed: bool = False
+  # Running statistics of value / expected value, used to guess the anomaly type
+  _ratio_count: int = field(default=0, repr=False)
+  _ratio_sum: float = field(default=0.0, repr=False)
+  _ratio_sum_sq: float = field(default=0.0, repr=False)
+
+  @property
+  def duration(self) -> int:
+    return self.end - self.start + 1
+
+  def add(self, minute: int, ratio: Optional[float], score: Optional[float]) -> None:
+    self.end = max(self.end, minute)
+    self.flagged += 1
+    if score is not None and (self.peak_score is None or score > self.peak_score):
+      self.peak_score = score
+    if ratio is not None:
+      self._ratio_count += 1
+      self._ratio_sum += ratio
+      self._ratio_sum_sq += ratio * ratio
+
+  @property
+  def mean_ratio(self) -> Optional[float]:
+    if self._ratio_count == 0:
+      return None
+    return self._ratio_sum / self._ratio_count
+
+  @property
+  def ratio_std(self) -> Optional[float]:
+    if self._ratio_count == 0:
+      return None
+    mean = self.mean_ratio
+    return max(self._ratio_sum_sq / self._ratio_count - mean * mean, 0.0) ** 0.5
+
+  @property
+  def type(self) -> str:
+    """
+    Best guess of the anomaly type from how far flagged values are from the
+    expected values, matching the injected anomalies: outages drop to 0, leaks
+    and surges shift the level, sensor faults scatter around it.
+    """
+    mean = self.mean_ratio
+    if mean is None:
+      return "unknown"
+    if self.ratio_std > SENSOR_FAULT_RATIO_STD:
+      return "sensor_fault"
+    if mean < OUTAGE_RATIO:
+      return "outage"
+    return "leak" if mean < 1 else "surge"
+
+  def to_dict(self) -> dict:
+    return {
+      "start": self.start,
+      "end": self.end,
+      "duration": self.duration,
+      "flagged": self.flagged,
+      "peak_score": self.peak_score,
+      "type": self.type,
+      "closed": self.closed
+    }
+
+  def describe(self) -> str:
+    """Short description for operators"""
+    day, minute = divmod(self.start, MINUTES_PER_DAY)
+    state = "ended" if self.closed else "ongoing"
+    return "{} at day {} {:02d}:{:02d}, {} min ({})".format(
+      self.type, day, minute // 60, minute % 60, self.duration, state)
+
+
+class EventAggregator:
+  """
+  Merges flagged minutes into events incrementally. Flags at most max_gap
+  minutes apart belong to the same event, and events stay open across batch
+  and day boundaries until a gap longer than max_gap has been seen.
+  """
+  def __init__(self, max_gap: int = 5):
+    self.max_gap = max_gap
+    self.open_event: Optional[AnomalyEvent] = None
+    self.seen_until = 0 # Minute after the last value pushed
+
+  def push(
+      self,
+      batch_start: int,
+      batch_values: Sequence[float],
+      flagged_minutes: Sequence[int],
+      scores: Optional[Sequence[float]] = None,
+      expected: Optional[Sequence[float]] = None
+  ) -> List[AnomalyEvent]:
+    """
+    Adds a detector batch.
+
+    Args:
+        batch_start: Minute of batch_values[0], counted from the start of the stream
+        batch_values: Every value of the batch
+        flagged_minutes: Sorted flagged minutes, counted from the start of the stream
+        scores: Optional anomaly score of each flagged minute
+        expected: Optional expected value of each batch value, defaults to the
+                  median of the batch's unflagged values
+
+    Returns:
+        Events that were closed by this batch
+    """
+    values = np.asarray(batch_values, dtype=float)
+    offsets = np.asarray(flagged_minutes, dtype=int) - batch_start
+    if len(offsets) and (offsets.min() < 0 or offsets.max() >= len(values)):
+      raise ValueError("Flagged minutes must be inside the batch")
+
+    if expected is None:
+      normal = np.ones(len(values), dtype=bool)
+      normal[offsets] = False
+      reference = np.median(values[normal]) if normal.any() else None
+      expected = np.full(len(values), np.nan if reference is None else reference)
+    expected = np.asarray(expected, dtype=float)
+
+    closed = []
+    for index, offset in enumerate(offsets):
+      minute = batch_start + int(offset)
+      ratio = None
+      if np.isfinite(expected[offset]) and expected[offset] != 0:
+        ratio = float(values[offset] / expected[offset])
+      score = None if scores is None else float(scores[index])
+
+      if self.open_event is not None and minute - self.open_event.end > self.max_gap:
+        closed.append(self._close())
+      if self.open_event is None:
+        self.open_event = AnomalyEvent(start=minute, end=minute)
+      self.open_event.add(minute, ratio, score)
+
+    self.seen_until = max(self.seen_until, batch_start + len(values))
+    # Close the event once the gap after it is long enough
+    if self.open_event is not None and self.seen_until - 1 - self.open_event.end > self.max_gap:
+      closed.append(self._close())
+    return closed
+
+  def _close(self) -> AnomalyEvent:
+    event = self.open_event
+    event.closed = True
+    self.open_event = None
+    return event
+
+  def state(self) -> dict:
+    """The open event and how far the stream has been seen, picklable, e.g. for checkpoints"""
+    return {"open_event": copy.copy(self.open_event), "seen_until": self.seen_until}
+
+  def load_state(self, state: dict) -> None:
+    """Restores a state returned by state, so an event open when it was taken carries on"""
+    self.open_event = copy.copy(state["open_event"])
+    self.seen_until = state["seen_until"]
+
+  def flush(self) -> List[AnomalyEvent]:
+    """Closes the open event at the end of a stream"""
+    if self.open_event is None:
+      return []
+    return [self._close()]
@@ -0,0 +1,48 @@
+# Per batch features shared by the detectors, so an ensemble computes them once
+import threading
+from typing import Callable, Sequence, Union
+
+import numpy as np
+
+MINUTES_PER_DAY = 1440
+
+
+class BatchFeatures:
+  """
+  A batch of values with its time features. Detector specific features
+  are computed once through cached and shared by every detector given the batch.
+  """
+  def __init__(self, values: Sequence[float], start_minute: int = 0):
+    self.values = np.asarray(values, dtype=float)
+    self.start_minute = start_minute
+    self.minutes = np.arange(start_minute, start_minute + len(self.values)) # Minutes since the start of the stream
+    self.minute_of_day = self.minutes % MINUTES_PER_DAY
+    self._cache = {}
+    self._lock = threading.RLock() # Features can be computed from other cached features
+
+  def __len__(self):
+    return len(self.values)
+
+  def cached(self, key: str, compute: Callable[["BatchFeatures"], object]):
+    """
+    Computes a feature the first time it's asked for, detectors running in
+    other threads wait for it instead of computing it again.
+
+    :param key: Name of the feature, e.g. "IF3.points"
+    :param compute: Function of the batch returning the feature
+    """
+    with self._lock:
+      if key not in self._cache:
+        self._cache[key] = compute(self)
+      return self._cache[key]
+
+  def value_list(self) -> list:
+    """Values as Python floats, for the pure Python detectors"""
+    return self.cached("value_list", lambda batch: batch.values.tolist())
+
+
+def batch_features(values: Union[Sequence[float], BatchFeatures], start_minute: int = 0) -> BatchFeatures:
+  """Returns values unchanged if they're already BatchFeatures, otherwise builds them"""
+  if isinstance(values, BatchFeatures):
+    return values
+  return BatchFeatures(values, start_minute)
@@ -0,0 +1,231 @@
+# Constant memory streaming quantiles, for thresholds that adapt to the scores a detector actually sees
+import copy
+from typing import List, Optional, Sequence, Union
+
+import numpy as np
+
+from src.detector.features import batch_features
+from src.detector.registry import get_detector, register_detector
+from src.utils import count
+
+
+class P2Quantile:
+  """
+  Jain and Chlamtac's P² estimate of a quantile. Five markers are kept and
+  moved towards their ideal positions with piecewise parabolic interpolation,
+  so each update is O(1) and memory is constant however long the stream is.
+  """
+  def __init__(self, quantile: float):
+    if not 0 < quantile < 1:
+      raise ValueError("The quantile must be between 0 and 1")
+    self.quantile = quantile
+    self.count = 0
+    self.heights = [] # Marker heights, the first 5 values until there are 5
+    self.positions = [1, 2, 3, 4, 5]
+    self.desired = [1, 1 + 2 * quantile, 1 + 4 * quantile, 3 + 2 * quantile, 5]
+    self.increments = [0, quantile / 2, quantile, (1 + quantile) / 2, 1]
+
+  def _parabolic(self, i: int, d: int) -> float:
+    n, h = self.positions, self.heights
+    return h[i] + d / (n[i + 1] - n[i - 1]) * (
+      (n[i] - n[i - 1] + d) * (h[i + 1] - h[i]) / (n[i + 1] - n[i])
+      + (n[i + 1] - n[i] - d) * (h[i] - h[i - 1]) / (n[i] - n[i - 1])
+    )
+
+  def _linear(self, i: int, d: int) -> float:
+    n, h = self.positions, self.heights
+    return h[i] + d * (h[i + d] - h[i]) / (n[i + d] - n[i])
+
+  def update(self, value: float) -> None:
+    self.count += 1
+    h = self.heights
+    if self.count <= 5:
+      h.append(value)
+      h.sort()
+      return
+
+    # Cell the value falls in, extending the extremes
+    if value < h[0]:
+      h[0] = value
+      k = 0
+    elif value >= h[4]:
+      h[4] = value
+      k = 3
+    else:
+      k = 0
+      while value >= h[k + 1]:
+        k += 1
+
+    n = self.positions
+    for i in range(k + 1, 5):
+      n[i] += 1
+    for i in range(5):
+      self.desired[i] += self.increments[i]
+
+    # Move the middle markers that are a position or more from where they should be
+    for i in range(1, 4):
+      offset = self.desired[i] - n[i]
+      if (offset >= 1 and n[i + 1] - n[i] > 1) or (offset <= -1 and n[i - 1] - n[i] < -1):
+        d = 1 if offset > 0 else -1
+        height = self._parabolic(i, d)
+        h[i] = height if h[i - 1] < height < h[i + 1] else self._linear(i, d)
+        n[i] += d
+
+  def extend(self, values: Sequence[float]) -> None:
+    for value in np.asarray(values, dtype=float).tolist():
+      self.update(value)
+
+  def value(self) -> float:
+    """The quantile estimate, NaN before any values"""
+    if self.count == 0:
+      return float("nan")
+    if self.count <= 5:
+      return float(np.quantile(self.heights, self.quantile))
+    return self.heights[2]
+
+
+class QuantileThreshold:
+  """
+  Threshold at a tail quantile of recent values, times a margin. To follow
+  drift without keeping a history window, the threshold is served by one P²
+  sketch while a second fills, and the second takes over every epoch values.
+  """
+  def __init__(self, quantile: float = 0.999, margin: float = 1.05, epoch: Optional[int] = None, warmup: int = 100):
+    """
+    :param quantile: Quantile of the values to threshold at
+    :param margin: Multiple of the quantile above which a value is over the threshold, over 1
+    :param epoch: Values each sketch summarises before it's replaced, never replaced if not given
+    :param warmup: Values seen before there is a threshold
+    """
+    if margin <= 1:
+      raise ValueError("The margin must be over 1")
+    if epoch is not None and epoch <= warmup:
+      raise ValueError("The epoch must be longer than the warmup")
+    self.quantile = quantile
+    self.margin = margin
+    self.epoch = epoch
+    self.warmup = warmup
+    self.active = P2Quantile(quantile)
+    self.next = P2Quantile(quantile) if epoch is not None else None
+
+  def update(self, value: float) -> None:
+    self.active.update(value)
+    if self.next is not None:
+      self.next.update(value)
+      if self.next.count >= self.epoch:
+        self.active, self.next = self.next, P2Quantile(self.quantile)
+
+  def value(self) -> float:
+    """The threshold, infinite until warmed up"""
+    if self.active.count < self.warmup:
+      return float("inf")
+    return self.active.value() * self.margin
+
+  def exceeds(self, values: Sequence[float], learn: bool = True) -> np.ndarray:
+    """
+    Checks each value against the threshold in order, then learns from it.
+    Values over the threshold are learnt as the threshold, so they count
+    towards the tail (leaving them out would bias the quantile down) but a
+    long anomaly can't stretch the threshold it's judged against. As the
+    margin is over 1 the quantile still converges on the true one.
+
+    :param values: Values to check
+    :param learn: Whether to update the threshold with the values
+    :return: Boolean array, True where a value is over the threshold
+    """
+    values = np.asarray(values, dtype=float)
+    over = np.zeros(len(values), dtype=bool)
+    for index, value in enumerate(values.tolist()):
+      threshold = self.value()
+      if value > threshold:
+        over[index] = True
+        value = threshold
+      if learn and np.isfinite(value):
+        self.update(value)
+    return over
+
+
+@register_detector("quantile_threshold")
+class QuantileThresholdDetector:
+  """
+  Flags a base detector's scores over a streaming quantile of its past
+  scores, in place of its own threshold (the EMA detector's standard
+  deviations or the forests' contamination). The base detector still learns
+  from every batch.
+  """
+  def __init__(
+      self,
+      base: Union[str, object] = "IF_detector2",
+      base_params: Optional[dict] = None,
+      quantile: float = 0.999,
+      margin: float = 1.05,
+      epoch: Optional[int] = 1440 * 7,
+      warmup: int = 1440
+  ):
+    """
+    :param base: Registered detector name or a Detector instance
+    :param base_params: Parameters of the named base detector
+    :param quantile: Quantile of past scores to threshold at
+    :param margin: Multiple of the quantile above which a score is anomalous, over 1
+    :param epoch: Scores each quantile sketch summarises before a newer one replaces it
+    :param warmup: Scores seen before the quantile is used, the base detector's flags are used until then
+    """
+    self.base = get_detector(base, **(base_params or {})) if isinstance(base, str) else base
+    self.params = {
+      "base": getattr(self.base, "name", type(self.base).__name__),
+      "quantile": quantile,
+      "margin": margin,
+      "epoch": epoch,
+      "warmup": warmup
+    }
+    self.threshold = QuantileThreshold(quantile, margin, epoch, warmup)
+
+  def _learn_scores(self, batch) -> None:
+    try:
+      scores = self.base.score_batch(batch)
+    except ValueError:
+      return
+    for score in np.asarray(scores, dtype=float).tolist():
+      if np.isfinite(score):
+        self.threshold.update(score)
+
+  def fit(self, values: Sequence[float], start_minute: int = 0) -> None:
+    batch = batch_features(values, start_minute)
+    self.base.fit(batch)
+    self.threshold = QuantileThreshold(*(self.params[key] for key in ("quantile", "margin", "epoch", "warmup")))
+    self._learn_scores(batch)
+
+  def partial_fit(self, values: Sequence[float], start_minute: int = 0) -> None:
+    batch = batch_features(values, start_minute)
+    self.base.partial_fit(batch)
+    self._learn_scores(batch)
+
+  def score_batch(self, values: Sequence[float], start_minute: int = 0) -> np.ndarray:
+    """The base detector's scores"""
+    return self.base.score_batch(values, start_minute)
+
+  def push(self, values: Sequence[float], start_minute: int = 0) -> List[int]:
+    batch = batch_features(values, start_minute)
+    try:
+      scores = self.base.score_batch(batch)
+    except ValueError:
+      scores = None # The base detector is still warming up
+    base_flags = self.base.push(batch)
+    self.threshold.margin = self.params["margin"] # Can be changed while running
+
+    if scores is None or self.threshold.value() == float("inf"):
+      if scores is not None:
+        self.threshold.exceeds(scores)
+      return base_flags
+
+    anomalies = (batch.start_minute + np.flatnonzero(self.threshold.exceeds(scores))).tolist()
+    count("quantile_threshold.anomalies", len(anomalies))
+    return anomalies
+
+  def state(self) -> dict:
+    return {"params": dict(self.params), "base": self.base.state(), "threshold": copy.deepcopy(self.threshold)}
+
+  def load_state(self, state: dict) -> None:
+    self.params.update(state["params"])
+    self.base.load_state(state["base"])
+    self.threshold = copy.deepcopy(state["threshold"])
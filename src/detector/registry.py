@@ -0,0 +1,171 @@
+# Common streaming interface of the detectors, and a registry to choose them by name
+import inspect
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Protocol, Sequence, Tuple, runtime_checkable
+
+import numpy as np
+
+from src.simulator.windowing import Window
+from src.utils import load_config
+from src.utils.settings import Settings, matches_type, type_name
+
+DEFAULT_DETECTOR = "IF_detector2"
+# Parameters sizing a detector's buffers or members, which only take effect when it's created
+RESTART_PARAMS = {"history_window", "history_size", "members", "n_threads", "base", "quantile", "epoch", "warmup"}
+
+_detectors: Dict[str, Callable[..., "Detector"]] = {}
+
+
+@runtime_checkable
+class Detector(Protocol):
+  """
+  Streaming anomaly detector. Batches are any length and are identified by the
+  minute of their first value, counted from the start of the stream, so the
+  same detector runs on whole days, sliding windows or single points.
+  """
+
+  def fit(self, values: Sequence[float], start_minute: int = 0) -> None:
+    """Trains from scratch on nominal data"""
+
+  def partial_fit(self, values: Sequence[float], start_minute: int = 0) -> None:
+    """Updates the model with new nominal data"""
+
+  def score_batch(self, values: Sequence[float], start_minute: int = 0) -> np.ndarray:
+    """Anomaly score of every value, higher is more anomalous. Doesn't change the detector's state."""
+
+  def push(self, values: Sequence[float], start_minute: int = 0) -> List[int]:
+    """Detects anomalies in the next batch of the stream and learns from it, returning the flagged minutes"""
+
+  def state(self) -> dict:
+    """Everything needed to carry on detecting, picklable"""
+
+  def load_state(self, state: dict) -> None:
+    """Restores a state returned by state"""
+
+
+def register_detector(name: str):
+  """Class decorator adding a detector to the registry under name"""
+  def decorator(factory):
+    if name in _detectors:
+      raise ValueError("Detector {} is already registered".format(name))
+    _detectors[name] = factory
+    factory.name = name
+    return factory
+  return decorator
+
+
+def available_detectors() -> List[str]:
+  return list(_detectors)
+
+
+def get_detector(name: str, **params) -> Detector:
+  """
+  Creates a registered detector.
+
+  Args:
+      name: Registered name, e.g. "EMA_detector"
+      params: Keyword arguments of the detector, e.g. threshold_std for the EMA detector
+
+  Returns:
+      Detector
+  """
+  if name not in _detectors:
+    raise ValueError("Unknown detector {}, expected one of {}".format(name, available_detectors()))
+  return _detectors[name](**params)
+
+
+def detector_from_config(config: Optional[dict] = None) -> Detector:
+  """
+  Creates the detector named by the config's "detector" key, with its
+  parameters from "detector_params", e.g.
+  {"detector": "EMA_detector", "detector_params": {"EMA_detector": {"threshold_std": 6}}}
+
+  Args:
+      config: Config dictionary, loaded from config.json if not given
+
+  Returns:
+      Detector
+  """
+  if config is None:
+    config = load_config()
+  name = config.get("detector", DEFAULT_DETECTOR)
+  params = config.get("detector_params", {}).get(name, {})
+  return get_detector(name, **params)
+
+
+def _parameter_type(parameter: inspect.Parameter):
+  """A detector argument's annotation, or the type of its default if it has none"""
+  if parameter.annotation is not inspect.Parameter.empty:
+    return parameter.annotation
+  if parameter.default is inspect.Parameter.empty or parameter.default is None:
+    return object
+  return type(parameter.default)
+
+
+def check_detector_settings(settings: Settings) -> None:
+  """
+  Checks the settings' detector is registered and every detector's parameters
+  are arguments it takes, of the type it expects, raising ValueError otherwise.
+  Parameters are applied to a running detector, so a wrong type would otherwise
+  only fail on a later batch.
+  """
+  if settings.detector not in _detectors:
+    raise ValueError("Unknown detector {}, expected one of {}".format(settings.detector, available_detectors()))
+  for name, params in settings.detector_params.items():
+    if name not in _detectors:
+      raise ValueError("Parameters given for unknown detector {}".format(name))
+    accepted = inspect.signature(_detectors[name]).parameters
+    unknown = set(params) - set(accepted)
+    if unknown:
+      raise ValueError("Unknown parameters {} for detector {}".format(sorted(unknown), name))
+    for param, value in params.items():
+      expected = _parameter_type(accepted[param])
+      if not matches_type(value, expected):
+        raise ValueError("Parameter {} of detector {} must be {}, got {!r}".format(param, name, type_name(expected), value))
+
+
+def detector_from_settings(settings: Settings) -> Detector:
+  """Creates the settings' detector with its parameters, after checking them"""
+  check_detector_settings(settings)
+  return get_detector(settings.detector, **settings.detector_config())
+
+
+def reconfigure_detector(detector: Detector, params: dict) -> List[str]:
+  """
+  Applies new parameters to a running detector without resetting its state.
+  The detectors read their parameters on every batch, so the new values are
+  used from the next batch on (and the next retrain for the model sizes).
+
+  Args:
+      detector: Detector to update
+      params: Parameters that changed
+
+  Returns:
+      Names of the parameters that can't change while it runs, which weren't applied
+  """
+  skipped = sorted(name for name in params if name in RESTART_PARAMS or name not in detector.params)
+  detector.params.update({name: value for name, value in params.items() if name not in skipped})
+  return skipped
+
+
+def run_stream(
+    detector: Detector,
+    source: Iterable,
+    start_minute: int = 0
+) -> Iterator[Tuple[Sequence[float], List[int]]]:
+  """
+  Pushes every batch of a source through a detector.
+
+  Args:
+      detector: Detector to push to
+      source: Iterator of day lists or arrays (e.g. anomalous_simulator or replay), or of Window
+      start_minute: Minute of the first day's first value
+
+  Yields:
+      Tuple of (new values of the batch, anomalous minutes counted from the start of the stream)
+  """
+  for batch in source:
+    if isinstance(batch, Window):
+      yield batch.new_values, detector.push(batch.new_values, batch.new_start)
+    else:
+      yield batch, detector.push(batch, start_minute)
+      start_minute += len(batch)
@@ -1,4 +1,14 @@
 from .simulator import simulator
-from .anomalies import anomalous_simulator, ANOMALY_THRESHOLD, ANOMALY_MULTIPLIER_BOUNDS
+from .anomalies import (
+  anomalous_simulator, labelled_anomalous_simulator,
+  ANOMALY_THRESHOLD, ANOMALY_MULTIPLIER_BOUNDS, ANOMALY_TYPES,
+  PendingAnomaly, SimulationState
+)
+from .windowing import Window, sliding_windows, windowed_anomalous_simulator
 
-__all__ = ['simulator', 'anomalous_simulator', 'ANOMALY_THRESHOLD', 'ANOMALY_MULTIPLIER_BOUNDS']
+__all__ = [
+  'simulator', 'anomalous_simulator', 'labelled_anomalous_simulator',
+  'ANOMALY_THRESHOLD', 'ANOMALY_MULTIPLIER_BOUNDS', 'ANOMALY_TYPES',
+  'PendingAnomaly', 'SimulationState',
+  'Window', 'sliding_windows', 'windowed_anomalous_simulator'
+]
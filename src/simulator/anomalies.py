@@ -1,23 +1,21 @@
 import random
+import numpy as np
+from dataclasses import dataclass
+from typing import Optional
 from src.simulator import simulator
-from src.utils import load_config
-
-# Global Sim Values
-try:
-  MAX_CAPACITY = float(load_config()['max_capacity'])
-except KeyError:
-  MAX_CAPACITY = 75
-
-ANOMALY_MULTIPLIER_BOUNDS = [
-  (0,0), # outage
-  (0.9,0.95), # leak
-  (1.05,1.1), # surge
-  (-5,5) # sensor fault
-]
-ANOMALY_MIN_DURATION = 1 # minutes
-ANOMALY_MAX_DURATION = 5000 # minutes
-ANOMALY_THRESHOLD = 0.005
+from src.utils import load_settings, instrument, count
+from src.utils.settings import ANOMALY_TYPES
 
+# Global Sim Values, from the simulator settings in config.json
+SIMULATOR_SETTINGS = load_settings().simulator
+MAX_CAPACITY = float(SIMULATOR_SETTINGS.max_capacity)
+
+ANOMALY_MULTIPLIER_BOUNDS = SIMULATOR_SETTINGS.multiplier_bounds() # Same order as ANOMALY_TYPES
+ANOMALY_MIN_DURATION = SIMULATOR_SETTINGS.anomaly_min_duration # minutes
+ANOMALY_MAX_DURATION = SIMULATOR_SETTINGS.anomaly_max_duration # minutes
+ANOMALY_THRESHOLD = SIMULATOR_SETTINGS.anomaly_threshold
+
+@instrument("anomalies.inject")
 def inject_anomaly(stream, anomaly_multiplier, start, duration):
   """
   Applies a multiplier to values in the datastream, depending on start and duration conditions.
@@ -35,9 +33,12 @@ def inject_anomaly(stream, anomaly_multiplier, start, duration):
 
   # Handles incorrect start values
   if start < stream_length:
-    for i in range(start, end):
-      anomaly = min(MAX_CAPACITY, stream[i] * anomaly_multiplier) # Max capacity is 75
-      stream[i] = anomaly
+    if isinstance(stream, np.ndarray):
+      stream[start:end] = np.minimum(MAX_CAPACITY, stream[start:end] * anomaly_multiplier)
+    else:
+      for i in range(start, end):
+        anomaly = min(MAX_CAPACITY, stream[i] * anomaly_multiplier) # Max capacity is 75
+        stream[i] = anomaly
   else:
     duration = 0 # No remaining duration for incorrect start
 
@@ -49,34 +50,95 @@ def anomalous_simulator(start_day = 0, duration = 365):
 
   :param start_day: The day of the year to start the simulation
   :param duration: Length of the simulation (Each event represents a minute)
-  :return: 24 hours of Gas Flow data represented as a list of floats, chance to have anomalies
+  :return: 24 hours of Gas Flow data as a float64 array, chance to have anomalies
+  """
+  for datastream, _ in labelled_anomalous_simulator(start_day, duration):
+    yield datastream
+
+@dataclass
+class PendingAnomaly:
+  """An anomaly that carries on into the next day"""
+  anomaly_type: int # Index in ANOMALY_TYPES
+  multiplier: float
+  remaining: int # Minutes left to apply it for
+
+
+@dataclass
+class SimulationState:
+  """
+  Position of an anomalous simulation, updated as each day is yielded so it
+  can be checkpointed and the simulation resumed from it.
   """
-  sim = simulator(start_day, duration)
+  day: int = 0 # Days simulated so far
+  anomaly_next: bool = False # Whether the next day starts a new anomaly
+  pending: Optional[PendingAnomaly] = None # Anomaly carrying on into the next day
 
-  # Initial anomalies setup
-  anomaly = False
 
-  for _ in range(duration - start_day):
+def labelled_anomalous_simulator(start_day = 0, duration = 365, anomaly_threshold = ANOMALY_THRESHOLD, state = None):
+  """
+  Same as anomalous_simulator but also yields the ground truth of which anomaly was
+  injected at each minute, for recording datasets and measuring detector accuracy.
+
+  :param start_day: The day of the year to start the simulation
+  :param duration: Length of the simulation (Each event represents a minute)
+  :param anomaly_threshold: Daily chance of an anomaly starting
+  :param state: SimulationState to resume from and keep up to date, a new simulation if not given
+  :return: (datastream, labels) where labels is an int8 array holding 0 for normal minutes
+           or the index in ANOMALY_TYPES + 1 of the anomaly injected at that minute
+  """
+  if state is None:
+    state = SimulationState()
+  sim = simulator(start_day + state.day, duration)
+
+  while state.day < duration - start_day:
     datastream =  next(sim)
+    datastream, labels = inject_day_anomalies(datastream, state, anomaly_threshold)
+    state.day += 1
+    yield datastream, labels
 
-    # Inserting anomaly
-    if anomaly:
-      print("Adding anomaly")
-      # Values are random
-      anomaly_start = random.randint(0,1440)
-      anomaly_duration = random.randint(ANOMALY_MIN_DURATION,ANOMALY_MAX_DURATION)
-      anomaly_multiplier_bounds = ANOMALY_MULTIPLIER_BOUNDS[random.randint(0,3)] # Type of anomaly
-      anomaly_multiplier = random.uniform(anomaly_multiplier_bounds[0],anomaly_multiplier_bounds[1])
+def inject_day_anomalies(datastream, state, anomaly_threshold = ANOMALY_THRESHOLD, rng = random):
+  """
+  Applies the anomalies of one simulated day: carries on the pending anomaly,
+  or starts the one drawn for today, then draws whether tomorrow has one.
+  Doesn't advance state.day.
 
-      datastream, anomaly_duration = inject_anomaly(datastream, anomaly_multiplier, anomaly_start, anomaly_duration)
+  :param datastream: A day of values, changed in place if an array
+  :param state: SimulationState of the stream, updated with any anomaly carrying on
+  :param anomaly_threshold: Daily chance of an anomaly starting
+  :param rng: random module or a random.Random, so several streams can be seeded separately
+  :return: (datastream, labels) as yielded by labelled_anomalous_simulator
+  """
+  labels = np.zeros(len(datastream), dtype=np.int8)
 
-      # Sets outage for next stream
-      anomaly = (anomaly_duration == 0)
-    else:
-      # Randomly assigns next stream to be an anomaly
-      anomaly = random.random() < ANOMALY_THRESHOLD
+  # Carry on an anomaly from the previous day
+  if state.pending is not None:
+    pending = state.pending
+    datastream, remaining_duration = inject_anomaly(datastream, pending.multiplier, 0, pending.remaining)
+    labels[:pending.remaining] = pending.anomaly_type + 1
+    state.pending = PendingAnomaly(pending.anomaly_type, pending.multiplier, remaining_duration) if remaining_duration else None
 
-    yield datastream
+  # Inserting anomaly
+  elif state.anomaly_next:
+    # Values are random
+    anomaly_start = rng.randint(0,1440)
+    anomaly_duration = rng.randint(ANOMALY_MIN_DURATION,ANOMALY_MAX_DURATION)
+    anomaly_type = rng.randint(0,3) # Type of anomaly
+    anomaly_multiplier_bounds = ANOMALY_MULTIPLIER_BOUNDS[anomaly_type]
+    anomaly_multiplier = rng.uniform(anomaly_multiplier_bounds[0],anomaly_multiplier_bounds[1])
+
+    datastream, remaining_duration = inject_anomaly(datastream, anomaly_multiplier, anomaly_start, anomaly_duration)
+    labels[anomaly_start:anomaly_start + anomaly_duration] = anomaly_type + 1
+    count("anomalies.injected." + ANOMALY_TYPES[anomaly_type])
+
+    # Anomalies longer than the rest of the day carry on into the next stream
+    state.pending = PendingAnomaly(anomaly_type, anomaly_multiplier, remaining_duration) if remaining_duration else None
+    state.anomaly_next = False
+
+  # Randomly assigns next stream to be an anomaly, unless one is still going
+  if state.pending is None:
+    state.anomaly_next = rng.random() < anomaly_threshold
+
+  return datastream, labels
 
 if __name__ == '__main__':
   sim = anomalous_simulator()
@@ -1,46 +1,215 @@
 # Uses data on Easington-Langeled entry point to get baselines for the simulator
+import os
+import numpy as np
 import pandas as pd
 
+DATE_FORMAT = "%d/%m/%Y %H:%M:%S"
+INGEST_COLUMNS = ["Applicable At", "Data Item", "Value"]
+INGEST_DTYPES = {"Applicable At": "string", "Data Item": "category", "Value": "float64"}
+OUTAGE_THRESHOLD = 3 # Values below this are outages and left out of the baselines
+CHUNK_SIZE = 100000 # Rows read per chunk
+BASELINE_FILE = "Monthly_Baselines.csv"
+
+
+class RunningStats:
+  """
+  Count, mean, sum of squared differences, min and max of a stream of values.
+  Chunks are merged with Chan's parallel update so memory use is constant.
+  """
+  def __init__(self):
+    self.count = 0
+    self.mean = 0.0
+    self.m2 = 0.0
+    self.min = float("inf")
+    self.max = float("-inf")
+
+  def merge(self, count, mean, m2, minimum, maximum):
+    if count == 0:
+      return
+    total = self.count + count
+    delta = mean - self.mean
+    self.mean += delta * count / total
+    self.m2 += m2 + delta * delta * self.count * count / total
+    self.count = total
+    self.min = min(self.min, minimum)
+    self.max = max(self.max, maximum)
+
+  def update(self, values):
+    values = np.asarray(values, dtype=float)
+    if len(values) == 0:
+      return
+    mean = values.mean()
+    self.merge(len(values), mean, float(((values - mean) ** 2).sum()), values.min(), values.max())
+
+  @property
+  def std(self):
+    """Sample standard deviation, matching pandas"""
+    if self.count < 2:
+      return float("nan")
+    return (self.m2 / (self.count - 1)) ** 0.5
+
+
+def terminal_name(data_item):
+  """
+  Extracts the terminal from a National Gas data item name.
+  e.g. "System Entry Volume, Easington-Langeled, D+1" -> "Easington-Langeled"
+  """
+  parts = [part.strip() for part in str(data_item).split(",")]
+  return parts[1] if len(parts) > 2 else parts[0]
+
+
+class MonthlyBaselineAggregator:
+  """
+  Online monthly mean and standard deviation of daily flow for every terminal
+  in a National Gas export, updated one chunk at a time.
+  """
+  def __init__(self, threshold=OUTAGE_THRESHOLD):
+    self.threshold = threshold
+    self.monthly = {} # (terminal, month) -> RunningStats
+    self.overall = {} # terminal -> RunningStats of values kept
+    self.filtered = {} # terminal -> RunningStats of outage values
+    self.zeros = {} # terminal -> count of zero values
+
+  def update(self, chunk):
+    """
+    Adds a chunk of rows from the export to the running statistics.
+
+    :param chunk: DataFrame with the INGEST_COLUMNS
+    """
+    dates = pd.to_datetime(chunk["Applicable At"], format=DATE_FORMAT)
+    frame = pd.DataFrame({
+      "Terminal": chunk["Data Item"].map(terminal_name).astype(str),
+      "Month": dates.dt.month,
+      "Value": chunk["Value"]
+    }).dropna()
+
+    kept = frame[frame["Value"] > self.threshold]
+    outages = frame[frame["Value"] < self.threshold]
+
+    grouped = kept.groupby(["Terminal", "Month"])["Value"].agg(["count", "mean", "var", "min", "max"])
+    for (terminal, month), row in grouped.iterrows():
+      self._merge(self.monthly, (terminal, int(month)), row)
+
+    for terminal, row in kept.groupby("Terminal")["Value"].agg(["count", "mean", "var", "min", "max"]).iterrows():
+      self._merge(self.overall, terminal, row)
+
+    for terminal, values in outages.groupby("Terminal")["Value"]:
+      self.filtered.setdefault(terminal, RunningStats()).update(values)
+      self.zeros[terminal] = self.zeros.get(terminal, 0) + int((values == 0).sum())
+
+  @staticmethod
+  def _merge(store, key, row):
+    m2 = 0.0 if row["count"] < 2 else row["var"] * (row["count"] - 1)
+    store.setdefault(key, RunningStats()).merge(int(row["count"]), row["mean"], m2, row["min"], row["max"])
+
+  @property
+  def terminals(self):
+    return sorted(self.overall)
+
+  def baselines(self, terminal):
+    """
+    Monthly baselines for a terminal in the same layout as Monthly_Baselines.csv
+
+    :param terminal: Terminal name
+    :return: DataFrame with Month, Value and Std columns
+    """
+    months = sorted(month for name, month in self.monthly if name == terminal)
+    if not months:
+      raise ValueError("ERROR: No data for terminal {}".format(terminal))
+    return pd.DataFrame({
+      "Month": ["{:02d}".format(month) for month in months],
+      "Value": [self.monthly[(terminal, month)].mean for month in months],
+      "Std": [self.monthly[(terminal, month)].std for month in months]
+    })
+
+
+def read_export_chunks(filename, chunksize=CHUNK_SIZE):
+  """
+  Reads a National Gas export in chunks, only loading the columns the baselines need.
+
+  :param filename: Path to the csv export
+  :param chunksize: Number of rows per chunk
+  :return: Iterator of DataFrames
+  """
+  return pd.read_csv(filename, usecols=INGEST_COLUMNS, dtype=INGEST_DTYPES, chunksize=chunksize)
+
+
+def calculate_monthly_baselines(filenames, chunksize=CHUNK_SIZE, threshold=OUTAGE_THRESHOLD):
+  """
+  Calculates monthly baselines for every terminal in one streaming pass
+  over one or more exports.
+
+  :param filenames: Path or list of paths to csv exports
+  :param chunksize: Number of rows read at once
+  :param threshold: Values below this are treated as outages
+  :return: MonthlyBaselineAggregator
+  """
+  if isinstance(filenames, str):
+    filenames = [filenames]
+
+  aggregator = MonthlyBaselineAggregator(threshold)
+  for filename in filenames:
+    for chunk in read_export_chunks(filename, chunksize):
+      aggregator.update(chunk)
+  return aggregator
+
+
+def baseline_filename(terminal):
+  return "Monthly_Baselines_{}.csv".format(terminal.replace(" ", "_"))
+
+
+def write_baseline_store(aggregator, directory, default_terminal=None):
+  """
+  Writes one baseline file per terminal. The default terminal is also written
+  to Monthly_Baselines.csv which the simulator reads.
+
+  :param aggregator: MonthlyBaselineAggregator with the ingested data
+  :param directory: Directory of the baseline store
+  :param default_terminal: Terminal the simulator uses
+  :return: List of files written
+  """
+  written = []
+  for terminal in aggregator.terminals:
+    baselines = aggregator.baselines(terminal)
+    filenames = [baseline_filename(terminal)]
+    if terminal == default_terminal:
+      filenames.append(BASELINE_FILE)
+    for filename in filenames:
+      path = os.path.join(directory, filename)
+      baselines.to_csv(path)
+      written.append(path)
+  return written
+
+
 if __name__ == "__main__":
-  """ 
+  """
   Calculating monthly averages for the baseline as daily averages have outliers.
-    
+
   Encountering lots of issues when it comes to the simulating the mean. The values are almost
   there and I think the issue is the days that the pipeline is offline is skewing the results.
   My solution will be to filter out these values and then try to simulate the offline days separately.
   """
+  from src.utils import load_config
 
-  # Load the data of daily averages of flow volume between 2023 and 2024
-  entry_volumes = pd.read_csv("SystemEntryVolumeEasingtonLangeledD+1-10_23-09_24.csv")
-
-  # Filter out 0 and low values
-  threshold = 3
-  filtered_volumes = entry_volumes[entry_volumes["Value"] < threshold]
-  entry_volumes = entry_volumes[entry_volumes['Value'] > threshold]
-
-  # Find monthly flow averages
-  entry_volumes["Month"] = entry_volumes['Applicable At'].str[3:5]
-  monthly_averages = entry_volumes.groupby('Month')['Value'].mean().reset_index()
-  monthly_averages["Std"] = (entry_volumes.groupby('Month')['Value'].std().reset_index())['Value']
+  directory = os.path.dirname(os.path.abspath(__file__))
+  terminal = load_config().get("pipeline_name", "Easington-Langeled")
 
-  # Calculate a multiplier to use for seasonality values
-  yearly_average = entry_volumes["Value"].mean()
+  # Load the data of daily averages of flow volume between 2023 and 2024
+  aggregator = calculate_monthly_baselines(
+    os.path.join(directory, "SystemEntryVolumeEasingtonLangeledD+1-10_23-09_24.csv")
+  )
 
   # Save to a file as we only need to calculate once
-  monthly_averages.to_csv("Monthly_Baselines.csv")
+  write_baseline_store(aggregator, directory, terminal)
 
   # Analysing filtered out values
-  number_of_filtered = len(filtered_volumes)
-  filtered_mean = filtered_volumes['Value'].mean()
-  filtered_zeros = len(filtered_volumes['Value'] == 0)
-  print("There are {} filtered values\nMean: {}\nZeros: {}".format(number_of_filtered, filtered_mean, filtered_zeros))
-  print(filtered_volumes[['Applicable At','Value']].head(18))
+  filtered = aggregator.filtered.get(terminal, RunningStats())
+  print("There are {} filtered values\nMean: {}\nZeros: {}".format(
+    filtered.count, filtered.mean, aggregator.zeros.get(terminal, 0)))
 
   # Average Flow = 61.28..
-  max_value = entry_volumes["Value"].max() #74.43
-  min_value = entry_volumes["Value"].min()
-  std_value = entry_volumes["Value"].std() # 15.19..
-  upper_bound = max_value * 0.85 # Pattern in function will multiply by 1.15 so need to adjust here
-  print("\nAverage Flow: {}\nMax Flow: {}\nMin Flow: {}\nFlow Standard Deviation: {}".format(yearly_average,max_value,min_value,std_value))
+  overall = aggregator.overall[terminal] # Max 74.43, Std 15.19..
+  print("\nAverage Flow: {}\nMax Flow: {}\nMin Flow: {}\nFlow Standard Deviation: {}".format(
+    overall.mean, overall.max, overall.min, overall.std))
   print()
-  print(monthly_averages.head(12))
\ No newline at end of file
+  print(aggregator.baselines(terminal).head(12))
@@ -1,7 +1,13 @@
+import numpy as np
 import pandas as pd
 from scipy.interpolate import interp1d
 from src.utils import load_config, load_csv_pd
 
+DAYS_PER_YEAR = 365
+MINUTES_PER_DAY = 1440
+# Middle day of each month, used as the interpolation knots
+MID_POINT_DAYS = np.array([15,45,74,105,135,166,196,227,258,288,319,349])
+
 def get_mid_points(filename):
     """
     Uses monthly baselines to create a dictionary with keys representing
@@ -12,7 +18,7 @@ def get_mid_points(filename):
     """
     # Load file with error handling
 
-    monthly_baseline = load_csv_pd(filename)['value']
+    monthly_baseline = load_csv_pd(filename)
     try:
         monthly_baseline = pd.to_numeric(monthly_baseline, errors='raise')
     except ValueError:
@@ -20,20 +26,25 @@ def get_mid_points(filename):
     if not len(monthly_baseline) == 12:
         raise ValueError("ERROR: Should be 12 values in monthly baseline")
 
-    # Middle points of each month
-    mid_points = {}
-    mid_point_keys = [15,45,74,105,135,166,196,227,258,288,319,349]
-    i = 0
-    for key in mid_point_keys:
-        mid_points[key] = monthly_baseline[i]
-        i += 1
+    days, values = get_mid_point_arrays(monthly_baseline)
+    return dict(zip(days.tolist(), values.tolist()))
 
-    # Ensures interpolation is valid for the entire year
-    extremes = (monthly_baseline[0] + monthly_baseline[1]) / 2
-    mid_points[364] = extremes
-    mid_points[0] = extremes
+def get_mid_point_arrays(monthly_baseline):
+    """
+    Array form of the interpolation knots. The first and last day of the year
+    share a value so the interpolation is valid for the entire year.
+
+    :param monthly_baseline: 12 monthly average values
+    :return: (days, values) numpy arrays sorted by day
+    """
+    monthly_baseline = np.asarray(monthly_baseline, dtype=float)
+    if not len(monthly_baseline) == 12:
+        raise ValueError("ERROR: Should be 12 values in monthly baseline")
 
-    return mid_points
+    extremes = (monthly_baseline[0] + monthly_baseline[1]) / 2
+    days = np.concatenate(([0], MID_POINT_DAYS, [DAYS_PER_YEAR - 1]))
+    values = np.concatenate(([extremes], monthly_baseline, [extremes]))
+    return days, values
 
 def generate_interpolation(middle_points):
     # Extract days and values from middle_points
@@ -47,13 +58,22 @@ def generate_interpolation(middle_points):
 def get_value_for_day(day, interpolating_func):
     return float(interpolating_func(day))
 
+def build_baseline(interpolating_func, points_per_day=1):
+    """
+    Evaluates the interpolation over the whole year in a single call.
+
+    :param interpolating_func: Interpolation from generate_interpolation
+    :param points_per_day: 1 for a daily baseline, 1440 for minute resolution
+    :return: numpy array of 365 * points_per_day baseline values
+    """
+    days = np.arange(DAYS_PER_YEAR * points_per_day) / points_per_day
+    # Knots stop at day 364, hold that value for the rest of the final day
+    days = np.minimum(days, DAYS_PER_YEAR - 1)
+    return np.asarray(interpolating_func(days), dtype=float)
+
 def generate_lookup_table(interpolating_func):
-    lookup_list = []
-    index_list = []
-    for i in range(365):
-        lookup_list.append(get_value_for_day(i, interpolating_func))
-        index_list.append(i)
-    return pd.DataFrame({'day':index_list, 'value':lookup_list})
+    lookup = build_baseline(interpolating_func)
+    return pd.DataFrame({'day': np.arange(len(lookup)), 'value': lookup})
 
 def write_dataframe_to_file(filename, df):
     try:
@@ -1,9 +1,15 @@
 # Generate stream of floating point numbers, regular patterns, seasonal elements, random noise and anomalies
 import random
+import numpy as np
 import pandas as pd
 import math
 import os
 import src.simulator.baseline_interpolator as bi
+from src.utils import timed
+
+DAILY_MAX_ACTUAL = 73.65 # The maximum daily average we got from our baseline
+MAX_SEASONAL_RATE = 0.15
+MINUTES_PER_DAY = 1440
 
 def generate_point(lower_bound, upper_bound):
   return random.uniform(lower_bound, upper_bound)
@@ -23,13 +29,22 @@ def calculate_seasonal_multiplier(daily_avg):
   :param daily_avg:
   :return:
   """
-  daily_max_actual = 73.65 # The maximum daily average we got from our baseline
-
-  seasonal_rate = 1 - (daily_avg / daily_max_actual)
-  if seasonal_rate > 0.15:
-    seasonal_rate = 0.15
+  seasonal_rate = 1 - (daily_avg / DAILY_MAX_ACTUAL)
+  if seasonal_rate > MAX_SEASONAL_RATE:
+    seasonal_rate = MAX_SEASONAL_RATE
   return seasonal_rate
 
+def calculate_seasonal_multipliers(daily_avgs):
+  """
+  Vectorised calculate_seasonal_multiplier, giving an array the simulator can
+  index by day of the year.
+
+  :param daily_avgs: Array of daily averages
+  :return: numpy array of seasonal rates
+  """
+  daily_avgs = np.asarray(daily_avgs, dtype=float)
+  return np.minimum(1 - (daily_avgs / DAILY_MAX_ACTUAL), MAX_SEASONAL_RATE)
+
 def daily_peak_multiplier(minute, seasonal_rate):
   """
   Calculates a value multiplier according to peak times of the day.
@@ -46,6 +61,37 @@ def daily_peak_multiplier(minute, seasonal_rate):
   # Cosine graph with 2 peaks in our range of 1440 minutes located at 6am and 6pm
   return seasonal_rate*math.cos(4*math.pi*minute/1440 + math.pi) + 1
 
+def daily_peak_multipliers(seasonal_rates):
+  """
+  Vectorised daily_peak_multiplier for every minute of every given day.
+
+  :param seasonal_rates: Array of seasonal rates, one per day
+  :return: numpy array of shape (days, 1440)
+  """
+  minutes = np.arange(MINUTES_PER_DAY)
+  peak_shape = np.cos(4*np.pi*minutes/MINUTES_PER_DAY + np.pi)
+  return np.asarray(seasonal_rates, dtype=float).reshape(-1, 1) * peak_shape + 1
+
+def expected_flow_surface(baseline, seasonal_rates=None):
+  """
+  Precomputes the noise free flow for every minute of the year, so the
+  simulator and residual based detectors can share one expected value surface.
+
+  :param baseline: Daily baseline (365 values) or minute baseline (365 * 1440 values)
+  :param seasonal_rates: Optional precomputed seasonal rate per day
+  :return: numpy array of shape (days, 1440)
+  """
+  baseline = np.asarray(baseline, dtype=float)
+  if baseline.size % MINUTES_PER_DAY == 0 and baseline.size >= MINUTES_PER_DAY:
+    baseline = baseline.reshape(-1, MINUTES_PER_DAY)
+  else:
+    baseline = baseline.reshape(-1, 1)
+
+  if seasonal_rates is None:
+    seasonal_rates = calculate_seasonal_multipliers(baseline.mean(axis=1))
+
+  return baseline * daily_peak_multipliers(seasonal_rates)
+
 def gaussian_noise():
     """
     Gaussian Noise to add to stream. Mean is around 0 so shouldn't affect
@@ -56,7 +102,7 @@ def gaussian_noise():
     # Generate Gaussian noise and cap the value
     return random.gauss(0, 0.02)
 
-def apply_patterns(stream,daily_avg):
+def apply_patterns(stream,daily_avg,seasonal_multiplier=None):
   """
   Takes the seasonally distributed stream values of a single day and applies
   daily peak time and Gaussian noise patterns.
@@ -64,10 +110,12 @@ def apply_patterns(stream,daily_avg):
   Parameters
   :param daily_avg: Float represent the daily average of the stream.
   :param stream: List of floats representing uniformly distributed random stream values.
-  :return: List of floats representing generated stream with patterns applied.
+  :param seasonal_multiplier: Precomputed seasonal rate for the day, calculated from daily_avg if not given.
+  :return: Array of 1440 float64 values representing generated stream with patterns applied.
   """
-  new_stream = []
-  seasonal_multiplier = calculate_seasonal_multiplier(daily_avg)
+  new_stream = np.empty(MINUTES_PER_DAY)
+  if seasonal_multiplier is None:
+    seasonal_multiplier = calculate_seasonal_multiplier(daily_avg)
   # Iterates through each minute of the day
   for i in range(1440):
     # Daily peak multiplier
@@ -75,7 +123,7 @@ def apply_patterns(stream,daily_avg):
     # Each month's standard deviation is used for the Gaussian noise
     noise = gaussian_noise()
     # Patterns are applied to each value
-    new_stream.append(daily_peak+noise)
+    new_stream[i] = daily_peak+noise
   return new_stream
 
 def setup():
@@ -100,27 +148,48 @@ def simulator(start_day = 0, duration = 365):
 
   :param start_day (int): day to begin the sim 0<=day<365
   :param duration (int): how many days to simulate
-  :return: completed datastream where each value represents the gas flow per day at that minute.
+  :return: completed datastream where each value represents the gas flow per day at that minute,
+           a float64 array per day
   """
   print(f"Starting Simulation for {duration} days")
   avg_days = setup()
+  seasonal_rates = calculate_seasonal_multipliers(avg_days)
   # Iterate through each day, generating a stream of data for each minute
   for day in range(start_day, start_day+duration):
 
     if day > 364:
       day = day % 365
-    # Gets the baselines for these values
-    daily_flow_mean = avg_days[day]
+    with timed("simulator.generate_day"):
+      # Gets the baselines for these values
+      daily_flow_mean = avg_days[day]
 
-    # Generate the stream
-    stream = generate_24_hours(daily_flow_mean)
+      # Generate the stream
+      stream = generate_24_hours(daily_flow_mean)
 
-    final_stream = apply_patterns(stream, daily_flow_mean)
+      final_stream = apply_patterns(stream, daily_flow_mean, float(seasonal_rates[day]))
 
     yield final_stream
   print("Simulation Complete")
   raise StopIteration
 
+def generate_days(days, rng=None, surface=None):
+  """
+  Vectorised generate_24_hours and apply_patterns for several days at once,
+  drawing from the same distribution as the simulator with a numpy
+  generator, for sources that need far more points than its loop can make.
+
+  :param days: Days of the year to generate, wrapping after 365
+  :param rng: numpy Generator, a new unseeded one if not given
+  :param surface: expected_flow_surface of the baseline, computed from setup() if not given
+  :return: numpy array of shape (len(days), 1440)
+  """
+  rng = np.random.default_rng() if rng is None else rng
+  if surface is None:
+    surface = expected_flow_surface(setup())
+  expected = surface[np.asarray(days, dtype=np.int64) % len(surface)]
+  # Uniform within 1% of the daily mean, scaled by the peak multiplier, plus Gaussian noise
+  return expected * rng.uniform(0.99, 1.01, expected.shape) + rng.normal(0, 0.02, expected.shape)
+
 if __name__ == '__main__':
   sim = simulator()
   for _ in range(1400):
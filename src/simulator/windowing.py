@@ -0,0 +1,98 @@
+# Re-chunks day sized streams into sliding windows so detection runs every few minutes
+from dataclasses import dataclass
+import numpy as np
+from src.simulator.anomalies import anomalous_simulator
+
+MINUTES_PER_DAY = 1440
+
+
+@dataclass(frozen=True)
+class Window:
+  """
+  The most recent points of a stream. Only the last `step` values are new
+  since the previous window, the rest is context.
+  """
+  start: int # Minute of values[0], counted from the start of the stream
+  values: np.ndarray
+  step: int # Number of new values at the end of the window
+
+  @property
+  def end(self):
+    return self.start + len(self.values)
+
+  @property
+  def new_start(self):
+    return self.end - self.step
+
+  @property
+  def new_values(self):
+    return self.values[len(self.values) - self.step:]
+
+
+def sliding_windows(source, window=60, step=5):
+  """
+  Turns an iterator of day blocks into windows of `window` minutes sliding by
+  `step` minutes. Windows carry on across day boundaries, and the first windows
+  of a stream are shorter until `window` minutes have arrived.
+
+  :param source: Iterator of lists or arrays of values, e.g. anomalous_simulator
+  :param window: Length of each window in minutes
+  :param step: Minutes between windows
+  :return: Generator of Window
+  """
+  if step <= 0 or window < step:
+    raise ValueError("ERROR: Window step must be positive and no longer than the window")
+
+  buffer = np.empty(0)
+  buffer_start = 0 # Minute of buffer[0]
+  pending = 0 # New values not yet emitted
+
+  for block in source:
+    buffer = np.concatenate((buffer, np.asarray(block, dtype=float)))
+    pending += len(block)
+
+    while pending >= step:
+      end = len(buffer) - pending + step
+      start = max(0, end - window)
+      yield Window(buffer_start + start, buffer[start:end], step)
+      pending -= step
+
+    # Only keep the context the next window needs
+    keep = max(window - step, 0) + pending
+    if len(buffer) > keep:
+      buffer_start += len(buffer) - keep
+      buffer = buffer[len(buffer) - keep:]
+
+  # Flush a final partial step so no values are dropped
+  if pending:
+    start = max(0, len(buffer) - window)
+    yield Window(buffer_start + start, buffer[start:], pending)
+
+
+def split_by_day(start, values):
+  """
+  Splits values starting at an absolute minute into chunks that don't cross midnight.
+
+  :param start: Minute of values[0], counted from the start of the stream
+  :param values: Values to split
+  :return: Generator of (minute of the day, absolute minute, chunk)
+  """
+  offset = 0
+  while offset < len(values):
+    minute = (start + offset) % MINUTES_PER_DAY
+    length = min(len(values) - offset, MINUTES_PER_DAY - minute)
+    yield minute, start + offset, values[offset:offset + length]
+    offset += length
+
+
+def windowed_anomalous_simulator(start_day=0, duration=365, window=60, step=5):
+  """
+  Anomalous simulation emitted as sliding windows instead of whole days.
+
+  :param start_day: The day of the year to start the simulation
+  :param duration: Length of the simulation in days
+  :param window: Length of each window in minutes
+  :param step: Minutes between windows
+  :return: Generator of Window
+  """
+  return sliding_windows(anomalous_simulator(start_day, duration), window, step)
@@ -0,0 +1,15 @@
+from .stream_store import StreamStore, COLUMN_DTYPES
+from .replay import record, record_simulation, replay
+from .checkpoint import save_checkpoint, load_checkpoint, checkpoint_position, checkpointed_stream
+from .shared_ring import SharedRing, Block, publish, subscribe
+from .pipeline import ProcessPipeline
+from .rollups import Rollup, RollupPyramid, load_monthly_baselines, compare_with_baselines
+from .distribution import Histogram, DistributionProfile, linear_edges, log_edges, plot_density
+
+__all__ = [
+  'StreamStore', 'COLUMN_DTYPES', 'record', 'record_simulation', 'replay',
+  'save_checkpoint', 'load_checkpoint', 'checkpoint_position', 'checkpointed_stream',
+  'SharedRing', 'Block', 'publish', 'subscribe', 'ProcessPipeline',
+  'Rollup', 'RollupPyramid', 'load_monthly_baselines', 'compare_with_baselines',
+  'Histogram', 'DistributionProfile', 'linear_edges', 'log_edges', 'plot_density'
+]
@@ -0,0 +1,143 @@
+# Periodic checkpoints of the simulation and detector, so a restarted pipeline carries on where it stopped
+import os
+import pickle
+import random
+import tempfile
+import time
+
+import numpy as np
+
+from src.simulator import labelled_anomalous_simulator, SimulationState, ANOMALY_THRESHOLD
+from src.utils import timed, count
+
+CHECKPOINT_VERSION = 1
+MINUTES_PER_DAY = 1440
+
+
+def save_checkpoint(path, state):
+  """
+  Pickles a state atomically: it's written to a temporary file in the same
+  directory, flushed to disk, then renamed over the previous checkpoint, so a
+  crash mid write leaves the previous checkpoint intact.
+
+  :param path: File to write
+  :param state: Picklable dictionary
+  """
+  directory = os.path.dirname(os.path.abspath(path))
+  os.makedirs(directory, exist_ok=True)
+  descriptor, temporary = tempfile.mkstemp(dir=directory, prefix=".checkpoint-")
+  try:
+    with os.fdopen(descriptor, "wb") as file:
+      pickle.dump(state, file, protocol=pickle.HIGHEST_PROTOCOL)
+      file.flush()
+      os.fsync(file.fileno())
+    os.replace(temporary, path)
+  except BaseException:
+    if os.path.exists(temporary):
+      os.remove(temporary)
+    raise
+
+
+def load_checkpoint(path):
+  """
+  :param path: File written by save_checkpoint
+  :return: The saved state, or None if there is no checkpoint
+  """
+  if not os.path.exists(path):
+    return None
+  with open(path, "rb") as file:
+    state = pickle.load(file)
+  if state.get("version") != CHECKPOINT_VERSION:
+    raise ValueError("ERROR: Checkpoint {} is version {}, expected {}".format(path, state.get("version"), CHECKPOINT_VERSION))
+  return state
+
+
+def checkpoint_position(path):
+  """Minute of the stream a checkpointed run resumes from, 0 without a checkpoint"""
+  state = load_checkpoint(path)
+  return 0 if state is None else state["simulation"].day * MINUTES_PER_DAY
+
+
+def capture_random_state():
+  return {"random": random.getstate(), "numpy": np.random.get_state()}
+
+
+def restore_random_state(state):
+  random.setstate(state["random"])
+  np.random.set_state(state["numpy"])
+
+
+def checkpointed_stream(
+    detector,
+    path,
+    start_day=0,
+    duration=365,
+    step=None,
+    every_days=1,
+    anomaly_threshold=ANOMALY_THRESHOLD,
+    seed=None,
+    events=None
+):
+  """
+  Runs the anomalous simulation through a detector, checkpointing the simulation
+  position, pending anomaly, random state and detector state at the end of every
+  every_days days. If a checkpoint exists the run resumes from it, so a restart
+  neither re-simulates nor retrains and carries on exactly as if uninterrupted.
+
+  Batches are step minutes of new values pushed at their minute, which is what
+  run_stream pushes a detector for each of windowed_anomalous_simulator's windows,
+  so a sliding window run is checkpointed by passing its step. Batches never
+  cross midnight, the last of a day is shorter if step doesn't divide a day.
+
+  :param detector: Detector from the registry, configured as it was when the checkpoint was written
+  :param path: Checkpoint file
+  :param start_day: The day of the year to start the simulation
+  :param duration: How many days to simulate
+  :param step: Minutes pushed to the detector at a time, a day at a time if not given
+  :param every_days: Days between checkpoints
+  :param anomaly_threshold: Daily chance of an anomaly starting
+  :param seed: Seed for a new run, ignored when resuming
+  :param events: EventAggregator the yielded flags are pushed to, before the next batch is asked for. Its
+                 open event is checkpointed with the run, so an event in progress at a restart isn't split
+  :return: Generator of (values, anomalous minutes counted from the start of the run)
+  """
+  detector_name = getattr(detector, "name", type(detector).__name__)
+  checkpoint = load_checkpoint(path)
+  if checkpoint is not None:
+    if (checkpoint["start_day"], checkpoint["detector_name"]) != (start_day, detector_name):
+      raise ValueError("ERROR: Checkpoint {} is for {} from day {}".format(
+        path, checkpoint["detector_name"], checkpoint["start_day"]))
+    detector.load_state(checkpoint["detector"])
+    if events is not None and checkpoint.get("events") is not None:
+      events.load_state(checkpoint["events"])
+    simulation = checkpoint["simulation"]
+    restore_random_state(checkpoint["random"])
+    count("checkpoint.resumed")
+  else:
+    simulation = SimulationState()
+    if seed is not None:
+      random.seed(seed)
+      np.random.seed(seed)
+
+  source = labelled_anomalous_simulator(start_day, start_day + duration, anomaly_threshold, simulation)
+  for datastream, _ in source:
+    day_start = (simulation.day - 1) * MINUTES_PER_DAY
+    batch_size = step or len(datastream)
+    for offset in range(0, len(datastream), batch_size):
+      chunk = datastream[offset:offset + batch_size]
+      yield chunk, detector.push(chunk, day_start + offset)
+
+    if simulation.day % every_days == 0 or simulation.day == duration:
+      with timed("checkpoint.save"):
+        save_checkpoint(path, {
+          "version": CHECKPOINT_VERSION,
+          "saved_at": time.time(),
+          "start_day": start_day,
+          "duration": duration,
+          "detector_name": detector_name,
+          "detector": detector.state(),
+          "events": events.state() if events is not None else None,
+          "simulation": simulation,
+          "random": capture_random_state()
+        })
+      count("checkpoint.saved")
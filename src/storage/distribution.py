@@ -0,0 +1,306 @@
+# Fixed size histograms and moments of a stream, overall or per month or minute of the day
+import numpy as np
+
+MINUTES_PER_DAY = 1440
+GROUPINGS = (None, "month", "hour", "minute_of_day")
+# Month of each day of the year, in the non leap calendar the simulator's baselines follow
+MONTH_OF_DAY = np.repeat(np.arange(1, 13), [31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])
+DEFAULT_RANGE = (0.0, 80.0) # Flows from an outage up to past the pipeline's capacity
+
+
+def linear_edges(low, high, bins):
+  """Edges of bins equal in width"""
+  if not high > low or bins < 1:
+    raise ValueError("ERROR: Bins need a range with high > low and at least one bin")
+  return np.linspace(low, high, bins + 1)
+
+
+def log_edges(low, high, bins):
+  """Edges of bins equal in width on a log scale, for values spanning orders of magnitude"""
+  if not high > low > 0 or bins < 1:
+    raise ValueError("ERROR: Log bins need a range with high > low > 0 and at least one bin")
+  return np.geomspace(low, high, bins + 1)
+
+
+class Histogram:
+  """
+  Counts of values in fixed bins plus the sums of their first four powers,
+  for one or more groups, e.g. the 12 months. Memory depends only on the bins
+  and groups, so a stream of any length or several streams merged fit the same
+  sketch. Values outside the edges are counted in an underflow and overflow bin.
+
+  The power sums are kept around a shift, the mean of the first values, so the
+  variance doesn't lose precision to the square of a large mean.
+  """
+  def __init__(self, edges, groups=1):
+    """
+    :param edges: Increasing bin edges, e.g. from linear_edges or log_edges
+    :param groups: Number of groups counted separately
+    """
+    self.edges = np.asarray(edges, dtype=float)
+    if self.edges.ndim != 1 or len(self.edges) < 2 or np.any(np.diff(self.edges) <= 0):
+      raise ValueError("ERROR: Histogram edges must be increasing")
+    self.groups = groups
+    bins = len(self.edges) - 1
+    self.counts = np.zeros((groups, bins + 2), dtype=np.int64) # Underflow, bins, overflow
+    self.sums = np.zeros((groups, 5)) # Count and sums of the 1st to 4th powers of value - shift
+    self.min = np.full(groups, np.inf)
+    self.max = np.full(groups, -np.inf)
+    self.shift = None
+
+  @property
+  def bins(self):
+    return len(self.edges) - 1
+
+  def update(self, values, groups=None):
+    """
+    Adds values, ignoring NaN.
+
+    :param values: Array of values
+    :param groups: Group of each value, all in group 0 if not given
+    """
+    values = np.asarray(values, dtype=float)
+    groups = np.zeros(len(values), dtype=np.int64) if groups is None else np.asarray(groups, dtype=np.int64)
+    kept = ~np.isnan(values)
+    values, groups = values[kept], groups[kept]
+    if len(values) == 0:
+      return
+    if self.shift is None:
+      self.shift = float(values.mean())
+
+    # Bin 0 is underflow and bins + 1 overflow, values on the last edge fall in the last bin
+    bins = np.searchsorted(self.edges, values, side="right")
+    bins[values == self.edges[-1]] = self.bins
+    width = self.bins + 2
+    self.counts += np.bincount(groups * width + bins, minlength=self.groups * width).reshape(self.groups, width)
+
+    shifted = values - self.shift
+    power = np.ones_like(shifted)
+    for order in range(5):
+      self.sums[:, order] += np.bincount(groups, weights=power, minlength=self.groups)
+      power = power * shifted
+    np.minimum.at(self.min, groups, values)
+    np.maximum.at(self.max, groups, values)
+
+  def merge(self, other):
+    """Adds another histogram with the same edges and groups, e.g. of another stream"""
+    if self.groups != other.groups or not np.array_equal(self.edges, other.edges):
+      raise ValueError("ERROR: Only histograms with the same edges and groups can be merged")
+    if other.shift is None:
+      return
+    if self.shift is None:
+      self.shift = other.shift
+    self.counts += other.counts
+    self.sums += _reshift(other.sums, other.shift - self.shift)
+    self.min = np.minimum(self.min, other.min)
+    self.max = np.maximum(self.max, other.max)
+
+  def _select(self, group):
+    if group is None:
+      return self.counts.sum(axis=0), self.sums.sum(axis=0), self.min.min(), self.max.max()
+    return self.counts[group], self.sums[group], self.min[group], self.max[group]
+
+  def count(self, group=None):
+    return int(self._select(group)[0].sum())
+
+  def density(self, group=None):
+    """
+    :param group: Group to read, every group combined if not given
+    :return: (bin centres, density of each bin, integrating to the share of values inside the edges)
+    """
+    counts = self._select(group)[0]
+    total = counts.sum()
+    widths = np.diff(self.edges)
+    centres = (self.edges[:-1] + self.edges[1:]) / 2
+    if total == 0:
+      return centres, np.zeros(self.bins)
+    return centres, counts[1:-1] / (total * widths)
+
+  def moments(self, group=None):
+    """
+    :param group: Group to read, every group combined if not given
+    :return: Dictionary of count, mean, std, skewness, kurtosis (excess), min and max, NaN with no values
+    """
+    _, sums, minimum, maximum = self._select(group)
+    n = sums[0]
+    if n == 0:
+      nan = float("nan")
+      return {"count": 0, "mean": nan, "std": nan, "skewness": nan, "kurtosis": nan, "min": nan, "max": nan}
+    raw = sums[1:] / n # Raw moments of value - shift
+    mean = raw[0]
+    variance = max(raw[1] - mean ** 2, 0.0)
+    third = raw[2] - 3 * mean * raw[1] + 2 * mean ** 3
+    fourth = raw[3] - 4 * mean * raw[2] + 6 * mean ** 2 * raw[1] - 3 * mean ** 4
+    return {
+      "count": int(n),
+      "mean": float(mean + self.shift),
+      "std": float(np.sqrt(variance)),
+      "skewness": float(third / variance ** 1.5) if variance > 0 else 0.0,
+      "kurtosis": float(fourth / variance ** 2 - 3) if variance > 0 else 0.0,
+      "min": float(minimum),
+      "max": float(maximum)
+    }
+
+  def quantile(self, q, group=None):
+    """
+    Quantile interpolated within its bin, accurate to a bin's width. Quantiles
+    in the underflow or overflow are interpolated to the minimum or maximum.
+
+    :param q: Quantile between 0 and 1
+    :param group: Group to read, every group combined if not given
+    :return: Value, NaN with no values
+    """
+    counts, _, minimum, maximum = self._select(group)
+    total = counts.sum()
+    if total == 0:
+      return float("nan")
+    edges = np.concatenate(([min(minimum, self.edges[0])], self.edges, [max(maximum, self.edges[-1])]))
+    cumulative = np.cumsum(counts)
+    target = q * total
+    index = int(np.searchsorted(cumulative, target, side="left"))
+    index = min(index, len(counts) - 1)
+    before = cumulative[index - 1] if index else 0
+    fraction = (target - before) / counts[index] if counts[index] else 0.0
+    return float(edges[index] + fraction * (edges[index + 1] - edges[index]))
+
+
+def _reshift(sums, offset):
+  """Power sums of value - shift as power sums of value - (shift - offset)"""
+  n, s1, s2, s3, s4 = sums.T
+  return np.stack([
+    n,
+    s1 + offset * n,
+    s2 + 2 * offset * s1 + offset ** 2 * n,
+    s3 + 3 * offset * s2 + 3 * offset ** 2 * s1 + offset ** 3 * n,
+    s4 + 4 * offset * s3 + 6 * offset ** 2 * s2 + 4 * offset ** 3 * s1 + offset ** 4 * n
+  ], axis=-1)
+
+
+class DistributionProfile:
+  """
+  Streaming distribution of a stream's values, updated a batch at a time: a
+  histogram and moments of every value, and optionally one per month, hour or
+  minute of the day. In place of building the whole dataset and estimating its
+  density, so multi year or multi stream reports take constant memory and time
+  linear in the number of values.
+  """
+  def __init__(self, edges=None, by=None, start_day=0):
+    """
+    :param edges: Bin edges, 320 linear bins over DEFAULT_RANGE if not given
+    :param by: None, "month", "hour" or "minute_of_day" to also keep a histogram per group
+    :param start_day: Day of the year of the stream's minute 0
+    """
+    if by not in GROUPINGS:
+      raise ValueError("ERROR: Unknown grouping {}, expected one of {}".format(by, list(GROUPINGS)))
+    edges = linear_edges(*DEFAULT_RANGE, 320) if edges is None else edges
+    self.by = by
+    self.start_day = start_day
+    self.overall = Histogram(edges)
+    group_count = {None: 0, "month": 12, "hour": 24, "minute_of_day": MINUTES_PER_DAY}[by]
+    self.grouped = Histogram(edges, group_count) if by else None
+
+  def group_labels(self):
+    """Label of each group, months counting from 1"""
+    if self.by == "month":
+      return list(range(1, 13))
+    return list(range(self.grouped.groups)) if self.grouped else []
+
+  def _groups(self, minutes):
+    if self.by == "month":
+      return MONTH_OF_DAY[(self.start_day + minutes // MINUTES_PER_DAY) % 365] - 1
+    if self.by == "hour":
+      return minutes % MINUTES_PER_DAY // 60
+    return minutes % MINUTES_PER_DAY
+
+  def extend(self, values, start_minute):
+    """
+    Adds a batch of the stream.
+
+    :param values: Values of consecutive minutes, e.g. a day
+    :param start_minute: Minute of values[0], counted from the start of the stream
+    """
+    values = np.asarray(values, dtype=float)
+    self.overall.update(values)
+    if self.grouped is not None:
+      self.grouped.update(values, self._groups(start_minute + np.arange(len(values))))
+
+  def merge(self, other):
+    """Adds another profile with the same bins and grouping, e.g. of another stream"""
+    if self.by != other.by:
+      raise ValueError("ERROR: Only profiles with the same grouping can be merged")
+    self.overall.merge(other.overall)
+    if self.grouped is not None:
+      self.grouped.merge(other.grouped)
+
+  def histogram(self, group=None):
+    """
+    :param group: Label from group_labels, every value if not given
+    :return: (Histogram, index of the group in it, or None for every value)
+    """
+    if group is None:
+      return self.overall, None
+    labels = self.group_labels()
+    if group not in labels:
+      raise ValueError("ERROR: No group {} when grouping by {}".format(group, self.by))
+    return self.grouped, labels.index(group)
+
+  def density(self, group=None):
+    histogram, index = self.histogram(group)
+    return histogram.density(index)
+
+  def moments(self, group=None):
+    histogram, index = self.histogram(group)
+    return histogram.moments(index)
+
+  def quantile(self, q, group=None):
+    histogram, index = self.histogram(group)
+    return histogram.quantile(q, index)
+
+  def summary(self):
+    """
+    :return: Dictionary of the overall moments and, when grouped, each group's, JSON serialisable
+    """
+    summary = {"overall": self.moments()}
+    if self.grouped is not None:
+      summary[self.by] = {str(label): self.moments(label) for label in self.group_labels()}
+    return summary
+
+  @classmethod
+  def from_store(cls, store, column="values", **params):
+    """
+    Profiles a recorded stream one day at a time.
+
+    :param store: StreamStore
+    :param column: Column to profile
+    :param params: Keyword arguments of DistributionProfile
+    :return: DistributionProfile
+    """
+    profile = cls(**params)
+    for day, columns in store.iter_days(columns=(column,)):
+      profile.extend(columns[column], day * store.minutes_per_day)
+    return profile
+
+
+def plot_density(profile, groups=None, ax=None, title="Density Plot of Gas Flow Data"):
+  """
+  Draws the density of a profile from its histograms.
+
+  :param profile: DistributionProfile
+  :param groups: Group labels to draw a line for each of, every value if not given
+  :param ax: matplotlib Axes to draw on, a new figure if not given
+  :param title: Plot title
+  :return: The Axes
+  """
+  import matplotlib.pyplot as plt
+
+  if ax is None:
+    _, ax = plt.subplots()
+  for group in (groups if groups is not None else [None]):
+    centres, density = profile.density(group)
+    ax.plot(centres, density, label="All" if group is None else "{} {}".format(profile.by, group))
+  if groups is not None:
+    ax.legend()
+  ax.set_title(title)
+  ax.set_xlabel("Gas Flow (mcm/day)")
+  ax.set_ylabel("Density")
+  return ax
@@ -0,0 +1,138 @@
+# Runs the data source and detectors in their own processes, connected by shared memory rings
+import multiprocessing
+
+import numpy as np
+
+from src.storage.shared_ring import SharedRing, publish, subscribe
+
+POLL_INTERVAL = 0.1 # seconds between checks that the stage processes are still running
+
+
+def _source_stage(values_name, source_factory, source_params):
+  """Process publishing a source's batches to the values ring"""
+  ring = SharedRing.attach(values_name)
+  try:
+    publish(source_factory(**source_params), ring)
+  finally:
+    ring.close()
+
+
+def _detector_stage(values_name, consumer, flags_name, detector, params):
+  """Process pushing every block of the values ring through a detector and publishing its flags"""
+  # Imported here so the rings and replay don't pull in the detectors
+  from src.detector import get_detector
+
+  values = SharedRing.attach(values_name)
+  flags = SharedRing.attach(flags_name)
+  try:
+    model = get_detector(detector, **params)
+    for block in subscribe(values, consumer):
+      verdicts = np.zeros(len(block.values), dtype=np.bool_)
+      offsets = np.asarray(model.push(block.values, block.start_minute), dtype=np.int64) - block.start_minute
+      verdicts[offsets[(offsets >= 0) & (offsets < len(verdicts))]] = True
+      flags.write(verdicts, block.start_minute)
+  finally:
+    flags.mark_closed()
+    values.close()
+    flags.close()
+
+
+class ProcessPipeline:
+  """
+  Runs a source and one or more detectors as separate processes, so each
+  stage has its own core and GIL. The source writes its values to a shared
+  ring that every detector and the caller read in place, and each detector
+  writes a block of flags per block of values to a ring of its own. Nothing
+  is pickled once the processes have started.
+
+  The stages start in fresh interpreters, so the source factory and the
+  detector parameters must be picklable, e.g. anomalous_simulator and a dict.
+  """
+  def __init__(
+      self,
+      source_factory,
+      source_params=None,
+      detectors=None,
+      slots=64,
+      block_size=1440,
+      context="spawn"
+  ):
+    """
+    :param source_factory: Function returning the source, an iterator of day arrays or Window
+    :param source_params: Keyword arguments of source_factory
+    :param detectors: Dictionary of registered detector names to their parameters
+    :param slots: Blocks each ring holds before the source waits for the slowest reader
+    :param block_size: Most values in a block, e.g. a day
+    :param context: multiprocessing start method
+    """
+    self.detectors = dict(detectors or {})
+    if not self.detectors:
+      raise ValueError("ERROR: A pipeline needs at least one detector")
+    self.values = SharedRing.create(slots, block_size, consumers=len(self.detectors) + 1)
+    self.flags = [SharedRing.create(slots, block_size, dtype=np.bool_) for _ in self.detectors]
+    self.consumer = len(self.detectors) # The caller reads the values after the detectors
+
+    ctx = multiprocessing.get_context(context)
+    self.processes = [ctx.Process(
+      target=_source_stage, args=(self.values.name, source_factory, source_params or {}),
+      name="pipeline-source", daemon=True
+    )]
+    for consumer, ((name, params), flags) in enumerate(zip(self.detectors.items(), self.flags)):
+      self.processes.append(ctx.Process(
+        target=_detector_stage, args=(self.values.name, consumer, flags.name, name, params),
+        name="pipeline-" + name, daemon=True
+      ))
+    for process in self.processes:
+      process.start()
+
+  def _check_processes(self):
+    for process in self.processes:
+      if process.exitcode not in (None, 0):
+        raise ChildProcessError("ERROR: Pipeline stage {} exited with code {}".format(process.name, process.exitcode))
+
+  def _read(self, ring, consumer):
+    """Waits for a ring's next block, failing if a stage process dies"""
+    while True:
+      try:
+        return ring.read(consumer, timeout=POLL_INTERVAL)
+      except TimeoutError:
+        self._check_processes()
+
+  def stream(self):
+    """
+    Same interface as run_stream: yields (new values of the batch, anomalous
+    minutes flagged by any detector) for each block. The values are a view of
+    the ring, valid until the next block.
+    """
+    try:
+      while True:
+        block = self._read(self.values, self.consumer)
+        if block is None:
+          # The source closes the ring even if it fails, so check it finished cleanly
+          self.processes[0].join()
+          self._check_processes()
+          break
+        flagged = np.zeros(len(block.values), dtype=np.bool_)
+        for flags in self.flags:
+          verdicts = self._read(flags, 0)
+          if verdicts is None or verdicts.seq != block.seq:
+            raise ChildProcessError("ERROR: A detector stopped before the source")
+          flagged |= verdicts.values
+        yield block.values, (block.start_minute + np.flatnonzero(flagged)).tolist()
+    finally:
+      self.close()
+
+  def __iter__(self):
+    return self.stream()
+
+  def close(self):
+    """Stops the stages and frees the rings"""
+    if self.values is None:
+      return
+    for process in self.processes:
+      if process.is_alive():
+        process.terminate()
+      process.join()
+    for ring in [self.values] + self.flags:
+      ring.close()
+    self.values = None
@@ -0,0 +1,83 @@
+# Records labelled streams to a StreamStore and replays them as a data source
+import random
+import time
+import numpy as np
+
+from src.simulator import labelled_anomalous_simulator, ANOMALY_THRESHOLD
+from src.storage.stream_store import StreamStore
+
+
+def record(source, store, start_day=0):
+  """
+  Writes every (datastream, labels) day from a source into a store.
+
+  :param source: Iterator of (datastream, labels) tuples, e.g. labelled_anomalous_simulator
+  :param store: StreamStore to append to
+  :param start_day: Day number of the first block
+  :return: Number of days recorded
+  """
+  count = 0
+  for day, (datastream, labels) in enumerate(source, start_day):
+    store.append_day(day, datastream, labels=labels)
+    count += 1
+  return count
+
+
+def record_simulation(path, start_day=0, duration=365, seed=None, anomaly_threshold=ANOMALY_THRESHOLD):
+  """
+  Runs the anomalous simulation once and records it, so detector runs
+  can be repeated on exactly the same data.
+
+  :param path: Directory of the store
+  :param start_day: The day of the year to start the simulation
+  :param duration: How many days to simulate
+  :param seed: Seed for the simulation, None leaves the random state alone
+  :param anomaly_threshold: Daily chance of an anomaly starting
+  :return: StreamStore holding the recording
+  """
+  if seed is not None:
+    random.seed(seed)
+  store = StreamStore(path)
+  record(labelled_anomalous_simulator(start_day, start_day + duration, anomaly_threshold), store, start_day)
+  return store
+
+
+def replay(store, speed=None, start_day=None, duration=None, with_labels=False):
+  """
+  Streams a recorded dataset with the same interface as anomalous_simulator,
+  one day of values per iteration.
+
+  :param store: StreamStore or path to one
+  :param speed: None for as fast as possible, 1 for real time (one minute per
+                minute), N for N times real time
+  :param start_day: First day to replay, defaults to the first recorded day
+  :param duration: How many days to replay, defaults to every recorded day
+  :param with_labels: Also yield the ground truth labels
+  :return: Generator of day arrays, or (day array, labels) tuples if with_labels
+  """
+  if isinstance(store, str):
+    store = StreamStore(store)
+  if speed is not None and speed <= 0:
+    raise ValueError("ERROR: Replay speed must be positive")
+
+  end_day = None
+  if duration is not None:
+    end_day = (start_day if start_day is not None else store.days[0]) + duration
+
+  columns = ("values", "labels") if with_labels else ("values",)
+  interval = None if speed is None else store.minutes_per_day * 60 / speed
+  next_release = time.monotonic()
+
+  for _, day in store.iter_days(start_day, end_day, columns):
+    # Deadline based pacing so slow consumers don't push the schedule back
+    if interval is not None:
+      delay = next_release - time.monotonic()
+      if delay > 0:
+        time.sleep(delay)
+      next_release += interval
+
+    values = np.asarray(day["values"])
+    if with_labels:
+      yield values, np.asarray(day["labels"])
+    else:
+      yield values
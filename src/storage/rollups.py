@@ -0,0 +1,236 @@
+# Incrementally maintained mean/min/max/count rollups of a stream at several resolutions
+import os
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from src.utils.buffers import ArrayBuffer
+
+MINUTES_PER_DAY = 1440
+RESOLUTIONS = (5, 60, MINUTES_PER_DAY) # Minutes per bucket of each level
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "simulator", "Monthly_Baselines.csv")
+
+# Columns of a level's buffer
+SUM, MIN, MAX, COUNT = range(4)
+
+
+@dataclass
+class Rollup:
+  """Aggregates of consecutive buckets of one level, empty buckets have a count of 0 and NaN statistics"""
+  resolution: int # Minutes per bucket
+  start: np.ndarray # First minute of each bucket
+  mean: np.ndarray
+  min: np.ndarray
+  max: np.ndarray
+  count: np.ndarray
+
+  def __len__(self):
+    return len(self.start)
+
+
+class RollupLevel:
+  """
+  Buckets of one resolution, as rows of (sum, min, max, count) in an
+  ArrayBuffer. The last bucket stays open until a value after it arrives.
+  """
+  def __init__(self, resolution, max_buckets=None):
+    self.resolution = resolution
+    self.buckets = ArrayBuffer(columns=4, maxlen=max_buckets, capacity=min(max_buckets or 1024, 1024))
+    self.first = None # Bucket number of the first row, counted from minute 0
+
+  @property
+  def end(self):
+    """Bucket number after the last row"""
+    return self.first + len(self.buckets) if self.first is not None else None
+
+  def extend(self, values, start_minute):
+    """
+    Adds values of consecutive minutes, at or after the minutes already added.
+
+    :param values: Array of values
+    :param start_minute: Minute of values[0]
+    """
+    if len(values) == 0:
+      return
+    numbers = (start_minute + np.arange(len(values))) // self.resolution
+    if self.first is None:
+      self.first = int(numbers[0])
+    elif numbers[0] < self.end - 1:
+      raise ValueError("ERROR: Minute {} is before the open bucket".format(start_minute))
+
+    # One row per bucket the values fall in
+    starts = np.flatnonzero(np.r_[True, numbers[1:] != numbers[:-1]])
+    rows = np.empty((len(starts), 4))
+    rows[:, SUM] = np.add.reduceat(values, starts)
+    rows[:, MIN] = np.minimum.reduceat(values, starts)
+    rows[:, MAX] = np.maximum.reduceat(values, starts)
+    rows[:, COUNT] = np.diff(np.r_[starts, len(values)])
+    numbers = numbers[starts]
+
+    # The first bucket may carry on the open one
+    if numbers[0] == self.end - 1:
+      last = self.buckets.view()[-1]
+      last[SUM] += rows[0, SUM]
+      last[MIN] = min(last[MIN], rows[0, MIN])
+      last[MAX] = max(last[MAX], rows[0, MAX])
+      last[COUNT] += rows[0, COUNT]
+      rows, numbers = rows[1:], numbers[1:]
+    if len(rows) == 0:
+      return
+
+    # Buckets skipped by a gap in the stream are kept empty, so rows stay aligned to bucket numbers
+    gap = int(numbers[0]) - self.end
+    if gap > 0:
+      self.buckets.extend(np.tile([0.0, np.inf, -np.inf, 0.0], (gap, 1)))
+    self.buckets.extend(rows)
+    self.first = int(numbers[-1]) + 1 - len(self.buckets) # Past max_buckets the oldest are dropped
+
+  def rollup(self, start_minute=None, end_minute=None):
+    """
+    Buckets overlapping a minute range.
+
+    :param start_minute: First minute, from the first bucket kept if not given
+    :param end_minute: Minute after the range, to the last bucket if not given
+    :return: Rollup
+    """
+    if self.first is None:
+      empty = np.empty(0)
+      return Rollup(self.resolution, np.empty(0, dtype=np.int64), empty, empty, empty, empty)
+    first = self.first if start_minute is None else max(self.first, start_minute // self.resolution)
+    end = self.end if end_minute is None else min(self.end, -(-end_minute // self.resolution))
+    rows = self.buckets.view()[first - self.first:max(first, end) - self.first]
+    count = rows[:, COUNT]
+    with np.errstate(divide="ignore", invalid="ignore"):
+      mean = rows[:, SUM] / count
+    empty = count == 0
+    return Rollup(
+      self.resolution,
+      (np.arange(first, first + len(rows)) * self.resolution).astype(np.int64),
+      mean,
+      np.where(empty, np.nan, rows[:, MIN]),
+      np.where(empty, np.nan, rows[:, MAX]),
+      count.astype(np.int64)
+    )
+
+
+class RollupPyramid:
+  """
+  Rollups of a stream at increasing resolutions (5 minutes, hours and days by
+  default), updated as each batch streams in. Long range views and drift
+  checks read the coarsest level that's fine enough, so their cost depends on
+  the number of buckets rather than the number of raw points.
+  """
+  def __init__(self, resolutions=RESOLUTIONS, max_buckets=None):
+    """
+    :param resolutions: Minutes per bucket of each level
+    :param max_buckets: Buckets kept per level, every bucket if not given
+    """
+    if not resolutions or any(resolution < 1 for resolution in resolutions):
+      raise ValueError("ERROR: Rollup resolutions must be at least a minute")
+    self.levels = [RollupLevel(resolution, max_buckets) for resolution in sorted(set(resolutions))]
+
+  @property
+  def resolutions(self):
+    return [level.resolution for level in self.levels]
+
+  def extend(self, values, start_minute):
+    """
+    Adds a batch of the stream to every level.
+
+    :param values: Values of consecutive minutes
+    :param start_minute: Minute of values[0], counted from the start of the stream
+    """
+    values = np.asarray(values, dtype=float)
+    for level in self.levels:
+      level.extend(values, start_minute)
+
+  def level(self, resolution):
+    for level in self.levels:
+      if level.resolution == resolution:
+        return level
+    raise ValueError("ERROR: No rollup level of {} minutes, expected one of {}".format(resolution, self.resolutions))
+
+  def choose_level(self, start_minute, end_minute, resolution=None, max_points=None):
+    """
+    The level a query reads. Given a resolution it's the coarsest level at
+    least that fine, the fewest buckets that answer the query. Given
+    max_points, e.g. the points a plot can show, it's the finest of those
+    levels whose buckets fit, falling back to the coarsest.
+
+    :param start_minute: First minute of the query
+    :param end_minute: Minute after the query
+    :param resolution: Coarsest resolution the query can use, in minutes
+    :param max_points: Most buckets wanted
+    :return: RollupLevel
+    """
+    candidates = self.levels if resolution is None else [level for level in self.levels if level.resolution <= resolution]
+    if not candidates:
+      raise ValueError("ERROR: No rollup level is {} minutes or finer".format(resolution))
+    if max_points is not None:
+      for level in candidates:
+        if -(-(end_minute - start_minute) // level.resolution) <= max_points:
+          return level
+    return candidates[-1]
+
+  def query(self, start_minute, end_minute, resolution=None, max_points=None):
+    """
+    Aggregates of a minute range from the level chosen by choose_level.
+
+    :param start_minute: First minute
+    :param end_minute: Minute after the range
+    :param resolution: Coarsest resolution the query can use, in minutes
+    :param max_points: Most buckets wanted
+    :return: Rollup
+    """
+    return self.choose_level(start_minute, end_minute, resolution, max_points).rollup(start_minute, end_minute)
+
+  @classmethod
+  def from_store(cls, store, column="values", **params):
+    """
+    Builds the rollups of a recorded stream one day at a time.
+
+    :param store: StreamStore
+    :param column: Column to roll up
+    :param params: Keyword arguments of RollupPyramid
+    :return: RollupPyramid
+    """
+    pyramid = cls(**params)
+    for day, columns in store.iter_days(columns=(column,)):
+      pyramid.extend(columns[column], day * store.minutes_per_day)
+    return pyramid
+
+
+def load_monthly_baselines(path=BASELINE_PATH):
+  """
+  :param path: Path of a monthly baseline file, e.g. written by write_baseline_store
+  :return: DataFrame with integer Month, Value and Std columns
+  """
+  baselines = pd.read_csv(path, usecols=["Month", "Value", "Std"])
+  baselines["Month"] = baselines["Month"].astype(int)
+  return baselines
+
+
+def compare_with_baselines(pyramid, baselines=None, start_day=0):
+  """
+  Compares the mean daily flow of each month in the stream with its monthly
+  baseline, from the daily rollups.
+
+  :param pyramid: RollupPyramid with a daily level
+  :param baselines: DataFrame from load_monthly_baselines, Monthly_Baselines.csv if not given
+  :param start_day: Day of the year of the stream's minute 0
+  :return: DataFrame of Month, Days, Mean, Value, Std and Z, the deviation of the mean in baseline standard deviations
+  """
+  if baselines is None:
+    baselines = load_monthly_baselines()
+  daily = pyramid.level(MINUTES_PER_DAY).rollup()
+  kept = daily.count > 0
+  days = start_day + daily.start[kept] // MINUTES_PER_DAY
+  # Days of the year in the non leap calendar the simulator's baselines follow
+  months = (pd.Timestamp(2023, 1, 1) + pd.to_timedelta(days % 365, unit="D")).month
+  observed = pd.DataFrame({"Month": months, "Mean": daily.mean[kept]}).groupby("Month")["Mean"].agg(["size", "mean"])
+  observed = observed.rename(columns={"size": "Days", "mean": "Mean"}).reset_index()
+
+  comparison = observed.merge(baselines, on="Month", how="left")
+  comparison["Z"] = (comparison["Mean"] - comparison["Value"]) / comparison["Std"]
+  return comparison[["Month", "Days", "Mean", "Value", "Std", "Z"]]
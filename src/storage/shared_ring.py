@@ -0,0 +1,219 @@
+# Single producer, multi consumer ring buffer of blocks in shared memory, to stream between processes
+import time
+from dataclasses import dataclass
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Types a ring can hold, stored in the header by index
+RING_DTYPES = (np.float64, np.float32, np.int8, np.bool_)
+
+# Header fields
+SLOTS, BLOCK_SIZE, CONSUMERS, DTYPE, WRITE_SEQ, CLOSED = range(6)
+HEADER_SIZE = 8
+SLOT_FIELDS = 3 # seq, start minute and length of each slot's block
+DETACHED = 2 ** 62 # Cursor of a consumer that has stopped reading
+
+
+@dataclass
+class Block:
+  seq: int # Sequence number of the block, counting from 0
+  start_minute: int # Minute of values[0], counted from the start of the stream
+  values: np.ndarray # View of the ring's memory, valid until the consumer's next read
+
+
+def _wait(condition, timeout):
+  """Polls condition with a backoff of up to a millisecond, raising TimeoutError after timeout seconds"""
+  deadline = None if timeout is None else time.monotonic() + timeout
+  delay = 1e-5
+  while not condition():
+    if deadline is not None and time.monotonic() > deadline:
+      raise TimeoutError("ERROR: Timed out waiting on the shared ring")
+    time.sleep(delay)
+    delay = min(delay * 2, 1e-3)
+
+
+class SharedRing:
+  """
+  Ring of fixed size slots in a shared memory block, written by one producer
+  and read in order by a fixed number of consumers, each in any process.
+  Blocks are published by sequence number: the producer fills a slot, then
+  advances the write sequence, so a consumer never sees a partly written
+  block. Each consumer keeps a cursor in the header, and the producer waits
+  for the slowest consumer before reusing a slot, so no block is lost and a
+  consumer reads its blocks in place rather than unpickling a copy.
+
+  Layout: int64 header, one int64 cursor per consumer, (seq, start minute,
+  length) per slot, then the slots' data.
+  """
+  def __init__(self, shm, owner):
+    self.shm = shm
+    self.owner = owner
+    self.header = np.ndarray((HEADER_SIZE,), dtype=np.int64, buffer=shm.buf)
+    slots, block_size, consumers = (int(self.header[field]) for field in (SLOTS, BLOCK_SIZE, CONSUMERS))
+    self.slots = slots
+    self.block_size = block_size
+    self.consumers = consumers
+    self.dtype = np.dtype(RING_DTYPES[int(self.header[DTYPE])])
+    offset = HEADER_SIZE * 8
+    self.cursors = np.ndarray((consumers,), dtype=np.int64, buffer=shm.buf, offset=offset)
+    offset += consumers * 8
+    self.slot_headers = np.ndarray((slots, SLOT_FIELDS), dtype=np.int64, buffer=shm.buf, offset=offset)
+    offset += slots * SLOT_FIELDS * 8
+    self.data = np.ndarray((slots, block_size), dtype=self.dtype, buffer=shm.buf, offset=offset)
+
+  @classmethod
+  def create(cls, slots=64, block_size=1440, consumers=1, dtype=np.float64, name=None):
+    """
+    :param slots: Blocks the ring holds, at least 2
+    :param block_size: Most values in a block, longer writes are split
+    :param consumers: Consumers that read every block
+    :param dtype: One of RING_DTYPES
+    :param name: Shared memory name, generated if not given
+    :return: SharedRing, unlinked when the creator closes it
+    """
+    if slots < 2 or block_size < 1 or consumers < 1:
+      raise ValueError("ERROR: A shared ring needs at least 2 slots, 1 value per block and 1 consumer")
+    dtype = np.dtype(dtype)
+    types = [np.dtype(ring_type) for ring_type in RING_DTYPES]
+    if dtype not in types:
+      raise ValueError("ERROR: Shared rings hold {}, not {}".format([str(t) for t in types], dtype))
+    size = (HEADER_SIZE + consumers + slots * SLOT_FIELDS) * 8 + slots * block_size * dtype.itemsize
+    shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+    header = np.ndarray((HEADER_SIZE,), dtype=np.int64, buffer=shm.buf)
+    header[:] = 0
+    header[SLOTS], header[BLOCK_SIZE], header[CONSUMERS], header[DTYPE] = slots, block_size, consumers, types.index(dtype)
+    ring = cls(shm, owner=True)
+    ring.cursors[:] = 0
+    ring.slot_headers[:] = -1
+    return ring
+
+  @classmethod
+  def attach(cls, name):
+    """Opens a ring created in another process by its name"""
+    return cls(shared_memory.SharedMemory(name=name), owner=False)
+
+  @property
+  def name(self):
+    return self.shm.name
+
+  @property
+  def write_seq(self):
+    """Sequence number of the next block to be written"""
+    return int(self.header[WRITE_SEQ])
+
+  @property
+  def closed(self):
+    return bool(self.header[CLOSED])
+
+  def write(self, values, start_minute, timeout=None):
+    """
+    Publishes values as one or more blocks, waiting while the slowest consumer
+    still holds the slot to be reused. Only one process may write to a ring.
+
+    :param values: Values of consecutive minutes
+    :param start_minute: Minute of values[0]
+    :param timeout: Seconds to wait for a free slot, forever if None
+    """
+    if self.closed:
+      raise ValueError("ERROR: The shared ring is closed")
+    values = np.asarray(values, dtype=self.dtype)
+    for offset in range(0, len(values), self.block_size):
+      chunk = values[offset:offset + self.block_size]
+      seq = self.write_seq
+      # The slot's last block is seq - slots. A consumer holds the block it read last until its next read,
+      # so the slot is free once every cursor is 2 past that block, or if the slot has never been used
+      _wait(lambda: seq < self.slots or int(self.cursors.min()) >= seq - self.slots + 2, timeout)
+      slot = seq % self.slots
+      self.data[slot, :len(chunk)] = chunk
+      self.slot_headers[slot] = (seq, start_minute + offset, len(chunk))
+      self.header[WRITE_SEQ] = seq + 1
+
+  def mark_closed(self):
+    """Tells the consumers no more blocks are coming, they finish after reading the rest"""
+    self.header[CLOSED] = 1
+
+  def read(self, consumer, timeout=None):
+    """
+    The consumer's next block, waiting for it to be written.
+
+    :param consumer: Index of the consumer, from 0 to consumers - 1
+    :param timeout: Seconds to wait, forever if None
+    :return: Block, or None once the ring is closed and every block has been read
+    """
+    seq = int(self.cursors[consumer])
+    if seq >= DETACHED:
+      return None
+    _wait(lambda: self.write_seq > seq or self.closed, timeout)
+    if self.write_seq <= seq:
+      return None
+    slot = seq % self.slots
+    block_seq, start_minute, length = (int(field) for field in self.slot_headers[slot])
+    self.cursors[consumer] = seq + 1 # Releases the previous block, this one is held until the next read
+    return Block(block_seq, start_minute, self.data[slot, :length])
+
+  def detach(self, consumer):
+    """Stops a consumer reading, so the producer no longer waits for it"""
+    self.cursors[consumer] = DETACHED
+
+  def close(self):
+    """Detaches from the shared memory, the creator also frees it"""
+    # The arrays are views of the buffer, which can't be closed while they exist
+    self.header = self.cursors = self.slot_headers = self.data = None
+    try:
+      self.shm.close()
+    except BufferError:
+      pass # A block is still referenced, the mapping goes when the process exits
+    if self.owner:
+      self.shm.unlink()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc_info):
+    self.close()
+
+
+def publish(source, ring, start_minute=0, timeout=None):
+  """
+  Writes every batch of a source to a ring, then closes it.
+
+  :param source: Iterator of day lists or arrays (e.g. anomalous_simulator or replay), or of Window
+  :param ring: SharedRing to write to
+  :param start_minute: Minute of the first day's first value
+  :param timeout: Seconds to wait for a free slot
+  :return: Number of values written
+  """
+  written = 0
+  try:
+    for batch in source:
+      if hasattr(batch, "new_values"):
+        # Only a window's new values, as run_stream pushes them
+        values, start = batch.new_values, batch.new_start
+      else:
+        values, start = batch, start_minute
+        start_minute += len(batch)
+      ring.write(values, start, timeout)
+      written += len(values)
+  finally:
+    ring.mark_closed()
+  return written
+
+
+def subscribe(ring, consumer, timeout=None):
+  """
+  Reads a consumer's blocks until the ring is closed.
+
+  :param ring: SharedRing to read
+  :param consumer: Index of the consumer
+  :param timeout: Seconds to wait for each block
+  :return: Generator of Block, each valid until the next is read
+  """
+  try:
+    while True:
+      block = ring.read(consumer, timeout)
+      if block is None:
+        return
+      yield block
+  finally:
+    ring.detach(consumer)
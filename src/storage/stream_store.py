@@ -0,0 +1,177 @@
+# Append only columnar storage of day blocks, read back as memory mapped arrays
+import os
+import json
+import re
+import numpy as np
+
+MINUTES_PER_DAY = 1440
+INDEX_FILE = "index.json"
+
+# Known columns and their on disk types, other columns keep the dtype they are written with
+COLUMN_DTYPES = {
+  "values": np.float64, # flow values
+  "labels": np.int8, # ground truth anomaly type, 0 is normal
+  "scores": np.float64, # detector anomaly scores
+  "flags": np.bool_ # detector verdicts
+}
+
+_COLUMN_NAME = re.compile(r"^[A-Za-z0-9_\-]+$")
+
+
+def _atomic_save(path, array):
+  """Writes an .npy file next to its final path then moves it into place."""
+  tmp_path = path + ".tmp"
+  with open(tmp_path, "wb") as file:
+    np.save(file, array)
+  os.replace(tmp_path, path)
+
+
+class StreamStore:
+  """
+  Stores day blocks of a stream as one .npy segment per column per day, with a
+  JSON index by day. Segments are never rewritten, so reads are memory mapped
+  and zero copy within a day.
+
+  Layout:
+    <path>/index.json
+    <path>/<column>/<day>.npy
+  """
+  def __init__(self, path, minutes_per_day=MINUTES_PER_DAY):
+    self.path = path
+    os.makedirs(path, exist_ok=True)
+    self.index_path = os.path.join(path, INDEX_FILE)
+
+    if os.path.exists(self.index_path):
+      with open(self.index_path, "r") as file:
+        self.index = json.load(file)
+    else:
+      self.index = {"minutes_per_day": minutes_per_day, "days": {}}
+      self._write_index()
+    self.minutes_per_day = self.index["minutes_per_day"]
+
+  def _write_index(self):
+    tmp_path = self.index_path + ".tmp"
+    with open(tmp_path, "w") as file:
+      json.dump(self.index, file)
+    os.replace(tmp_path, self.index_path)
+
+  def _segment_path(self, column, day):
+    return os.path.join(self.path, column, "{:07d}.npy".format(day))
+
+  @property
+  def days(self):
+    """Sorted list of stored days"""
+    return sorted(int(day) for day in self.index["days"])
+
+  def columns(self, day):
+    """Columns stored for a day"""
+    return list(self.index["days"][str(day)])
+
+  def _prepare_column(self, day, column, data):
+    """Checks a column can be stored for a day and converts it to its on disk type, without writing it"""
+    if not _COLUMN_NAME.match(column):
+      raise ValueError("ERROR: Invalid column name {}".format(column))
+    if column in self.index["days"].get(str(day), []):
+      raise ValueError("ERROR: Column {} already stored for day {}".format(column, day))
+
+    try:
+      array = np.asarray(data, dtype=COLUMN_DTYPES.get(column))
+    except (TypeError, ValueError) as error:
+      raise ValueError("ERROR: Column {} of day {} can't be stored: {}".format(column, day, error))
+    if array.ndim != 1 or len(array) != self.minutes_per_day:
+      got = len(array) if array.ndim == 1 else "shape {}".format(array.shape)
+      raise ValueError("ERROR: Expected {} points for day {}, got {}".format(self.minutes_per_day, day, got))
+    return array
+
+  def _write_column(self, day, column, array):
+    os.makedirs(os.path.join(self.path, column), exist_ok=True)
+    _atomic_save(self._segment_path(column, day), array)
+    self.index["days"].setdefault(str(day), []).append(column)
+
+  def append_day(self, day, values, labels=None, scores=None, flags=None, **columns):
+    """
+    Appends a new day block to the store. Every column is checked before any
+    is written, so a bad column leaves the day unstored rather than half written.
+
+    :param day: Day number of the block, must not already be stored
+    :param values: Flow values for every minute of the day
+    :param labels: Optional ground truth anomaly labels
+    :param scores: Optional detector scores
+    :param flags: Optional detector flags
+    :param columns: Any other named columns, e.g. scores_EMA
+    """
+    if str(day) in self.index["days"]:
+      raise ValueError("ERROR: Day {} is already stored".format(day))
+
+    columns.update({"values": values, "labels": labels, "scores": scores, "flags": flags})
+    arrays = {column: self._prepare_column(day, column, data) for column, data in columns.items() if data is not None}
+    for column, array in arrays.items():
+      self._write_column(day, column, array)
+    self._write_index()
+
+  def write_column(self, day, column, data):
+    """
+    Adds a column to an existing day, e.g. scores from a detector run on a recorded day.
+
+    :param day: Stored day number
+    :param column: Column name
+    :param data: Values for every minute of the day
+    """
+    if str(day) not in self.index["days"]:
+      raise KeyError("ERROR: Day {} is not stored".format(day))
+    self._write_column(day, column, self._prepare_column(day, column, data))
+    self._write_index()
+
+  def read_day(self, day, column="values"):
+    """
+    Reads one column of a day as a read only memory mapped array.
+
+    :param day: Stored day number
+    :param column: Column name
+    :return: numpy memmap of the day
+    """
+    if column not in self.index["days"].get(str(day), []):
+      raise KeyError("ERROR: Column {} is not stored for day {}".format(column, day))
+    return np.load(self._segment_path(column, day), mmap_mode="r")
+
+  def read_range(self, start_minute, end_minute, column="values"):
+    """
+    Reads an arbitrary minute range, counted from minute 0 of day 0.
+    Ranges inside a single day are returned as a view of the memory map.
+
+    :param start_minute: First minute of the range
+    :param end_minute: Minute after the end of the range
+    :param column: Column name
+    :return: numpy array of end_minute - start_minute values
+    """
+    if end_minute <= start_minute:
+      return np.empty(0, dtype=COLUMN_DTYPES.get(column, np.float64))
+
+    first_day = start_minute // self.minutes_per_day
+    last_day = (end_minute - 1) // self.minutes_per_day
+    parts = []
+    for day in range(first_day, last_day + 1):
+      day_start = day * self.minutes_per_day
+      start = max(start_minute - day_start, 0)
+      end = min(end_minute - day_start, self.minutes_per_day)
+      parts.append(self.read_day(day, column)[start:end])
+
+    if len(parts) == 1:
+      return parts[0]
+    return np.concatenate(parts)
+
+  def iter_days(self, start_day=None, end_day=None, columns=("values",)):
+    """
+    Iterates stored days in order.
+
+    :param start_day: First day to read, defaults to the first stored day
+    :param end_day: Day after the last day to read, defaults to reading every stored day
+    :param columns: Columns to read for each day
+    :return: Generator of (day, {column: memmap}) tuples
+    """
+    for day in self.days:
+      if start_day is not None and day < start_day:
+        continue
+      if end_day is not None and day >= end_day:
+        break
+      yield day, {column: self.read_day(day, column) for column in columns}
@@ -1,4 +1,6 @@
 from .config_loader import load_config
 from .pd_csv_loader import load_csv_pd
+from .instrumentation import timed, instrument, count, set_sink
+from .settings import Settings, load_settings, SettingsWatcher
 
-__all__ = ['load_config', 'load_csv_pd']
+__all__ = ['load_config', 'load_csv_pd', 'timed', 'instrument', 'count', 'set_sink', 'Settings', 'load_settings', 'SettingsWatcher']
@@ -0,0 +1,107 @@
+# Compact, array backed buffers of stream values, in place of lists of floats or (value, timestamp) tuples
+from typing import Optional, Sequence
+
+import numpy as np
+
+
+class ArrayBuffer:
+  """
+  Growable NumPy array of rows, e.g. values or (value, minute) features, at
+  8 or 16 bytes a point instead of a boxed float or tuple of them. Appending
+  is amortised O(1) by doubling the capacity. With maxlen set only the most
+  recent maxlen rows are kept, as a deque with maxlen would, and they're
+  always contiguous so view() never copies.
+  """
+  def __init__(
+      self,
+      columns: Optional[int] = None,
+      dtype=np.float64,
+      maxlen: Optional[int] = None,
+      capacity: int = 1440
+  ):
+    """
+    :param columns: Values per row, None for a 1D buffer of values
+    :param dtype: Array type, float32 halves the memory where the consumer computes in float32 anyway
+    :param maxlen: Rows kept, unbounded if not given
+    :param capacity: Rows allocated up front
+    """
+    self.columns = columns
+    self.maxlen = maxlen
+    capacity = max(1, capacity if maxlen is None else min(capacity, 2 * maxlen))
+    self._data = np.empty(self._shape(capacity), dtype=dtype)
+    self._start = 0
+    self._end = 0
+
+  def _shape(self, rows):
+    return (rows,) if self.columns is None else (rows, self.columns)
+
+  def __len__(self):
+    return self._end - self._start
+
+  @property
+  def dtype(self):
+    return self._data.dtype
+
+  def _reserve(self, extra):
+    """Makes room for extra rows at the end, moving the kept rows to the front or growing"""
+    length = len(self)
+    if self._end + extra <= len(self._data):
+      return
+    needed = length + extra
+    if needed <= len(self._data) // 2 or (self.maxlen is not None and needed <= len(self._data)):
+      # Enough room once the dropped rows are reclaimed
+      self._data[:length] = self._data[self._start:self._end]
+    else:
+      capacity = max(needed, 2 * len(self._data))
+      if self.maxlen is not None:
+        capacity = min(capacity, max(needed, 2 * self.maxlen))
+      data = np.empty(self._shape(capacity), dtype=self._data.dtype)
+      data[:length] = self._data[self._start:self._end]
+      self._data = data
+    self._start, self._end = 0, length
+
+  def extend(self, rows: Sequence) -> None:
+    """Appends rows, an array or anything np.asarray takes, dropping the oldest past maxlen"""
+    rows = np.asarray(rows, dtype=self._data.dtype)
+    if self.columns is not None:
+      rows = rows.reshape(-1, self.columns)
+    if self.maxlen is not None and len(rows) >= self.maxlen:
+      # Only the last maxlen rows would survive
+      if len(self._data) < self.maxlen:
+        self._data = np.empty(self._shape(self.maxlen), dtype=self._data.dtype)
+      self._data[:self.maxlen] = rows[len(rows) - self.maxlen:]
+      self._start, self._end = 0, self.maxlen
+      return
+    self._reserve(len(rows))
+    self._data[self._end:self._end + len(rows)] = rows
+    self._end += len(rows)
+    if self.maxlen is not None and len(self) > self.maxlen:
+      self._start = self._end - self.maxlen
+
+  def append(self, row) -> None:
+    self.extend([row])
+
+  def clear(self) -> None:
+    self._start = self._end = 0
+
+  def view(self) -> np.ndarray:
+    """The rows as an array sharing the buffer's memory, valid until the buffer is next extended"""
+    return self._data[self._start:self._end]
+
+  def __array__(self, dtype=None, copy=None):
+    return self.view() if dtype is None else self.view().astype(dtype)
+
+  def __getitem__(self, index):
+    return self.view()[index]
+
+  def __getstate__(self):
+    # Only the rows are pickled, not the spare capacity
+    return {"columns": self.columns, "maxlen": self.maxlen, "data": self.view().copy()}
+
+  def __setstate__(self, state):
+    self.columns = state["columns"]
+    self.maxlen = state["maxlen"]
+    self._data = state["data"]
+    self._start, self._end = 0, len(self._data)
+    if len(self._data) == 0:
+      self._data = np.empty(self._shape(1), dtype=self._data.dtype)
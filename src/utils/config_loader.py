@@ -1,7 +1,10 @@
 import os
 import json
 
-def load_config(file_path='config.json'):
+# The config lives with the simulator's baseline data
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'simulator', 'config.json')
+
+def load_config(file_path=CONFIG_PATH):
   config_path = os.path.join(os.path.dirname(__file__), file_path)
   try:
     with open(config_path, 'r') as file:
@@ -13,4 +16,4 @@ def load_config(file_path='config.json'):
       "max_capacity": 75,
       "baseline_file": "Monthly_Baselines.csv"
     }
-  return config
\ No newline at end of file
+  return config
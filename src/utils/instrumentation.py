@@ -0,0 +1,269 @@
+# Timers, counters and opt in profiling of the simulator and detector hot paths
+import cProfile
+import functools
+import json
+import os
+import pstats
+import threading
+import time
+from contextlib import nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Module level switches, checked on every call so the disabled path is one branch
+_sink = None
+_profiled_stages = set()
+_profiles = {}
+_profile_lock = threading.Lock()
+_active_profile = None
+_NULL_CONTEXT = nullcontext()
+DEFAULT_PROFILE_DIR = "profiles"
+
+
+class StageStats:
+  """Count, total, min and max of a stage's durations in seconds"""
+  def __init__(self):
+    self.count = 0
+    self.total = 0.0
+    self.min = float("inf")
+    self.max = 0.0
+
+  def add(self, seconds):
+    self.count += 1
+    self.total += seconds
+    self.min = min(self.min, seconds)
+    self.max = max(self.max, seconds)
+
+  def as_dict(self):
+    return {"count": self.count, "total": self.total, "min": self.min, "max": self.max}
+
+
+class MetricsSink:
+  """Receives stage timings and counter increments"""
+  def record_timing(self, stage, seconds):
+    raise NotImplementedError
+
+  def record_count(self, name, value):
+    raise NotImplementedError
+
+  def close(self):
+    pass
+
+
+class InMemorySink(MetricsSink):
+  """Aggregates metrics in memory, constant size per stage and counter"""
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.timings = {}
+    self.counters = {}
+
+  def record_timing(self, stage, seconds):
+    with self.lock:
+      self.timings.setdefault(stage, StageStats()).add(seconds)
+
+  def record_count(self, name, value):
+    with self.lock:
+      self.counters[name] = self.counters.get(name, 0) + value
+
+  def snapshot(self):
+    with self.lock:
+      return {
+        "timings": {stage: stats.as_dict() for stage, stats in self.timings.items()},
+        "counters": dict(self.counters)
+      }
+
+
+class JsonLinesSink(MetricsSink):
+  """Appends every metric as a JSON line, for offline analysis"""
+  def __init__(self, path):
+    self.lock = threading.Lock()
+    self.file = open(path, "a")
+
+  def _write(self, record):
+    with self.lock:
+      self.file.write(json.dumps(record) + "\n")
+
+  def record_timing(self, stage, seconds):
+    self._write({"time": time.time(), "type": "timing", "name": stage, "value": seconds})
+
+  def record_count(self, name, value):
+    self._write({"time": time.time(), "type": "count", "name": name, "value": value})
+
+  def close(self):
+    with self.lock:
+      self.file.close()
+
+
+class PrometheusSink(InMemorySink):
+  """Aggregates in memory and serves the Prometheus text format on localhost"""
+  def __init__(self, port=9100, host="127.0.0.1"):
+    super().__init__()
+    sink = self
+
+    class Handler(BaseHTTPRequestHandler):
+      def do_GET(self):
+        body = sink.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+      def log_message(self, format, *args):
+        pass
+
+    self.server = ThreadingHTTPServer((host, port), Handler)
+    self.port = self.server.server_address[1]
+    self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+    self.thread.start()
+
+  def render(self):
+    snapshot = self.snapshot()
+    lines = ["# TYPE anomaly_stage_seconds summary"]
+    for stage, stats in sorted(snapshot["timings"].items()):
+      lines.append('anomaly_stage_seconds_sum{{stage="{}"}} {}'.format(stage, stats["total"]))
+      lines.append('anomaly_stage_seconds_count{{stage="{}"}} {}'.format(stage, stats["count"]))
+    lines.append("# TYPE anomaly_events_total counter")
+    for name, value in sorted(snapshot["counters"].items()):
+      lines.append('anomaly_events_total{{name="{}"}} {}'.format(name, value))
+    return "\n".join(lines) + "\n"
+
+  def close(self):
+    self.server.shutdown()
+    self.server.server_close()
+
+
+def set_sink(sink):
+  """Sets the metrics sink, None turns instrumentation off. Returns the previous sink."""
+  global _sink
+  previous = _sink
+  _sink = sink
+  return previous
+
+
+def get_sink():
+  return _sink
+
+
+class _StageTimer:
+  def __init__(self, stage):
+    self.stage = stage
+    self.profile = None
+
+  def __enter__(self):
+    global _active_profile
+    # cProfile can only run one profiler at a time, nested stages are covered by the outer one
+    if self.stage in _profiled_stages and _active_profile is None:
+      with _profile_lock:
+        self.profile = _profiles.setdefault(self.stage, cProfile.Profile())
+      _active_profile = self.profile
+      self.profile.enable()
+    self.start = time.perf_counter()
+    return self
+
+  def __exit__(self, *exc):
+    global _active_profile
+    elapsed = time.perf_counter() - self.start
+    if self.profile is not None:
+      self.profile.disable()
+      _active_profile = None
+    if _sink is not None:
+      _sink.record_timing(self.stage, elapsed)
+    return False
+
+
+def timed(stage):
+  """
+  Context manager timing a stage. Returns a shared no-op context when
+  instrumentation and profiling are off.
+
+  :param stage: Name of the stage, e.g. "simulator.generate_day"
+  """
+  if _sink is None and stage not in _profiled_stages:
+    return _NULL_CONTEXT
+  return _StageTimer(stage)
+
+
+def instrument(stage):
+  """Decorator timing every call of a function as a stage"""
+  def decorator(func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+      if _sink is None and stage not in _profiled_stages:
+        return func(*args, **kwargs)
+      with _StageTimer(stage):
+        return func(*args, **kwargs)
+    return wrapper
+  return decorator
+
+
+def count(name, value=1):
+  """Increments a counter, no-op when instrumentation is off"""
+  if _sink is not None:
+    _sink.record_count(name, value)
+
+
+def enable_profiling(*stages):
+  """Runs cProfile around every call of the given stages"""
+  _profiled_stages.update(stages)
+
+
+def disable_profiling():
+  _profiled_stages.clear()
+
+
+def profile_stats(stage):
+  """
+  Profile collected for a stage.
+
+  :param stage: Stage name passed to enable_profiling
+  :return: pstats.Stats or None if the stage hasn't run while profiled
+  """
+  profile = _profiles.get(stage)
+  if profile is None:
+    return None
+  return pstats.Stats(profile)
+
+
+def dump_profiles(directory=DEFAULT_PROFILE_DIR):
+  """
+  Writes each stage's profile to <directory>/<stage>.prof for snakeviz or pstats.
+
+  :return: Paths written, none if nothing was profiled
+  """
+  paths = []
+  if _profiles:
+    os.makedirs(directory, exist_ok=True)
+  for stage, profile in _profiles.items():
+    path = os.path.join(directory, "{}.prof".format(stage))
+    profile.dump_stats(path)
+    paths.append(path)
+  return paths
+
+
+def configure_from_env(environ=None):
+  """
+  Turns on instrumentation from environment variables, so it can be enabled
+  in production without code changes.
+
+  ANOMALY_METRICS: "memory", "jsonl:<path>" or "prometheus:<port>"
+  ANOMALY_PROFILE: Comma separated stages to profile
+  ANOMALY_PROFILE_DIR: Directory the profiles are dumped to on exit, see dump_profiles
+
+  :return: The sink that was set, or None
+  """
+  environ = os.environ if environ is None else environ
+  spec = environ.get("ANOMALY_METRICS", "")
+  kind, _, argument = spec.partition(":")
+
+  if kind == "memory":
+    set_sink(InMemorySink())
+  elif kind == "jsonl":
+    set_sink(JsonLinesSink(argument or "metrics.jsonl"))
+  elif kind == "prometheus":
+    set_sink(PrometheusSink(int(argument or 9100)))
+  elif kind:
+    raise ValueError("Unknown ANOMALY_METRICS sink {}".format(kind))
+
+  stages = [stage.strip() for stage in environ.get("ANOMALY_PROFILE", "").split(",") if stage.strip()]
+  enable_profiling(*stages)
+  return _sink
@@ -1,8 +1,15 @@
 import pandas as pd
 
-def load_csv_pd(filename):
+def load_csv_pd(filename, column='Value'):
+  """
+  Loads a single numeric column from a csv file.
+
+  :param filename: Path to the csv file
+  :param column: Name of the column to load
+  :return: pandas Series of the column
+  """
   try:
-    df = pd.read_csv(filename)['Value']
+    df = pd.read_csv(filename, usecols=[column], dtype={column: 'float64'})[column]
   except FileNotFoundError as e:
     print("ERROR: The monthly baseline csv file was not found: {}".format(e))
     raise
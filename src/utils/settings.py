@@ -0,0 +1,338 @@
+# Typed, validated runtime settings read from config.json, reloaded when the file changes
+import json
+import os
+import collections.abc
+from dataclasses import dataclass, field, fields, asdict, is_dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union, get_args, get_origin
+
+from .config_loader import CONFIG_PATH
+from .instrumentation import count
+
+ANOMALY_TYPES = ('outage', 'leak', 'surge', 'sensor_fault')
+MINUTES_PER_DAY = 1440
+
+# Settings that take effect while a stream is running, by section. None is the whole section, the
+# others are read when it starts. n_threads and n_jobs reach the detector through detector_config
+HOT_SETTINGS = {
+  "detector_params": None,
+  "retraining": None,
+  "performance": ("n_threads", "n_jobs", "update_interval"),
+  "output": ("event_max_gap", "max_alert_events")
+}
+
+
+def _check(condition, message):
+  if not condition:
+    raise ValueError("ERROR: Invalid setting, {}".format(message))
+
+
+def matches_type(value, annotation) -> bool:
+  """
+  Whether a value read from JSON fits a type annotation. Lists pass for tuples,
+  ints for floats, and bools only for bools.
+  """
+  if annotation is Any or annotation is object:
+    return True
+  if annotation is type(None):
+    return value is None
+  origin, args = get_origin(annotation), get_args(annotation)
+  if origin is Union:
+    return any(matches_type(value, arg) for arg in args)
+  if annotation is float:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+  if annotation is int:
+    return isinstance(value, int) and not isinstance(value, bool)
+  if origin is tuple:
+    return (isinstance(value, (list, tuple)) and len(value) == len(args)
+            and all(matches_type(item, arg) for item, arg in zip(value, args)))
+  if origin is dict:
+    return isinstance(value, dict) and (not args or all(
+      matches_type(key, args[0]) and matches_type(item, args[1]) for key, item in value.items()
+    ))
+  if origin in (list, collections.abc.Sequence):
+    return isinstance(value, (list, tuple)) and (not args or all(matches_type(item, args[0]) for item in value))
+  return isinstance(value, origin or annotation)
+
+
+def type_name(annotation) -> str:
+  """Readable name of a type annotation for error messages"""
+  return getattr(annotation, "__name__", None) if get_origin(annotation) is None else str(annotation).replace("typing.", "")
+
+
+def _from_dict(cls, values, section):
+  """Builds a settings dataclass from a dictionary, rejecting keys it doesn't have and values of the wrong type"""
+  _check(isinstance(values, dict), "{} must be an object".format(section))
+  types = {item.name: item.type for item in fields(cls)}
+  unknown = set(values) - set(types)
+  _check(not unknown, "unknown keys {} in {}".format(sorted(unknown), section))
+  for name, value in values.items():
+    _check(matches_type(value, types[name]),
+           "{} in {} must be {}, got {!r}".format(name, section, type_name(types[name]), value))
+  return cls(**values)
+
+
+@dataclass(frozen=True)
+class SimulatorSettings:
+  pipeline_name: str = "Easington-Langeled"
+  max_capacity: float = 75
+  baseline_file: str = "Monthly_Baselines.csv"
+  duration: int = 1000 # days
+  anomaly_threshold: float = 0.005 # daily chance of an anomaly starting
+  anomaly_min_duration: int = 1 # minutes
+  anomaly_max_duration: int = 5000 # minutes
+  anomaly_multiplier_bounds: Dict[str, Tuple[float, float]] = field(default_factory=lambda: {
+    "outage": (0, 0),
+    "leak": (0.9, 0.95),
+    "surge": (1.05, 1.1),
+    "sensor_fault": (-5, 5)
+  })
+
+  def __post_init__(self):
+    _check(self.max_capacity > 0, "simulator.max_capacity must be positive")
+    _check(self.duration > 0, "simulator.duration must be positive")
+    _check(0 <= self.anomaly_threshold <= 1, "simulator.anomaly_threshold must be a probability")
+    _check(1 <= self.anomaly_min_duration <= self.anomaly_max_duration,
+           "simulator anomaly durations must satisfy 1 <= min <= max")
+    _check(set(self.anomaly_multiplier_bounds) == set(ANOMALY_TYPES),
+           "simulator.anomaly_multiplier_bounds needs bounds for {}".format(list(ANOMALY_TYPES)))
+    for name, (low, high) in self.anomaly_multiplier_bounds.items():
+      _check(low <= high, "the {} multiplier bounds must be (low, high)".format(name))
+    # JSON has lists, the simulator expects tuples
+    object.__setattr__(self, "anomaly_multiplier_bounds", {
+      name: tuple(self.anomaly_multiplier_bounds[name]) for name in ANOMALY_TYPES
+    })
+
+  def multiplier_bounds(self) -> List[Tuple[float, float]]:
+    """Bounds in the order of ANOMALY_TYPES"""
+    return [self.anomaly_multiplier_bounds[name] for name in ANOMALY_TYPES]
+
+
+@dataclass(frozen=True)
+class RetrainingSettings:
+  """Overrides of the retraining parameters of every detector that retrains, None keeps each detector's own"""
+  interval_days: Optional[int] = None
+  training_days: Optional[int] = None
+
+  def __post_init__(self):
+    _check(self.interval_days is None or self.interval_days > 0, "retraining.interval_days must be positive")
+    _check(self.training_days is None or self.training_days > 0, "retraining.training_days must be positive")
+
+  def detector_params(self, name: str) -> dict:
+    """The overrides in the units of the named detector's parameters"""
+    params = {}
+    if name in ("IF3", "IF_detector2") and self.training_days is not None:
+      params["training_days"] = self.training_days
+    if name == "IF3" and self.interval_days is not None:
+      params["retrain_interval"] = self.interval_days
+    if name == "IF_detector2" and self.interval_days is not None:
+      params["retrain_interval"] = self.interval_days * MINUTES_PER_DAY
+    return params
+
+
+@dataclass(frozen=True)
+class PerformanceSettings:
+  n_threads: Optional[int] = None # ensemble members run on, one each by default
+  n_jobs: int = 1 # processes building the time aware forest
+  window_size: Optional[int] = None # minutes, None detects a day at a time
+  window_step: Optional[int] = None # minutes
+  update_interval: int = 100 # milliseconds between plot updates
+  alert_queue_size: int = 1000 # alerts buffered per sink
+  alert_batch_size: int = 20 # alerts sent to a sink at a time
+  checkpoint_every_days: int = 1
+  separate_processes: bool = False # run the simulator and detector in their own processes
+
+  def __post_init__(self):
+    _check(self.n_threads is None or self.n_threads >= 1, "performance.n_threads must be at least 1")
+    _check(self.n_jobs >= 1, "performance.n_jobs must be at least 1")
+    _check((self.window_size is None) == (self.window_step is None),
+           "performance.window_size and window_step must be set together")
+    _check(self.window_size is None or self.window_size >= self.window_step > 0,
+           "performance.window_size must be at least window_step")
+    _check(self.update_interval > 0, "performance.update_interval must be positive")
+    _check(self.alert_queue_size > 0 and self.alert_batch_size > 0, "performance alert sizes must be positive")
+    _check(self.checkpoint_every_days >= 1, "performance.checkpoint_every_days must be at least 1")
+
+
+@dataclass(frozen=True)
+class OutputSettings:
+  """Overridden by the ANOMALY_* environment variables when they're set"""
+  metrics: Optional[str] = None # "memory", "jsonl:<path>" or "prometheus:<port>"
+  profile: List[str] = field(default_factory=list) # stages to profile
+  profile_dir: Optional[str] = None # directory profiles are written to on exit, "profiles" by default
+  alerts: List[str] = field(default_factory=list) # alert sink specs
+  checkpoint: Optional[str] = None # checkpoint file
+  event_max_gap: int = 5 # minutes between flags of the same anomaly event
+  max_alert_events: int = 3 # events listed in the alert box
+
+  def __post_init__(self):
+    _check(self.metrics is None or self.metrics.partition(":")[0] in ("memory", "jsonl", "prometheus"),
+           "output.metrics must be memory, jsonl:<path> or prometheus:<port>")
+    _check(self.event_max_gap >= 0, "output.event_max_gap can't be negative")
+    _check(self.max_alert_events >= 1, "output.max_alert_events must be at least 1")
+
+  def environ(self, environ=None) -> dict:
+    """
+    The output settings as the ANOMALY_* environment variables read by the
+    metrics, alerts and checkpoints, with any variables already set taking priority.
+    """
+    environ = os.environ if environ is None else environ
+    settings = {
+      "ANOMALY_METRICS": self.metrics or "",
+      "ANOMALY_PROFILE": ",".join(self.profile),
+      "ANOMALY_PROFILE_DIR": self.profile_dir or "",
+      "ANOMALY_ALERTS": ",".join(self.alerts),
+      "ANOMALY_CHECKPOINT": self.checkpoint or ""
+    }
+    return {**settings, **{name: value for name, value in environ.items() if name in settings}}
+
+
+@dataclass(frozen=True)
+class Settings:
+  simulator: SimulatorSettings = field(default_factory=SimulatorSettings)
+  detector: str = "IF_detector2"
+  detector_params: Dict[str, dict] = field(default_factory=dict)
+  retraining: RetrainingSettings = field(default_factory=RetrainingSettings)
+  performance: PerformanceSettings = field(default_factory=PerformanceSettings)
+  output: OutputSettings = field(default_factory=OutputSettings)
+
+  def __post_init__(self):
+    _check(isinstance(self.detector, str) and self.detector, "detector must be a detector name")
+    _check(all(isinstance(params, dict) for params in self.detector_params.values()),
+           "detector_params must map detector names to objects")
+
+  @classmethod
+  def from_dict(cls, config: dict) -> "Settings":
+    """
+    Reads the layout of config.json. The pipeline name, capacity and baseline file
+    stay at the top level where the baseline tools read them.
+    """
+    _check(isinstance(config, dict), "the config must be an object")
+    config = dict(config)
+    simulator = config.pop("simulator", {})
+    _check(isinstance(simulator, dict), "simulator must be an object")
+    simulator = dict(simulator)
+    for key in ("pipeline_name", "max_capacity", "baseline_file"):
+      if key in config:
+        simulator[key] = config.pop(key)
+    sections = {
+      "retraining": RetrainingSettings,
+      "performance": PerformanceSettings,
+      "output": OutputSettings
+    }
+    values = {name: _from_dict(section, config.pop(name), name) for name, section in sections.items() if name in config}
+    values["simulator"] = _from_dict(SimulatorSettings, simulator, "simulator")
+    return _from_dict(cls, {**config, **values}, "the config")
+
+  def to_dict(self) -> dict:
+    config = asdict(self)
+    simulator = config.pop("simulator")
+    top_level = {key: simulator.pop(key) for key in ("pipeline_name", "max_capacity", "baseline_file")}
+    return {**top_level, "simulator": simulator, **config}
+
+  def detector_config(self) -> dict:
+    """
+    The detector's parameters, with the retraining and performance settings
+    applied to the detectors they concern
+    """
+    params = dict(self.detector_params.get(self.detector, {}))
+    params.update(self.retraining.detector_params(self.detector))
+    if self.detector == "ensemble" and self.performance.n_threads is not None:
+      params["n_threads"] = self.performance.n_threads
+    if self.detector == "IF_detector":
+      params["n_jobs"] = self.performance.n_jobs
+    return params
+
+  def changed_sections(self, other: "Settings") -> List[str]:
+    """Names of the top level settings that differ from other's"""
+    return [item.name for item in fields(self) if getattr(self, item.name) != getattr(other, item.name)]
+
+  def restart_changes(self, other: "Settings") -> List[str]:
+    """
+    Settings that differ from other's and only take effect on restart, see HOT_SETTINGS.
+    Settings in a section are named like "performance.window_size", the others like "detector".
+    """
+    changes = []
+    for section in self.changed_sections(other):
+      if section in HOT_SETTINGS and HOT_SETTINGS[section] is None:
+        continue
+      new, old = getattr(self, section), getattr(other, section)
+      if not is_dataclass(new):
+        changes.append(section)
+        continue
+      hot = HOT_SETTINGS.get(section, ())
+      changes += ["{}.{}".format(section, item.name) for item in fields(new)
+                  if item.name not in hot and getattr(new, item.name) != getattr(old, item.name)]
+    return changes
+
+
+def load_settings(file_path: str = CONFIG_PATH) -> Settings:
+  """
+  Reads and validates the settings, the defaults are used if there's no config file.
+
+  :param file_path: JSON config file
+  :return: Settings
+  """
+  if not os.path.exists(file_path):
+    count("settings.defaults")
+    return Settings()
+  with open(file_path, 'r') as file:
+    try:
+      config = json.load(file)
+    except json.JSONDecodeError as e:
+      raise ValueError("ERROR: Config {} isn't valid JSON: {}".format(file_path, e))
+  return Settings.from_dict(config)
+
+
+class SettingsWatcher:
+  """
+  Reloads the settings when the config file changes. The stream polls it between
+  batches, which is one stat of the file, and applies the new settings it returns.
+  A config that fails validation is ignored, keeping the current settings, so a
+  mistake while editing the file doesn't stop the stream.
+  """
+  def __init__(
+      self,
+      file_path: str = CONFIG_PATH,
+      validate: Optional[Callable[[Settings], None]] = None,
+      settings: Optional[Settings] = None
+  ):
+    """
+    :param file_path: JSON config file
+    :param validate: Further checks of new settings, raising ValueError or TypeError, e.g. the detector parameters
+    :param settings: Current settings, loaded from the file if not given
+    """
+    self.file_path = file_path
+    self.validate = validate
+    self.modified = self._modified()
+    self.settings = settings if settings is not None else load_settings(file_path)
+    self.error = None
+
+  def _modified(self):
+    try:
+      return os.stat(self.file_path).st_mtime_ns
+    except FileNotFoundError:
+      return None
+
+  def poll(self) -> Optional[Settings]:
+    """
+    :return: The new settings if the file changed and they're valid, otherwise None
+    """
+    modified = self._modified()
+    if modified == self.modified:
+      return None
+    self.modified = modified
+    try:
+      settings = load_settings(self.file_path)
+      if self.validate is not None:
+        self.validate(settings)
+    except (TypeError, ValueError) as e:
+      self.error = e
+      count("settings.invalid")
+      return None
+    self.error = None
+    if settings == self.settings:
+      return None
+    self.settings = settings
+    count("settings.reloaded")
+    return settings
+
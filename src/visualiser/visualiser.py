@@ -1,33 +1,77 @@
+import numpy as np
 import matplotlib;matplotlib.use("TkAgg")
 from matplotlib.animation import FuncAnimation
-from src.simulator import simulator, anomalous_simulator
-from src.detector import detector
+from src.simulator import simulator, anomalous_simulator, windowed_anomalous_simulator
+from src.detector import detector_from_settings, check_detector_settings, reconfigure_detector, run_stream
+from src.detector.events import EventAggregator
+from src.alerts import submit_alert
+from src.storage import checkpointed_stream, checkpoint_position, RollupPyramid, ProcessPipeline
 import matplotlib.pyplot as plt
-from src.utils import load_config
+from src.utils import SettingsWatcher, timed
+from src.utils.buffers import ArrayBuffer
+
+# Settings are reloaded from config.json while the simulation runs
+settings_watcher = SettingsWatcher(validate=check_detector_settings)
+settings = settings_watcher.settings
 
 # Global simulation variables
-SIMULATION_DURATION = 1000
+SIMULATION_DURATION = settings.simulator.duration
 MINUTES_PER_DAY = 1440
-UPDATE_INTERVAL = 100  # milliseconds
-
-# PICK SIMULATOR
-#simulation = simulator(duration=SIMULATION_DURATION)
-#simulation = anomalous_simulator(sim_duration=SIMULATION_DURATION)
-simulation = detector(duration = SIMULATION_DURATION)
+UPDATE_INTERVAL = settings.performance.update_interval  # milliseconds
+# Sliding window detection, e.g. 60 minute windows every 5 minutes. None detects a day at a time
+WINDOW_SIZE = settings.performance.window_size  # minutes
+WINDOW_STEP = settings.performance.window_step  # minutes
+# Checkpoint file to resume from after a restart, checkpointing is off if not set
+CHECKPOINT_PATH = settings.output.environ()["ANOMALY_CHECKPOINT"] or None
 
+# Raw minutes plotted, longer views are plotted from the rollups' coarsest adequate level
+MAX_PLOT_POINTS = 1440 * 14
+MINUTES_PER_YEAR = 525960
 
+EVENT_MAX_GAP = settings.output.event_max_gap  # minutes between flags of the same anomaly event
+MAX_ALERT_EVENTS = settings.output.max_alert_events  # events listed in the alert box
 
-config = load_config()
-try:
-  terminal_name = config['pipeline_name']
-except KeyError:
-  terminal_name = 'Easington Langeled'
-
-
-
-x_vals = []
-y_vals = []
-x_days = 0
+# PICK SIMULATOR, the detector is chosen by name in config.json
+#simulation = simulator(duration=SIMULATION_DURATION)
+#simulation = anomalous_simulator(sim_duration=SIMULATION_DURATION)
+# Anomaly events carry on across batches, and across restarts when checkpointing
+event_aggregator = EventAggregator(max_gap=EVENT_MAX_GAP)
+# The detector runs in this process, except with separate processes where the pipeline's stage runs its own copy
+detector = None
+pipeline = None
+if not settings.performance.separate_processes or CHECKPOINT_PATH:
+  detector = detector_from_settings(settings)
+else:
+  check_detector_settings(settings)
+if CHECKPOINT_PATH:
+  if settings.performance.separate_processes:
+    print("Checkpointing runs the detector in this process, separate_processes is ignored")
+  # Only the window's new values are pushed to the detector, so windows are checkpointed as batches of their step
+  simulation = checkpointed_stream(detector, CHECKPOINT_PATH, duration=SIMULATION_DURATION,
+                                   step=WINDOW_STEP if WINDOW_SIZE else None,
+                                   every_days=settings.performance.checkpoint_every_days, events=event_aggregator)
+elif settings.performance.separate_processes:
+  # The simulator and detector each get a core, streaming to the plot through shared memory
+  if WINDOW_SIZE and WINDOW_STEP:
+    source, source_params = windowed_anomalous_simulator, {"duration": SIMULATION_DURATION, "window": WINDOW_SIZE, "step": WINDOW_STEP}
+  else:
+    source, source_params = anomalous_simulator, {"duration": SIMULATION_DURATION}
+  pipeline = ProcessPipeline(source, source_params, {settings.detector: settings.detector_config()})
+  simulation = pipeline.stream()
+elif WINDOW_SIZE and WINDOW_STEP:
+  simulation = run_stream(detector, windowed_anomalous_simulator(duration=SIMULATION_DURATION, window=WINDOW_SIZE, step=WINDOW_STEP))
+else:
+  simulation = run_stream(detector, anomalous_simulator(duration=SIMULATION_DURATION))
+
+terminal_name = settings.simulator.pipeline_name
+
+
+
+# Plotted values, their times in days are implicit from the first minute plotted
+plot_start = checkpoint_position(CHECKPOINT_PATH) if CHECKPOINT_PATH else 0
+y_vals = ArrayBuffer(maxlen=MAX_PLOT_POINTS)
+rollups = RollupPyramid()
+x_minutes = plot_start
 
 def setup_plot():
   # Setup figure and window
@@ -55,20 +99,69 @@ def setup_plot():
 
   return fig, ax1, ax2, line, alert_text
 
+def plot_event_line(ax1, minute):
+  ax1.plot([minute / MINUTES_PER_DAY] * 2, [20, 80], color='red', alpha=0.5)
+
+def send_alert(event):
+  alert = event.to_dict()
+  alert["terminal"] = terminal_name
+  alert["message"] = event.describe()
+  submit_alert(alert)
+
+def reload_settings():
+  """
+  Applies a changed config.json between batches, keeping the detector's state.
+  Changes to the simulator, the choice of detector, the windows, the alert and
+  checkpoint set up and the outputs take effect on restart, see HOT_SETTINGS, as
+  do detector parameters when the detector runs in its own process.
+  """
+  global settings, MAX_ALERT_EVENTS
+  new_settings = settings_watcher.poll()
+  if new_settings is None:
+    return
+  restart = new_settings.restart_changes(settings)
+
+  old_params, new_params = settings.detector_config(), new_settings.detector_config()
+  changed = {name: value for name, value in new_params.items() if old_params.get(name) != value}
+  if new_settings.detector == settings.detector and changed:
+    restart += reconfigure_detector(detector, changed) if detector is not None else sorted(changed)
+  if restart:
+    print("Settings {} take effect on restart".format(", ".join(restart)))
+
+  event_aggregator.max_gap = new_settings.output.event_max_gap
+  MAX_ALERT_EVENTS = new_settings.output.max_alert_events
+  ani.event_source.interval = new_settings.performance.update_interval
+  settings = new_settings
+
 def animate(i, line, ax1, alert_text):
-  global x_days, x_vals, y_vals
+  global x_minutes
   try:
+    reload_settings()
     try:
-      datastream, anomaly_indices = next(simulation)
+      with timed("visualiser.next_batch"):
+        datastream, anomaly_indices = next(simulation)
+
+      # Merge flagged minutes into events, which carry on across batches
+      batch_start = x_minutes
+      closed_events = event_aggregator.push(batch_start, datastream, anomaly_indices)
+      open_event = event_aggregator.open_event
+
+      # Plot each anomaly event as 2 straight red lines at its start and end, and alert when it starts and ends
+      for event in closed_events:
+        if event.start >= batch_start:
+          plot_event_line(ax1, event.start)
+        plot_event_line(ax1, event.end)
+        send_alert(event)
+      if open_event is not None and open_event.start >= batch_start:
+        plot_event_line(ax1, open_event.start)
+        send_alert(open_event)
 
       # Update alert text based on anomalies
-      if anomaly_indices:
-        alert_text.set_text(f'ANOMALY DETECTED!\nAt minute(s): {", ".join(map(str, anomaly_indices))}')
+      active_events = ([open_event] if open_event is not None else []) + closed_events[::-1]
+      if active_events:
+        descriptions = "\n".join(event.describe() for event in active_events[:MAX_ALERT_EVENTS])
+        alert_text.set_text(f'ANOMALY DETECTED!\n{descriptions}')
         alert_text.set_bbox(dict(facecolor='red', edgecolor='darkred', alpha=0.3))
-
-        # Plot anomaly as a 2 straight red lines with the anomalies inbetween
-        ax1.plot([anomaly_indices[0] / 1440 for _ in range(20, 80)], [j for j in range(20, 80)], color='red', alpha=0.5)
-        ax1.plot([anomaly_indices[-1] / 1440 for _ in range(20, 80)], [j for j in range(20, 80)], color='red',alpha=0.5)
       else:
         alert_text.set_text('No anomalies detected')
         alert_text.set_bbox(dict(facecolor='white', edgecolor='gray', alpha=0.8))
@@ -77,21 +170,25 @@ def animate(i, line, ax1, alert_text):
     except ValueError:
       datastream = next(simulation)
 
-    x_vals.extend([x_days + (i/1440) for i in range(1440)])  # Convert minutes to days
-    y_vals.extend(datastream)
-    x_days += 1
-
-    # Update the line data
-    line.set_data(x_vals, y_vals)
-    # Scroll the x-axis
-    if len(x_vals) > 525960:
-      ax1.set_xlim(x_vals[-525960], x_vals[-1])
-
-
+    with timed("visualiser.render"):
+      # Batches are a day or a window step long
+      y_vals.extend(datastream)
+      rollups.extend(datastream, x_minutes)
+      x_minutes += len(datastream)
+      if x_minutes - plot_start <= MAX_PLOT_POINTS:
+        x_vals = (plot_start + np.arange(len(y_vals))) / MINUTES_PER_DAY  # Convert minutes to days
+        line.set_data(x_vals, y_vals.view())
+      else:
+        # Too long to plot every minute, plot the means of the finest buckets that fit
+        view = rollups.query(plot_start, x_minutes, max_points=MAX_PLOT_POINTS)
+        line.set_data(view.start / MINUTES_PER_DAY, view.mean)
+      # Scroll the x-axis
+      if x_minutes - plot_start > MINUTES_PER_YEAR:
+        ax1.set_xlim((x_minutes - MINUTES_PER_YEAR) / MINUTES_PER_DAY, x_minutes / MINUTES_PER_DAY)
 
-    # Adjust the view limits
-    ax1.relim()
-    ax1.autoscale_view()
+      # Adjust the view limits
+      ax1.relim()
+      ax1.autoscale_view()
 
     #plt.tight_layout()
 
@@ -110,7 +207,12 @@ def main():
     interval=UPDATE_INTERVAL
   )
 
-  plt.show()
+  try:
+    plt.show()
+  finally:
+    # Stop the stage processes and free the shared memory now, rather than whenever the generator is collected
+    if pipeline is not None:
+      pipeline.close()
 
 
 if __name__ == "__main__":
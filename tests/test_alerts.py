@@ -0,0 +1,208 @@
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from src.alerts import (
+    AlertDispatcher, AlertSink, FileSink, WebhookSink, UnixSocketSink, SyslogSink, sink_from_spec,
+    set_dispatcher, submit_alert, configure_from_env
+)
+
+
+class ListSink(AlertSink):
+    name = "list"
+
+    def __init__(self, failures=0, delay=0.0):
+        self.batches = []
+        self.failures = failures
+        self.delay = delay
+        self.release = threading.Event()
+        self.release.set()
+
+    def send(self, alerts):
+        self.release.wait()
+        time.sleep(self.delay)
+        if self.failures:
+            self.failures -= 1
+            raise OSError("Sink unavailable")
+        self.batches.append(list(alerts))
+
+    @property
+    def alerts(self):
+        return [alert for batch in self.batches for alert in batch]
+
+
+def alert(start, closed=False):
+    return {"start": start, "end": start + 10, "type": "outage", "closed": closed}
+
+
+class TestAlertDispatcher(unittest.TestCase):
+    def test_batched_delivery(self):
+        """Test alerts are delivered in batches of at most batch_size"""
+        sink = ListSink()
+        dispatcher = AlertDispatcher([sink], batch_size=4, rate=None)
+        for start in range(10):
+            dispatcher.submit(alert(start))
+        self.assertTrue(dispatcher.flush(5))
+        dispatcher.close()
+        self.assertEqual([a["start"] for a in sink.alerts], list(range(10)))
+        self.assertTrue(all(len(batch) <= 4 for batch in sink.batches))
+
+    def test_deduplication(self):
+        """Test repeated alerts are suppressed, but an event closing is still sent"""
+        sink = ListSink()
+        dispatcher = AlertDispatcher([sink], rate=None)
+        self.assertTrue(dispatcher.submit(alert(5)))
+        self.assertFalse(dispatcher.submit(alert(5)))
+        self.assertTrue(dispatcher.submit(alert(5, closed=True)))
+        dispatcher.close()
+        self.assertEqual(len(sink.alerts), 2)
+        self.assertEqual(dispatcher.stats()["suppressed"], 1)
+
+    def test_slow_sink_does_not_block(self):
+        """Test submitting to a stuck sink returns straight away and drops the oldest alerts"""
+        stuck = ListSink()
+        stuck.release.clear()
+        fast = ListSink()
+        dispatcher = AlertDispatcher([stuck, fast], queue_size=10, batch_size=5, rate=None)
+
+        start = time.perf_counter()
+        for minute in range(1000):
+            dispatcher.submit(alert(minute))
+        self.assertLess(time.perf_counter() - start, 1.0)
+
+        self.assertTrue(dispatcher.workers[1].flush(5))
+        stuck.release.set()
+        dispatcher.close()
+        stats = dispatcher.stats()["sinks"]["list"]
+        self.assertLessEqual(len(stuck.alerts), 15)
+        self.assertEqual(stuck.alerts[-1]["start"], 999)
+        self.assertEqual(dispatcher.workers[0].dropped + len(stuck.alerts), 1000)
+        self.assertEqual(len(fast.alerts), 1000 - dispatcher.workers[1].dropped)
+        self.assertIn("sent", stats)
+
+    def test_retries(self):
+        """Test failed batches are retried, then given up on"""
+        flaky = ListSink(failures=2)
+        dispatcher = AlertDispatcher([flaky], rate=None, retry_backoff=0.01)
+        dispatcher.submit(alert(1))
+        dispatcher.close()
+        self.assertEqual(len(flaky.alerts), 1)
+
+        broken = ListSink(failures=100)
+        dispatcher = AlertDispatcher([broken], rate=None, max_retries=2, retry_backoff=0.01)
+        dispatcher.submit(alert(1))
+        dispatcher.flush(5)
+        dispatcher.close()
+        self.assertEqual(broken.alerts, [])
+        self.assertEqual(dispatcher.workers[0].failed, 1)
+
+    def test_rate_limit(self):
+        """Test batches beyond the burst are delivered at the rate"""
+        sink = ListSink()
+        dispatcher = AlertDispatcher([sink], batch_size=1, rate=20, burst=1)
+        start = time.perf_counter()
+        for minute in range(5):
+            dispatcher.submit(alert(minute))
+        dispatcher.flush(5)
+        dispatcher.close()
+        self.assertEqual(len(sink.batches), 5)
+        self.assertGreaterEqual(time.perf_counter() - start, 0.15)
+
+    def test_module_dispatcher(self):
+        """Test submit_alert is a no-op until a dispatcher is set"""
+        self.assertFalse(submit_alert(alert(1)))
+        sink = ListSink()
+        set_dispatcher(AlertDispatcher([sink], rate=None))
+        try:
+            self.assertTrue(submit_alert(alert(1)))
+        finally:
+            set_dispatcher(None).close()
+        self.assertEqual(len(sink.alerts), 1)
+
+
+class TestAlertSinks(unittest.TestCase):
+    def test_file_sink(self):
+        """Test alerts are appended as JSON lines"""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "alerts.jsonl")
+            sink = FileSink(path)
+            sink.send([alert(1), alert(2)])
+            sink.close()
+            with open(path) as file:
+                self.assertEqual([json.loads(line)["start"] for line in file], [1, 2])
+
+    def test_webhook_sink(self):
+        """Test batches are POSTed as JSON"""
+        received = []
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                received.append(json.loads(self.rfile.read(int(self.headers["Content-Length"]))))
+                self.send_response(204)
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            WebhookSink("http://127.0.0.1:{}/alerts".format(server.server_address[1])).send([alert(1)])
+        finally:
+            server.shutdown()
+            server.server_close()
+        self.assertEqual(received, [[alert(1)]])
+
+    def test_unix_socket_sink(self):
+        """Test alerts are written as JSON lines to the socket"""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "alerts.sock")
+            server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            server.bind(path)
+            server.listen(1)
+
+            sink = UnixSocketSink(path)
+            sink.send([alert(1), alert(2)])
+            connection, _ = server.accept()
+            sink.close()
+            data = b""
+            while True:
+                chunk = connection.recv(4096)
+                if not chunk:
+                    break
+                data += chunk
+            connection.close()
+            server.close()
+        self.assertEqual([json.loads(line)["start"] for line in data.decode().splitlines()], [1, 2])
+
+    def test_syslog_unreachable(self):
+        """Test a syslog alert that can't be delivered raises so it is retried"""
+        sink = SyslogSink(address=os.path.join(tempfile.mkdtemp(), "missing.sock"))
+        with self.assertRaises(OSError):
+            sink.send([{"start": 1}])
+        sink.close()
+
+    def test_sink_from_spec(self):
+        """Test sinks are created from strings"""
+        self.assertIsInstance(sink_from_spec("webhook:http://localhost:8080/alerts"), WebhookSink)
+        self.assertIsInstance(sink_from_spec("unix:/tmp/alerts.sock"), UnixSocketSink)
+        syslog = sink_from_spec("syslog:localhost:514")
+        self.assertIsInstance(syslog, SyslogSink)
+        syslog.close()
+        with self.assertRaises(ValueError):
+            sink_from_spec("pager")
+        with self.assertRaises(ValueError):
+            sink_from_spec("webhook")
+
+    def test_configure_from_env(self):
+        """Test no dispatcher is set without ANOMALY_ALERTS"""
+        self.assertIsNone(configure_from_env({}))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,6 +4,9 @@ import random
 from src.simulator.anomalies import (
     inject_anomaly,
     anomalous_simulator,
+    labelled_anomalous_simulator,
+    PendingAnomaly,
+    SimulationState,
     ANOMALY_MULTIPLIER_BOUNDS,
     ANOMALY_MIN_DURATION,
     ANOMALY_MAX_DURATION,
@@ -131,6 +134,19 @@ class TestAnomalyInjection(unittest.TestCase):
         self.assertEqual(len(streams), 5)
         self.assertTrue(all(len(stream) == 1440 for stream in streams))
 
+    def test_anomaly_carries_over(self):
+        """Test an anomaly longer than the rest of the day carries on into the next days"""
+        state = SimulationState(pending=PendingAnomaly(anomaly_type=0, multiplier=0, remaining=2000))
+        (first, first_labels), (second, second_labels) = list(labelled_anomalous_simulator(0, 2, 0, state))
+
+        self.assertTrue(all(value == 0 for value in first))
+        self.assertEqual(set(first_labels), {1})
+        self.assertTrue(all(value == 0 for value in second[:560]))
+        self.assertTrue(all(value > 0 for value in second[560:]))
+        self.assertEqual(second_labels[:560].tolist(), [1] * 560)
+        self.assertEqual(state.day, 2)
+        self.assertIsNone(state.pending)
+
     def test_edge_cases(self):
         """Test various edge cases"""
         # Test with empty stream
@@ -0,0 +1,88 @@
+import copy
+import os
+import tempfile
+import unittest
+import numpy as np
+from src.benchmark.backfill import backfill, load_results, plan_chunks, score_days
+from src.detector import get_detector
+from src.simulator.simulator import generate_days
+from src.storage import StreamStore, save_checkpoint
+from src.storage.checkpoint import CHECKPOINT_VERSION
+
+
+class TestBackfill(unittest.TestCase):
+    def setUp(self):
+        """Set up a store of 6 nominal days with an outage on day 4"""
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = StreamStore(os.path.join(self.directory.name, "data"))
+        days = generate_days(range(6), np.random.default_rng(0))
+        for day, values in enumerate(days):
+            labels = np.zeros(1440, dtype=np.int8)
+            if day == 4:
+                values[600:700] = 0.0
+                labels[600:700] = 1
+            self.store.append_day(day, values, labels=labels)
+        self.output = os.path.join(self.directory.name, "results.npz")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_plan_chunks(self):
+        """Test chunks warm up on the stored days before them, including days before the range"""
+        chunks = plan_chunks([2, 3, 4, 5, 6], 2, 3, range(7))
+        self.assertEqual(chunks, [([2, 3], [0, 1]), ([4, 5], [1, 2, 3]), ([6], [3, 4, 5])])
+        self.assertEqual(plan_chunks([0, 1], 1, 0, [0, 1]), [([0], []), ([1], [])])
+        with self.assertRaises(ValueError):
+            plan_chunks([0], 0, 0, [0])
+
+    def test_columns(self):
+        """Test every minute of the range is written with its score, flag and label"""
+        summary = backfill(self.store.path, self.output, "EMA_detector", start_day=1, days=4, workers=1)
+        results = load_results(self.output)
+        self.assertEqual(summary["days"], 4)
+        np.testing.assert_array_equal(results["minutes"], np.arange(1440, 5 * 1440))
+        self.assertEqual(len(results["scores"]), len(results["flags"]))
+        self.assertEqual(results["labels"][3 * 1440 + 650], 1)
+        self.assertTrue(results["flags"][3 * 1440 + 600:3 * 1440 + 700].any())
+        self.assertIsNotNone(summary["accuracy"])
+
+    def test_single_chunk_matches_stream(self):
+        """Test one chunk without warm up is the same as pushing the days in turn"""
+        backfill(self.store.path, self.output, "EMA_detector", chunk_days=6, warmup_days=0, workers=1)
+        detector = get_detector("EMA_detector")
+        expected = []
+        for day in range(6):
+            expected.extend(detector.push(np.asarray(self.store.read_day(day)), day * 1440))
+        self.assertEqual(np.flatnonzero(load_results(self.output)["flags"]).tolist(), expected)
+
+    def test_process_pool(self):
+        """Test chunks scored in a pool match the same chunks scored in process"""
+        detector = get_detector("change_point")
+        detector.fit(np.asarray(self.store.read_day(0)))
+        expected = [score_days(copy.deepcopy(detector), self.store, days, warmup)
+                    for days, warmup in plan_chunks(list(range(1, 6)), 2, 1, self.store.days)]
+        checkpoint = os.path.join(self.directory.name, "checkpoint.pkl")
+        save_checkpoint(checkpoint, {"version": CHECKPOINT_VERSION, "start_day": 0, "detector_name": "change_point",
+                                     "detector": detector.state()})
+
+        backfill(self.store.path, self.output, "change_point", start_day=1, checkpoint=checkpoint,
+                 chunk_days=2, warmup_days=1, workers=2)
+        results = load_results(self.output)
+        np.testing.assert_array_equal(results["flags"], np.concatenate([flags for _, flags in expected]))
+        np.testing.assert_allclose(results["scores"], np.concatenate([scores for scores, _ in expected]))
+
+    def test_checkpoint_of_other_detector(self):
+        """Test a checkpoint of another detector isn't loaded"""
+        checkpoint = os.path.join(self.directory.name, "checkpoint.pkl")
+        save_checkpoint(checkpoint, {"version": CHECKPOINT_VERSION, "start_day": 0, "detector_name": "EMA_detector",
+                                     "detector": get_detector("EMA_detector").state()})
+        with self.assertRaises(ValueError):
+            backfill(self.store.path, self.output, "change_point", checkpoint=checkpoint, workers=1)
+
+    def test_missing_days(self):
+        with self.assertRaises(ValueError):
+            backfill(os.path.join(self.directory.name, "empty"), self.output, "EMA_detector")
+
+
+if __name__ == '__main__':
+    unittest.main()
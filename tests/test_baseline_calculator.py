@@ -0,0 +1,71 @@
+import os
+import tempfile
+import unittest
+import pandas as pd
+from src.simulator.baseline_calculator import (
+    RunningStats, MonthlyBaselineAggregator, calculate_monthly_baselines,
+    write_baseline_store, terminal_name, baseline_filename
+)
+
+EXPORT_FILE = os.path.join(
+    os.path.dirname(__file__), '..', 'src', 'simulator',
+    'SystemEntryVolumeEasingtonLangeledD+1-10_23-09_24.csv'
+)
+
+
+class TestBaselineCalculator(unittest.TestCase):
+    def test_running_stats_matches_pandas(self):
+        """Test chunked statistics match a single pass over all values"""
+        values = pd.Series([1.0, 4.0, 2.5, 8.0, 3.0, 7.5, 6.0])
+        stats = RunningStats()
+        for start in range(0, len(values), 3):
+            stats.update(values[start:start + 3])
+        self.assertEqual(stats.count, len(values))
+        self.assertAlmostEqual(stats.mean, values.mean())
+        self.assertAlmostEqual(stats.std, values.std())
+        self.assertEqual(stats.max, 8.0)
+
+    def test_terminal_name(self):
+        """Test terminal is parsed from the data item name"""
+        self.assertEqual(terminal_name("System Entry Volume, Easington-Langeled, D+1"), "Easington-Langeled")
+
+    def test_streaming_matches_full_load(self):
+        """Test small chunks give the same baselines as loading the whole file"""
+        entry_volumes = pd.read_csv(EXPORT_FILE)
+        entry_volumes = entry_volumes[entry_volumes['Value'] > 3]
+        months = pd.to_datetime(entry_volumes['Applicable At'], format="%d/%m/%Y %H:%M:%S").dt.month
+        expected = entry_volumes.groupby(months)['Value'].agg(['mean', 'std'])
+
+        aggregator = calculate_monthly_baselines(EXPORT_FILE, chunksize=17)
+        baselines = aggregator.baselines("Easington-Langeled")
+
+        self.assertEqual(len(baselines), 12)
+        for mean, std, (_, row) in zip(expected['mean'], expected['std'], baselines.iterrows()):
+            self.assertAlmostEqual(row['Value'], mean)
+            self.assertAlmostEqual(row['Std'], std)
+
+    def test_multiple_terminals(self):
+        """Test each terminal gets its own baseline file"""
+        chunk = pd.DataFrame({
+            "Applicable At": ["01/01/2024 01:00:00", "02/01/2024 01:00:00", "01/01/2024 01:00:00"],
+            "Data Item": pd.Categorical([
+                "System Entry Volume, Terminal A, D+1",
+                "System Entry Volume, Terminal A, D+1",
+                "System Entry Volume, Terminal B, D+1"
+            ]),
+            "Value": [10.0, 20.0, 40.0]
+        })
+        aggregator = MonthlyBaselineAggregator()
+        aggregator.update(chunk)
+        self.assertEqual(aggregator.terminals, ["Terminal A", "Terminal B"])
+        self.assertAlmostEqual(aggregator.baselines("Terminal A")['Value'][0], 15.0)
+
+        with tempfile.TemporaryDirectory() as directory:
+            written = write_baseline_store(aggregator, directory, default_terminal="Terminal B")
+            self.assertEqual(len(written), 3)
+            self.assertTrue(os.path.exists(os.path.join(directory, baseline_filename("Terminal A"))))
+            self.assertEqual(pd.read_csv(os.path.join(directory, "Monthly_Baselines.csv"))['Value'][0], 40.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
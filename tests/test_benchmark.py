@@ -0,0 +1,51 @@
+import unittest
+import numpy as np
+from src.benchmark import evaluate, flags_from_indices, label_events
+
+
+class TestEvaluation(unittest.TestCase):
+    def setUp(self):
+        """Two injected anomalies, an outage at 10-20 and a surge at 50-60"""
+        self.labels = np.zeros(100, dtype=int)
+        self.labels[10:20] = 1
+        self.labels[50:60] = 3
+
+    def test_flags_from_indices(self):
+        """Test indices outside the day are ignored"""
+        flags = flags_from_indices([0, 5, 1440, -1], length=10)
+        self.assertEqual(list(np.flatnonzero(flags)), [0, 5])
+
+    def test_label_events(self):
+        """Test label runs become events"""
+        events = label_events(self.labels)
+        self.assertEqual(events, [
+            {"type": 1, "start": 10, "end": 20},
+            {"type": 3, "start": 50, "end": 60}
+        ])
+
+    def test_evaluate(self):
+        """Test precision, recall and detection delay per type"""
+        flags = flags_from_indices([13, 14, 15, 16, 17, 18, 19, 90], length=100)
+        results = evaluate(flags, self.labels)
+
+        self.assertAlmostEqual(results["overall"]["precision"], 7 / 8)
+        self.assertAlmostEqual(results["overall"]["recall"], 7 / 20)
+
+        outage = results["types"]["outage"]
+        self.assertAlmostEqual(outage["recall"], 0.7)
+        self.assertEqual(outage["events_detected"], 1)
+        self.assertEqual(outage["mean_detection_delay"], 3)
+
+        surge = results["types"]["surge"]
+        self.assertEqual(surge["recall"], 0)
+        self.assertEqual(surge["events_detected"], 0)
+        self.assertIsNone(surge["mean_detection_delay"])
+
+    def test_evaluate_length_mismatch(self):
+        """Test flags and labels must line up"""
+        with self.assertRaises(ValueError):
+            evaluate(np.zeros(5, dtype=bool), self.labels)
+
+
+if __name__ == '__main__':
+    unittest.main()
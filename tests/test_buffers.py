@@ -0,0 +1,70 @@
+import pickle
+import unittest
+from collections import deque
+import numpy as np
+from src.detector import IF2Detector, IF3Detector
+from src.utils.buffers import ArrayBuffer
+
+
+class TestArrayBuffer(unittest.TestCase):
+    def test_growth(self):
+        """Test appending past the capacity keeps every row in order"""
+        buffer = ArrayBuffer(capacity=4)
+        for start in range(0, 100, 7):
+            buffer.extend(np.arange(start, start + 7))
+        np.testing.assert_array_equal(buffer.view(), np.arange(105))
+
+    def test_maxlen_matches_deque(self):
+        """Test a bounded buffer keeps the same rows as a deque with maxlen"""
+        buffer = ArrayBuffer(columns=2, maxlen=50)
+        expected = deque(maxlen=50)
+        for start, length in [(0, 30), (30, 30), (60, 5), (65, 120), (185, 49), (234, 1)]:
+            rows = [(float(minute), minute % 1440) for minute in range(start, start + length)]
+            buffer.extend(rows)
+            expected.extend(rows)
+            np.testing.assert_array_equal(buffer.view(), np.array(expected))
+        self.assertLessEqual(len(buffer._data), 100)
+
+    def test_view_is_not_a_copy(self):
+        buffer = ArrayBuffer(dtype=np.float32)
+        buffer.extend([1.0, 2.0, 3.0])
+        self.assertTrue(np.shares_memory(buffer.view(), buffer._data))
+        self.assertEqual(buffer.view().dtype, np.float32)
+
+    def test_pickle_drops_spare_capacity(self):
+        buffer = ArrayBuffer(columns=2, maxlen=10, capacity=1000)
+        buffer.extend(np.ones((3, 2)))
+        restored = pickle.loads(pickle.dumps(buffer))
+        np.testing.assert_array_equal(restored.view(), np.ones((3, 2)))
+        self.assertEqual(len(restored._data), 3)
+        restored.extend(np.zeros((20, 2)))
+        self.assertEqual(len(restored), 10)
+
+
+class TestCompactDetectorHistory(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.days = [50 + rng.normal(0, 1, 1440) for _ in range(3)]
+
+    def test_if2_training_data(self):
+        """Test IF_detector2 keeps its points as float32 rows"""
+        detector = IF2Detector(n_estimators=10, seed=0)
+        detector.fit(self.days[0])
+        detector.push(self.days[1], 1440)
+        self.assertEqual(detector.test_data.view().shape, (2880, 2))
+        self.assertEqual(detector.test_data.dtype, np.float32)
+        self.assertEqual(detector.test_data.view().nbytes, 2880 * 8)
+
+    def test_if3_history_window(self):
+        """Test IF3 keeps only its history window, as arrays"""
+        detector = IF3Detector(n_estimators=10, history_size=2000)
+        detector.fit(self.days[0])
+        detector.push(self.days[1], 1440)
+        detector.push(self.days[2], 2880)
+        history = detector.history.view()
+        self.assertEqual(history.shape, (2000, 2))
+        np.testing.assert_array_equal(history[:, 1], np.arange(2320, 4320))
+
+
+if __name__ == '__main__':
+    unittest.main()
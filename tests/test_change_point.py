@@ -0,0 +1,87 @@
+import pickle
+import random
+import unittest
+import numpy as np
+from src.detector import ChangePointDetector, get_detector
+from src.detector.change_point import _daily_baseline, expected_day
+from src.simulator import simulator
+
+
+class TestChangePointDetector(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        random.seed(4)
+        cls.days = [np.array(day) for day, _ in zip(simulator(), range(4))]
+
+    def test_expected_day(self):
+        """Test the simulator's values are within its noise of the expected flow"""
+        residuals = self.days[1] / expected_day(1) - 1
+        self.assertLess(np.abs(residuals).max(), 0.012)
+
+    def test_expected_day_is_cached(self):
+        """Test each day of the year's surface is computed once, and matches an explicit baseline"""
+        self.assertIs(expected_day(1), expected_day(366))
+        np.testing.assert_array_equal(expected_day(1), expected_day(1, _daily_baseline()))
+
+    def test_no_flags_on_nominal_data(self):
+        detector = ChangePointDetector()
+        detector.fit(np.concatenate(self.days[:2]))
+        self.assertEqual(detector.push(self.days[2], 2880), [])
+        self.assertEqual(detector.push(self.days[3], 4320), [])
+
+    def test_flags_leak_and_surge(self):
+        """Test level shifts of a few percent are flagged from about when they start to when they end"""
+        for multiplier in (0.93, 1.06):
+            with self.subTest(multiplier=multiplier):
+                day = self.days[2].copy()
+                day[400:1000] *= multiplier
+                detector = ChangePointDetector()
+                detector.fit(np.concatenate(self.days[:2]))
+                flagged = detector.push(day, 2880)
+                self.assertTrue(set(range(2880 + 400, 2880 + 1000)) <= set(flagged))
+                self.assertTrue(all(2880 + 400 <= minute < 2880 + 1020 for minute in flagged))
+
+    def test_shift_across_batches(self):
+        """Test a leak spanning days and small batches is flagged throughout"""
+        detector = get_detector("change_point")
+        detector.fit(np.concatenate(self.days[:2]))
+        values = np.concatenate(self.days[2:])
+        values[1000:2500] *= 0.92
+        flagged = []
+        for start in range(0, len(values), 60):
+            flagged.extend(detector.push(values[start:start + 60], 2880 + start))
+        self.assertGreater(len(set(range(2880 + 1000, 2880 + 2500)) & set(flagged)), 1450)
+        self.assertLess(len(flagged), 1520)
+
+    def test_long_shift_becomes_the_level(self):
+        """Test a shift outlasting max_alarm is taken as the new normal"""
+        detector = ChangePointDetector(max_alarm=600)
+        detector.fit(np.concatenate(self.days[:2]))
+        flagged = detector.push(self.days[2] * 0.9, 2880)
+        self.assertLess(len(flagged), 700)
+        self.assertTrue(set(range(2880 + 10, 2880 + 590)) <= set(flagged))
+
+    def test_score_does_not_change_state(self):
+        detector = ChangePointDetector()
+        detector.fit(np.concatenate(self.days[:2]))
+        day = self.days[2].copy()
+        day[300:360] = 0.0
+        before = pickle.dumps(detector.state())
+        scores = detector.score_batch(day, 2880)
+        self.assertEqual(pickle.dumps(detector.state()), before)
+        self.assertTrue((scores[310:360] >= 1).all())
+        self.assertTrue((scores[:300] < 1).all())
+
+    def test_state_round_trip(self):
+        detector = ChangePointDetector()
+        detector.fit(np.concatenate(self.days[:2]))
+        day = self.days[2].copy()
+        day[1300:] *= 1.08
+        detector.push(day, 2880)
+        restored = ChangePointDetector()
+        restored.load_state(pickle.loads(pickle.dumps(detector.state())))
+        self.assertEqual(restored.push(self.days[3], 4320), detector.push(self.days[3], 4320))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import os
+import random
+import tempfile
+import unittest
+from src.detector import EMADetector
+from src.detector.events import EventAggregator
+from src.storage import save_checkpoint, load_checkpoint, checkpoint_position, checkpointed_stream
+from src.storage.checkpoint import CHECKPOINT_VERSION
+
+
+class TestCheckpoint(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "pipeline.ckpt")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_atomic_save(self):
+        """Test a failed save leaves the previous checkpoint and no temporary files"""
+        self.assertIsNone(load_checkpoint(self.path))
+        save_checkpoint(self.path, {"version": CHECKPOINT_VERSION, "day": 1})
+        with self.assertRaises(Exception):
+            save_checkpoint(self.path, {"version": CHECKPOINT_VERSION, "day": lambda: 2})
+        self.assertEqual(load_checkpoint(self.path)["day"], 1)
+        self.assertEqual(os.listdir(self.directory.name), ["pipeline.ckpt"])
+
+    def test_version_mismatch(self):
+        save_checkpoint(self.path, {"version": CHECKPOINT_VERSION + 1})
+        with self.assertRaises(ValueError):
+            load_checkpoint(self.path)
+
+    def test_resume_matches_uninterrupted_run(self):
+        """Test a run resumed from a checkpoint carries on exactly as if it had never stopped"""
+        params = {"duration": 4, "seed": 7, "anomaly_threshold": 0.5}
+        uninterrupted_path = os.path.join(self.directory.name, "uninterrupted.ckpt")
+        uninterrupted = list(checkpointed_stream(EMADetector(), uninterrupted_path, **params))
+
+        stream = checkpointed_stream(EMADetector(), self.path, **params)
+        first_run = [next(stream) for _ in range(3)]
+        stream.close()  # Crash before the third day's checkpoint
+        self.assertEqual(checkpoint_position(self.path), 2 * 1440)
+
+        random.seed(123)  # The restarted process has its own random state
+        resumed = list(checkpointed_stream(EMADetector(), self.path, **params))
+        self.assertEqual(len(resumed), 2)
+        for (values, flagged), (expected_values, expected_flagged) in zip(first_run[:2] + resumed, uninterrupted):
+            self.assertEqual(list(values), list(expected_values))
+            self.assertEqual(flagged, expected_flagged)
+        self.assertEqual(checkpoint_position(self.path), 4 * 1440)
+
+    def test_step_and_detector_check(self):
+        """Test batches follow the step and a checkpoint isn't resumed by another detector"""
+        batches = list(checkpointed_stream(EMADetector(), self.path, duration=1, step=360, seed=1))
+        self.assertEqual([len(values) for values, _ in batches], [360] * 4)
+
+        class OtherDetector(EMADetector):
+            name = "other"
+
+        with self.assertRaises(ValueError):
+            next(checkpointed_stream(OtherDetector(), self.path, duration=2))
+
+    def test_steps(self):
+        """Test batches are step sized and end on day boundaries"""
+        batches = list(checkpointed_stream(EMADetector(), self.path, duration=1, step=500, seed=1))
+        self.assertEqual([len(values) for values, _ in batches], [500, 500, 440])
+
+    def test_open_event_resumes(self):
+        """Test an anomaly event open at a checkpoint carries on after the restart instead of being split"""
+        class MidnightDetector(EMADetector):
+            """Flags the 10 minutes either side of midnight"""
+            name = "midnight"
+
+            def push(self, values, start_minute=0):
+                return [start_minute + i for i in range(len(values)) if (start_minute + i + 10) % 1440 < 20]
+
+        def run(stream, events, minute=0, days=None):
+            closed = []
+            for day, (values, flagged) in enumerate(stream):
+                if days is not None and day == days:
+                    break  # Stop before the day is merged, as a crash would
+                closed += [(event.start, event.end) for event in events.push(minute, values, flagged)]
+                minute += len(values)
+            return closed
+
+        events = EventAggregator()
+        stream = checkpointed_stream(MidnightDetector(), self.path, duration=2, events=events)
+        self.assertEqual(run(stream, events, days=1), [(0, 9)])
+        stream.close()
+        self.assertEqual(load_checkpoint(self.path)["events"]["open_event"].start, 1430)
+
+        events = EventAggregator()
+        resumed = checkpointed_stream(MidnightDetector(), self.path, duration=2, events=events)
+        self.assertEqual(run(resumed, events, minute=checkpoint_position(self.path)), [(1430, 1449)])
+        self.assertEqual((events.open_event.start, events.open_event.end), (2870, 2879))
+
+if __name__ == '__main__':
+    unittest.main()
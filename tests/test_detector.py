@@ -1,3 +1,73 @@
+import random
 import unittest
+from src.detector import IF_detector
+from src.detector.IF_detector import (
+    build_isolation_forest, score_batch, find_anomalies, update_forest,
+    convert_to_timepoints, continuous_anomaly_detection, TimeAwareForestDetector
+)
 
-pass
\ No newline at end of file
+
+class TestTimeAwareForest(unittest.TestCase):
+    def setUp(self):
+        """One day of noisy values with an outage"""
+        rng = random.Random(1)
+        self.data = [1 + rng.gauss(0, 0.05) for _ in range(1440)]
+        self.data[600:620] = [0.0] * 20
+
+    def test_seeded_forest_is_deterministic(self):
+        """Test the same seed builds the same forest"""
+        first = build_isolation_forest(self.data, n_trees=10, seed=5)
+        second = build_isolation_forest(self.data, n_trees=10, seed=5)
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, build_isolation_forest(self.data, n_trees=10, seed=6))
+
+    def test_parallel_matches_serial(self):
+        """Test results for a seed don't depend on n_jobs"""
+        serial = build_isolation_forest(self.data, n_trees=10, seed=5)
+        parallel = build_isolation_forest(self.data, n_trees=10, seed=5, n_jobs=2)
+        self.assertEqual(serial, parallel)
+        self.assertEqual(score_batch(self.data, serial), score_batch(self.data, parallel, n_jobs=2))
+
+    def test_pools_are_spawned_and_closed(self):
+        """Test parallel batches run in spawned workers that close() stops"""
+        detector = TimeAwareForestDetector(n_trees=4, n_jobs=2, seed=1)
+        detector.push(self.data, 0)
+        self.assertEqual(IF_detector._pools[2]._mp_context.get_start_method(), "spawn")
+        detector.close()
+        self.assertEqual(IF_detector._pools, {})
+        # A later parallel batch starts a new pool
+        detector.push(self.data, 1440)
+        self.assertIn(2, IF_detector._pools)
+        detector.close()
+
+    def test_find_anomalies_seeded(self):
+        """Test find_anomalies is repeatable with a seed"""
+        first = find_anomalies(self.data, threshold=0.5, n_trees=10, seed=3)
+        second = find_anomalies(self.data, threshold=0.5, n_trees=10, seed=3, n_jobs=2)
+        self.assertEqual(first, second)
+
+    def test_update_forest_replaces_oldest_trees(self):
+        """Test a partial update keeps the newest trees and the forest size"""
+        forest = build_isolation_forest(self.data, n_trees=10, seed=5)
+        updated = update_forest(forest, convert_to_timepoints(self.data), replace_fraction=0.3, seed=2)
+        self.assertEqual(len(updated.trees), 10)
+        self.assertEqual(updated.trees[:7], forest.trees[3:])
+        self.assertNotEqual(updated.trees[7:], forest.trees[:3])
+        with self.assertRaises(ValueError):
+            update_forest(forest, convert_to_timepoints(self.data), replace_fraction=2)
+
+    def test_streaming_mode(self):
+        """Test the streaming mode yields a result per batch and is repeatable"""
+        batches = [self.data, self.data, [0.0] * 1440]
+        runs = [
+            [indices for _, indices in continuous_anomaly_detection(
+                iter(batches), threshold=0.6, n_trees=10, seed=1, replace_fraction=0.2)]
+            for _ in range(2)
+        ]
+        self.assertEqual(len(runs[0]), 3)
+        self.assertEqual(runs[0], runs[1])
+        self.assertEqual(len(runs[0][2]), 1440)
+
+
+if __name__ == '__main__':
+    unittest.main()
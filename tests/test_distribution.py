@@ -0,0 +1,116 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+from scipy import stats
+from src.storage import DistributionProfile, Histogram, StreamStore, linear_edges, log_edges, plot_density
+
+
+class TestHistogram(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.values = 1e4 + rng.gamma(2.0, 3.0, 20000)
+
+    def test_moments_match_batch(self):
+        """Test moments from batches match the whole array, despite a mean far larger than the spread"""
+        histogram = Histogram(linear_edges(1e4, 1e4 + 60, 120))
+        for start in range(0, len(self.values), 777):
+            histogram.update(self.values[start:start + 777])
+        moments = histogram.moments()
+        self.assertEqual(moments["count"], len(self.values))
+        self.assertAlmostEqual(moments["mean"], self.values.mean(), places=8)
+        self.assertAlmostEqual(moments["std"], self.values.std(), places=6)
+        self.assertAlmostEqual(moments["skewness"], stats.skew(self.values), places=6)
+        self.assertAlmostEqual(moments["kurtosis"], stats.kurtosis(self.values), places=6)
+        self.assertEqual(moments["max"], self.values.max())
+
+    def test_counts_and_density(self):
+        """Test out of range values go to the underflow and overflow bins and the density integrates to the rest"""
+        histogram = Histogram(linear_edges(0, 10, 5))
+        histogram.update([-1, 0, 1.9, 2, 9.99, 10, 11, np.nan])
+        np.testing.assert_array_equal(histogram.counts[0], [1, 2, 1, 0, 0, 2, 1])
+        centres, density = histogram.density()
+        np.testing.assert_array_equal(centres, [1, 3, 5, 7, 9])
+        self.assertAlmostEqual(float(np.sum(density * 2)), 5 / 7)
+
+    def test_quantile(self):
+        histogram = Histogram(linear_edges(1e4, 1e4 + 60, 600))
+        histogram.update(self.values)
+        for q in (0.1, 0.5, 0.99):
+            self.assertAlmostEqual(histogram.quantile(q), np.quantile(self.values, q), delta=0.1)
+        self.assertTrue(np.isnan(Histogram(linear_edges(0, 1, 1)).quantile(0.5)))
+
+    def test_merge(self):
+        """Test merging histograms of two streams is the same as one histogram of both"""
+        edges = log_edges(1e4, 1e4 + 100, 50)
+        first, second, both = Histogram(edges), Histogram(edges), Histogram(edges)
+        first.update(self.values[:5000])
+        second.update(self.values[5000:] - 5)
+        both.update(np.concatenate([self.values[:5000], self.values[5000:] - 5]))
+        first.merge(second)
+        np.testing.assert_array_equal(first.counts, both.counts)
+        for key, value in both.moments().items():
+            self.assertAlmostEqual(first.moments()[key], value, places=6)
+        with self.assertRaises(ValueError):
+            first.merge(Histogram(linear_edges(0, 1, 50)))
+
+    def test_invalid_edges(self):
+        with self.assertRaises(ValueError):
+            Histogram([0, 1, 1])
+        with self.assertRaises(ValueError):
+            log_edges(0, 10, 5)
+
+
+class TestDistributionProfile(unittest.TestCase):
+    def setUp(self):
+        """Two days where the afternoon is 10 higher than the morning"""
+        rng = np.random.default_rng(1)
+        self.days = [np.where(np.arange(1440) < 720, 40.0, 50.0) + rng.normal(0, 1, 1440) for _ in range(2)]
+
+    def test_by_hour(self):
+        profile = DistributionProfile(by="hour")
+        for day, values in enumerate(self.days):
+            profile.extend(values, day * 1440)
+        self.assertAlmostEqual(profile.moments(3)["mean"], 40, delta=0.3)
+        self.assertAlmostEqual(profile.moments(15)["mean"], 50, delta=0.3)
+        self.assertEqual(profile.moments(15)["count"], 120)
+        self.assertAlmostEqual(profile.moments()["mean"], np.concatenate(self.days).mean())
+        self.assertEqual(set(profile.summary()["hour"]), {str(hour) for hour in range(24)})
+
+    def test_by_month(self):
+        """Test days are grouped by the month of the year they fall in"""
+        profile = DistributionProfile(by="month", start_day=30)
+        for day, values in enumerate(self.days):
+            profile.extend(values, day * 1440)
+        self.assertEqual(profile.moments(1)["count"], 1440)
+        self.assertEqual(profile.moments(2)["count"], 1440)
+        self.assertEqual(profile.moments(3)["count"], 0)
+        with self.assertRaises(ValueError):
+            profile.moments(13)
+        with self.assertRaises(ValueError):
+            DistributionProfile(by="week")
+
+    def test_from_store(self):
+        with tempfile.TemporaryDirectory() as directory:
+            store = StreamStore(os.path.join(directory, "data"))
+            for day, values in enumerate(self.days):
+                store.append_day(day, values)
+            profile = DistributionProfile.from_store(store, by="minute_of_day")
+        self.assertEqual(profile.moments(0)["count"], 2)
+        self.assertEqual(profile.overall.count(), 2880)
+
+    def test_plot(self):
+        """Test the density is drawn from the sketch, one line per group"""
+        import matplotlib
+        matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+        profile = DistributionProfile(by="month")
+        profile.extend(self.days[0], 0)
+        ax = plot_density(profile, groups=[1])
+        self.assertEqual(len(ax.get_lines()), 1)
+        np.testing.assert_array_equal(ax.get_lines()[0].get_ydata(), profile.density(1)[1])
+        plt.close(ax.figure)
+
+
+if __name__ == '__main__':
+    unittest.main()
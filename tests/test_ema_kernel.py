@@ -0,0 +1,89 @@
+import unittest
+import numpy as np
+from src.detector import EMADetector
+from src.detector.EMA_detector import detect_anomalies, initialize_baseline, DayCarry
+from src.detector.ema_kernel import (
+    pairwise_sum, pairwise_std, make_ema_loop, python_ema_loop, compiled_ema_loop, ema_loop
+)
+
+
+class TestEMAKernel(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(3)
+        self.days = [50 + 5 * np.sin(np.arange(1440) / 200) + rng.normal(0, 0.5, 1440) for _ in range(3)]
+        self.days[1][400:700] *= 0.9
+        self.days[2][100:110] = 0.0
+
+    def test_pairwise_matches_numpy(self):
+        """Test the kernel's sum and deviation are bit for bit NumPy's"""
+        rng = np.random.default_rng(0)
+        for n in [1, 7, 8, 9, 127, 128, 129, 300, 1440, 10080]:
+            values = np.abs(rng.normal(0, 3, n + 5))
+            self.assertEqual(pairwise_sum(values, 5, n), values[5:].sum())
+            self.assertEqual(pairwise_std(values, 5, n + 5, np.empty(n)), np.std(values[5:]))
+
+    def run_loop(self, loop, history_window):
+        """Runs a loop over every day in chunks, as the detector does with sliding windows"""
+        pattern, seasonal_rate = initialize_baseline(self.days[0])
+        results = []
+        for day in self.days:
+            carry = DayCarry(history_window)
+            for start in range(0, 1440, 360):
+                chunk = day[start:start + 360]
+                carry.reserve(len(chunk))
+                flags, seasonal_rate, carry.start, carry.end, carry.total, carry.count, carry.max = loop(
+                    chunk, pattern, seasonal_rate, carry.buffer, carry.start, carry.end, history_window,
+                    carry.total, carry.count, carry.max, 8.0, 0.05, 0.01, start
+                )
+                results.append((flags.tolist(), seasonal_rate))
+        return results, pattern
+
+    def test_kernel_parity(self):
+        """Test the loop the compiled kernel runs gives identical results to the NumPy path"""
+        expected, expected_pattern = self.run_loop(python_ema_loop, 200)
+        kernel, kernel_pattern = self.run_loop(make_ema_loop(pairwise_std), 200)
+        self.assertEqual(kernel, expected)
+        np.testing.assert_array_equal(kernel_pattern, expected_pattern)
+        self.assertTrue(any(any(flags) for flags, _ in expected))
+
+    @unittest.skipIf(compiled_ema_loop is None, "numba isn't installed")
+    def test_compiled_parity(self):
+        """Test the Numba compiled loop gives identical results to the NumPy path"""
+        for history_window in (200, 1440 * 7):
+            expected, expected_pattern = self.run_loop(python_ema_loop, history_window)
+            compiled, compiled_pattern = self.run_loop(compiled_ema_loop, history_window)
+            self.assertEqual(compiled, expected)
+            np.testing.assert_array_equal(compiled_pattern, expected_pattern)
+
+        jit, python = EMADetector(jit=True), EMADetector(jit=False)
+        for day, values in enumerate(self.days):
+            self.assertEqual(jit.push(values, day * 1440), python.push(values, day * 1440))
+
+    def test_loop_selection(self):
+        self.assertIs(ema_loop(False), python_ema_loop)
+        if compiled_ema_loop is None:
+            self.assertIs(ema_loop(), python_ema_loop)
+            with self.assertRaises(ValueError):
+                ema_loop(True)
+        else:
+            self.assertIs(ema_loop(), compiled_ema_loop)
+
+    def test_carry_window(self):
+        """Test the deviation window only keeps the last history_window deviations"""
+        pattern, seasonal_rate = initialize_baseline(self.days[0])
+        carry = DayCarry(100)
+        detect_anomalies(self.days[1], pattern, seasonal_rate, history_window=100, carry=carry, jit=False)
+        self.assertEqual(len(carry.deviations), 100)
+        self.assertEqual(carry.count, 1440)
+        np.testing.assert_allclose(carry.total, self.days[1].sum())
+
+    def test_day_of_zeros(self):
+        """Test a whole day outage moves the seasonal rate towards 0.85, as NumPy's NaN from 0 / 0 did"""
+        # A pattern learnt as zero where an earlier outage went unflagged, so the zeros aren't anomalous there
+        pattern = np.tile([0.0, 100.0], 720)
+        _, _, rate = detect_anomalies(np.zeros(1440), pattern, 0.9, jit=False)
+        self.assertAlmostEqual(rate, 0.85 + 0.05 * 0.99 ** 1440)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import random
+import unittest
+import numpy as np
+from src.detector import EnsembleDetector, EMADetector, IF2Detector, get_detector
+from src.detector.features import BatchFeatures, batch_features
+from src.simulator import simulator
+
+
+class LevelDetector:
+    """Flags values below a level, scoring by how far below it they are"""
+    name = "level"
+
+    def __init__(self, level):
+        self.level = level
+        self.batches = []
+
+    def fit(self, values, start_minute=0):
+        pass
+
+    def partial_fit(self, values, start_minute=0):
+        pass
+
+    def score_batch(self, values, start_minute=0):
+        batch = batch_features(values, start_minute)
+        return self.level - batch.values
+
+    def push(self, values, start_minute=0):
+        batch = batch_features(values, start_minute)
+        self.batches.append(batch)
+        return (batch.start_minute + np.flatnonzero(batch.values < self.level)).tolist()
+
+    def state(self):
+        return {"level": self.level}
+
+    def load_state(self, state):
+        self.level = state["level"]
+
+
+class TestEnsemble(unittest.TestCase):
+    def setUp(self):
+        self.values = np.full(100, 10.0)
+        self.values[20:30] = 4.0
+        self.values[60:70] = 7.0
+
+    def test_vote(self):
+        """Test points are flagged by a majority of members"""
+        members = [LevelDetector(5), LevelDetector(8), LevelDetector(8)]
+        ensemble = EnsembleDetector(members, method="vote")
+        self.assertEqual(ensemble.push(self.values, 1440), list(range(1460, 1470)) + list(range(1500, 1510)))
+
+        strict = EnsembleDetector([LevelDetector(5), LevelDetector(8), LevelDetector(8)], min_votes=3)
+        self.assertEqual(strict.push(self.values, 0), list(range(20, 30)))
+
+    def test_members_share_features(self):
+        """Test every member is given the same batch"""
+        members = [LevelDetector(5), LevelDetector(8)]
+        EnsembleDetector(members, n_threads=2).push(self.values, 0)
+        self.assertIsInstance(members[0].batches[0], BatchFeatures)
+        self.assertIs(members[0].batches[0], members[1].batches[0])
+
+    def test_weighted(self):
+        """Test the weighted method follows the heavier member"""
+        ensemble = EnsembleDetector(
+            [LevelDetector(5), LevelDetector(8)], method="weighted", weights=[3, 1], score_threshold=1.5
+        )
+        self.assertEqual(ensemble.push(self.values, 0), list(range(20, 30)))
+
+    def test_stacking(self):
+        """Test the stacking combiner learns from labels"""
+        labels = np.zeros(100, dtype=int)
+        labels[20:30] = 1
+        ensemble = EnsembleDetector([LevelDetector(5), LevelDetector(8)], method="stacking")
+        with self.assertRaises(ValueError):
+            ensemble.push(self.values, 0)
+        ensemble.fit_combiner(self.values, labels)
+        self.assertEqual(ensemble.push(self.values, 0), list(range(20, 30)))
+
+    def test_registered_members(self):
+        """Test an ensemble of registered detectors matches its members run alone"""
+        random.seed(3)
+        days = [np.array(day) for day, _ in zip(simulator(), range(3))]
+        days[2][500:560] = 0.0
+
+        ensemble = get_detector("ensemble", members={
+            "EMA_detector": {}, "IF_detector2": {"seed": 0, "n_estimators": 20, "contamination": 0.05}
+        }, min_votes=1)
+        ema, forest = EMADetector(), IF2Detector(seed=0, n_estimators=20, contamination=0.05)
+        training = np.concatenate(days[:2])
+        ensemble.fit(training)
+        ema.fit(training)
+        forest.fit(training)
+
+        flagged = ensemble.push(days[2], 2880)
+        self.assertEqual(flagged, sorted(set(ema.push(days[2], 2880)) | set(forest.push(days[2], 2880))))
+        self.assertTrue(set(range(3380, 3440)) & set(flagged))
+        ensemble.close()
+
+    def test_unknown_method(self):
+        with self.assertRaises(ValueError):
+            EnsembleDetector([LevelDetector(5)], method="median")
+
+
+if __name__ == '__main__':
+    unittest.main()
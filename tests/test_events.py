@@ -0,0 +1,73 @@
+import unittest
+import numpy as np
+from src.detector.events import EventAggregator
+
+
+class TestEventAggregator(unittest.TestCase):
+    def setUp(self):
+        self.aggregator = EventAggregator(max_gap=5)
+        self.day = np.full(1440, 50.0)
+
+    def test_merges_near_flags(self):
+        """Test flags within the gap become one event"""
+        day = self.day.copy()
+        day[100:110] = 0.0
+        day[112:120] = 0.0
+        flagged = list(range(100, 110)) + list(range(112, 120))
+        closed = self.aggregator.push(0, day, flagged)
+        self.assertEqual(len(closed), 1)
+        event = closed[0]
+        self.assertEqual((event.start, event.end, event.duration, event.flagged), (100, 119, 20, 18))
+        self.assertEqual(event.type, "outage")
+        self.assertIsNone(self.aggregator.open_event)
+
+    def test_event_carries_across_days(self):
+        """Test an event at the end of a day stays open into the next day"""
+        first = self.day * 0.9
+        self.assertEqual(self.aggregator.push(0, first, list(range(1400, 1440))), [])
+        self.assertEqual(self.aggregator.open_event.start, 1400)
+
+        second = self.day.copy()
+        second[:30] *= 0.9
+        closed = self.aggregator.push(1440, second, list(range(1440, 1470)), scores=[0.5] * 29 + [0.9])
+        self.assertEqual(len(closed), 1)
+        self.assertEqual((closed[0].start, closed[0].end), (1400, 1469))
+        self.assertEqual(closed[0].peak_score, 0.9)
+
+    def test_type_guess(self):
+        """Test surge and sensor fault guesses"""
+        surge = self.day.copy()
+        surge[:10] *= 1.08
+        self.assertEqual(self.aggregator.push(0, surge, list(range(10)))[0].type, "surge")
+
+        fault = self.day.copy()
+        fault[:10] *= np.array([-4, 3, 0.5, 4.5, -2, 1, -3, 2.5, 4, -1])
+        self.assertEqual(self.aggregator.push(1440, fault, list(range(1440, 1450)))[0].type, "sensor_fault")
+
+    def test_flush(self):
+        """Test the open event is closed at the end of the stream"""
+        self.aggregator.push(0, self.day, [1439])
+        events = self.aggregator.flush()
+        self.assertEqual(len(events), 1)
+        self.assertTrue(events[0].closed)
+        self.assertEqual(self.aggregator.flush(), [])
+
+    def test_state(self):
+        """Test an open event carries on in an aggregator restored from the state"""
+        self.aggregator.push(0, self.day * 0.9, list(range(1400, 1440)))
+        restored = EventAggregator(max_gap=5)
+        restored.load_state(self.aggregator.state())
+        second = self.day.copy()
+        second[:30] *= 0.9
+        closed = restored.push(1440, second, list(range(1440, 1470)))
+        self.assertEqual((closed[0].start, closed[0].end, closed[0].flagged), (1400, 1469, 70))
+        self.assertEqual(self.aggregator.open_event.end, 1439)
+
+    def test_flags_outside_batch(self):
+        """Test flags must be inside the batch"""
+        with self.assertRaises(ValueError):
+            self.aggregator.push(1440, self.day, [5])
+
+
+if __name__ == '__main__':
+    unittest.main()
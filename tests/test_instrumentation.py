@@ -0,0 +1,87 @@
+import json
+import os
+import pstats
+import tempfile
+import unittest
+import urllib.request
+from src.utils.instrumentation import (
+    InMemorySink, JsonLinesSink, PrometheusSink, set_sink, timed, instrument, count,
+    enable_profiling, disable_profiling, profile_stats, dump_profiles, configure_from_env
+)
+
+
+@instrument("test.square")
+def square(value):
+    return value * value
+
+
+class TestInstrumentation(unittest.TestCase):
+    def tearDown(self):
+        sink = set_sink(None)
+        if sink is not None:
+            sink.close()
+        disable_profiling()
+
+    def test_disabled_is_no_op(self):
+        """Test nothing is recorded without a sink"""
+        self.assertIs(timed("test.stage"), timed("other.stage"))
+        self.assertEqual(square(3), 9)
+        count("test.counter")
+
+    def test_in_memory_sink(self):
+        """Test timings and counters are aggregated"""
+        sink = InMemorySink()
+        set_sink(sink)
+        for value in range(3):
+            square(value)
+        with timed("test.block"):
+            pass
+        count("test.counter", 2)
+        count("test.counter")
+
+        snapshot = sink.snapshot()
+        self.assertEqual(snapshot["timings"]["test.square"]["count"], 3)
+        self.assertEqual(snapshot["timings"]["test.block"]["count"], 1)
+        self.assertEqual(snapshot["counters"]["test.counter"], 3)
+
+    def test_json_lines_sink(self):
+        """Test every metric is written as a line"""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "metrics.jsonl")
+            set_sink(JsonLinesSink(path))
+            square(2)
+            count("test.counter")
+            set_sink(None).close()
+            with open(path) as file:
+                records = [json.loads(line) for line in file]
+        self.assertEqual([record["type"] for record in records], ["timing", "count"])
+
+    def test_prometheus_sink(self):
+        """Test metrics are served on localhost"""
+        sink = PrometheusSink(port=0)
+        set_sink(sink)
+        square(2)
+        body = urllib.request.urlopen("http://127.0.0.1:{}/metrics".format(sink.port)).read().decode()
+        self.assertIn('anomaly_stage_seconds_count{stage="test.square"} 1', body)
+
+    def test_profiling(self):
+        """Test profiling works without a sink"""
+        enable_profiling("test.square")
+        square(4)
+        stats = profile_stats("test.square")
+        self.assertIsNotNone(stats)
+        self.assertIsNone(profile_stats("test.unprofiled"))
+        with tempfile.TemporaryDirectory() as directory:
+            paths = dump_profiles(directory)
+            self.assertIn(os.path.join(directory, "test.square.prof"), paths)
+            self.assertIsNotNone(pstats.Stats(os.path.join(directory, "test.square.prof")))
+
+    def test_configure_from_env(self):
+        """Test the sink is chosen from the environment"""
+        self.assertIsInstance(configure_from_env({"ANOMALY_METRICS": "memory"}), InMemorySink)
+        with self.assertRaises(ValueError):
+            configure_from_env({"ANOMALY_METRICS": "unknown"})
+
+
+if __name__ == '__main__':
+    unittest.main()
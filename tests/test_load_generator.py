@@ -0,0 +1,66 @@
+import unittest
+import numpy as np
+from src.benchmark.load_generator import LoadStream, find_saturation, run_load
+from src.simulator.simulator import expected_flow_surface, generate_days, setup
+
+
+class TestLoadStream(unittest.TestCase):
+    def test_generate_days(self):
+        """Test vectorised days stay within the simulator's noise of the expected flow"""
+        surface = expected_flow_surface(setup())
+        days = generate_days([0, 200, 365], np.random.default_rng(0), surface)
+        self.assertEqual(days.shape, (3, 1440))
+        relative = days / surface[[0, 200, 0]] - 1
+        self.assertLess(np.abs(relative).max(), 0.02)
+        self.assertAlmostEqual(float(relative.mean()), 0, places=3)
+
+    def test_chunks(self):
+        """Test chunks carry on minute by minute across days, with anomalies injected and labelled"""
+        stream = LoadStream(seed=1, anomaly_threshold=1)
+        chunks = [stream.next_chunk(360) for _ in range(12)]
+        self.assertEqual([minute for _, _, minute in chunks], list(range(0, 3 * 1440, 360)))
+        labels = np.concatenate([labels for _, labels, _ in chunks])
+        self.assertTrue(labels.any())
+
+    def test_seeded(self):
+        first, second = LoadStream(seed=3), LoadStream(seed=3)
+        np.testing.assert_array_equal(first.next_chunk(60)[0], second.next_chunk(60)[0])
+
+
+class TestRunLoad(unittest.TestCase):
+    def test_paced(self):
+        """Test a paced run emits close to the target rate and records a latency per chunk"""
+        result = run_load("EMA_detector", streams=3, rate=6000, seconds=0.5, chunk=60)
+        self.assertTrue(result["paced"])
+        self.assertLessEqual(result["points"], 3000)
+        self.assertGreater(result["points"], 2000)
+        self.assertFalse(result["saturated"])
+        self.assertLess(result["latency"]["p50"], 0.1)
+
+    def test_unpaced(self):
+        result = run_load("EMA_detector", streams=2, seconds=0.3, chunk=1440)
+        self.assertFalse(result["paced"])
+        self.assertNotIn("saturated", result)
+        self.assertGreater(result["points_per_second"], 0)
+
+    def test_workers(self):
+        """Test streams are split between worker processes"""
+        result = run_load("EMA_detector", streams=4, rate=8000, seconds=0.5, workers=2)
+        self.assertGreater(result["points"], 2000)
+
+    def test_saturation(self):
+        """Test the search stops at the first rate the detector can't keep up with"""
+        result = find_saturation("EMA_detector", [1e9, 1000], streams=1, seconds=0.3)
+        self.assertEqual(result["saturation_rate"], 1000)
+        self.assertEqual(len(result["runs"]), 2)
+        self.assertTrue(result["runs"][-1]["saturated"])
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            run_load("EMA_detector", chunk=7)
+        with self.assertRaises(ValueError):
+            run_load("EMA_detector", streams=1, workers=2)
+
+
+if __name__ == '__main__':
+    unittest.main()
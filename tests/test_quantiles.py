@@ -0,0 +1,109 @@
+import pickle
+import random
+import unittest
+import numpy as np
+from src.detector import P2Quantile, QuantileThreshold, QuantileThresholdDetector, EMADetector, get_detector
+from src.simulator import simulator
+
+
+class TestP2Quantile(unittest.TestCase):
+    def test_accuracy(self):
+        """Test the estimate is close to the exact quantile for skewed and symmetric data"""
+        rng = np.random.default_rng(0)
+        for name, values in [("normal", rng.normal(10, 2, 50000)), ("exponential", rng.exponential(1, 50000))]:
+            for quantile in (0.5, 0.9, 0.99):
+                with self.subTest(distribution=name, quantile=quantile):
+                    sketch = P2Quantile(quantile)
+                    sketch.extend(values)
+                    exact = np.quantile(values, quantile)
+                    self.assertAlmostEqual(sketch.value(), exact, delta=0.03 * abs(exact))
+
+    def test_few_values(self):
+        sketch = P2Quantile(0.5)
+        self.assertTrue(np.isnan(sketch.value()))
+        sketch.extend([3.0, 1.0, 2.0])
+        self.assertEqual(sketch.value(), 2.0)
+        with self.assertRaises(ValueError):
+            P2Quantile(1.0)
+
+    def test_constant_memory(self):
+        sketch = P2Quantile(0.99)
+        sketch.extend(np.arange(100000.0))
+        self.assertEqual(len(sketch.heights), 5)
+        self.assertEqual(sketch.count, 100000)
+
+
+class TestQuantileThreshold(unittest.TestCase):
+    def test_adapts_to_drift(self):
+        """Test the threshold follows a shift in the values once a sketch rotates out"""
+        rng = np.random.default_rng(1)
+        threshold = QuantileThreshold(0.99, margin=1.1, epoch=5000, warmup=100)
+        threshold.exceeds(rng.normal(0, 1, 10000))
+        self.assertAlmostEqual(threshold.value(), 2.33 * 1.1, delta=0.25)
+        over = threshold.exceeds(rng.normal(0, 1, 30000) * 3)
+        self.assertAlmostEqual(threshold.value(), 7.0 * 1.1, delta=1.0)
+        # Few values are over the threshold once it has adapted
+        self.assertLess(over[-5000:].mean(), 0.01)
+
+    def test_anomalies_are_clipped(self):
+        """Test a long anomaly can't stretch the threshold to its own level"""
+        threshold = QuantileThreshold(0.99, margin=1.1, warmup=100)
+        threshold.exceeds(np.random.default_rng(2).normal(0, 1, 5000))
+        before = threshold.value()
+        self.assertTrue(threshold.exceeds(np.full(500, 50.0)).all())
+        # The quantile is in the anomaly's mass, but only rises by the margin as the sketch catches up
+        self.assertGreater(threshold.value(), before)
+        self.assertLess(threshold.value(), 10)
+
+    def test_check_without_learning(self):
+        threshold = QuantileThreshold(0.99, warmup=100)
+        self.assertFalse(threshold.exceeds(np.full(10, 50.0), learn=False).any())
+        threshold.exceeds(np.random.default_rng(2).normal(0, 1, 1000))
+        before = threshold.value()
+        self.assertTrue(threshold.exceeds(np.full(500, 50.0), learn=False).all())
+        self.assertEqual(threshold.value(), before)
+        with self.assertRaises(ValueError):
+            QuantileThreshold(0.99, margin=1.0)
+
+
+class TestQuantileThresholdDetector(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        random.seed(6)
+        cls.days = [np.array(day) for day, _ in zip(simulator(), range(4))]
+        cls.days[3][600:660] = 0.0
+
+    def test_thresholds_base_scores(self):
+        """Test the EMA detector's scores are thresholded on their quantile"""
+        detector = QuantileThresholdDetector(EMADetector(), quantile=0.995, margin=1.5, epoch=None, warmup=1440)
+        detector.fit(np.concatenate(self.days[:2]))
+        self.assertLess(detector.threshold.value(), float("inf"))
+        detector.push(self.days[2], 2880)
+        flagged = detector.push(self.days[3], 4320)
+        self.assertTrue(set(range(4920, 4980)) <= set(flagged))
+        self.assertLess(len(flagged), 200)
+
+    def test_uses_base_flags_while_warming_up(self):
+        detector = get_detector("quantile_threshold", base="EMA_detector")
+        self.assertEqual(detector.push(self.days[0], 0), EMADetector().push(self.days[0], 0))
+
+    def test_state_round_trip(self):
+        detector = QuantileThresholdDetector(EMADetector(), warmup=1000, epoch=None)
+        detector.fit(np.concatenate(self.days[:2]))
+        restored = QuantileThresholdDetector(EMADetector(), warmup=1000, epoch=None)
+        restored.load_state(pickle.loads(pickle.dumps(detector.state())))
+        self.assertEqual(detector.push(self.days[3], 4320), restored.push(self.days[3], 4320))
+
+    def test_state_is_a_copy(self):
+        """Test a saved state doesn't change as the detector carries on"""
+        detector = QuantileThresholdDetector(EMADetector(), warmup=1000, epoch=None)
+        detector.fit(np.concatenate(self.days[:2]))
+        state = detector.state()
+        threshold = state["threshold"].value()
+        detector.push(self.days[3], 4320)
+        self.assertEqual(state["threshold"].value(), threshold)
+        self.assertIsNot(state["threshold"], detector.threshold)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import random
+import unittest
+import numpy as np
+from src.detector import (
+    Detector, get_detector, available_detectors, detector_from_config, run_stream, EMADetector
+)
+from src.simulator import simulator, sliding_windows
+
+
+class TestDetectorRegistry(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        random.seed(2)
+        cls.days = [np.array(day) for day, _ in zip(simulator(), range(3))]
+        cls.days[2][300:360] = 0.0
+
+    def test_registered_detectors(self):
+        """Test every detector is registered and implements the interface"""
+        self.assertEqual(set(available_detectors()), {"EMA_detector", "IF3", "IF_detector2", "IF_detector", "ensemble", "quantile_threshold", "change_point"})
+        for name in available_detectors():
+            self.assertIsInstance(get_detector(name), Detector)
+        with self.assertRaises(ValueError):
+            get_detector("unknown")
+
+    def test_common_interface(self):
+        """Test every detector fits, scores and flags the outage in absolute minutes"""
+        params = {
+            "IF3": {"n_estimators": 20},
+            "IF_detector2": {"n_estimators": 20, "seed": 0, "contamination": 0.05},
+            "IF_detector": {"n_trees": 10, "seed": 0, "threshold": 0.6},
+            "ensemble": {"members": {"EMA_detector": {}, "IF3": {"n_estimators": 20}}, "min_votes": 1},
+            "quantile_threshold": {"base": "IF3", "base_params": {"n_estimators": 20}, "quantile": 0.99, "margin": 1.01}
+        }
+        for name in available_detectors():
+            with self.subTest(detector=name):
+                detector = get_detector(name, **params.get(name, {}))
+                detector.fit(np.concatenate(self.days[:2]))
+                scores = detector.score_batch(self.days[2], 2880)
+                self.assertEqual(len(scores), 1440)
+                self.assertGreater(scores[300:360].mean(), np.median(scores))
+
+                flagged = detector.push(self.days[2], 2880)
+                self.assertTrue(all(2880 <= minute < 4320 for minute in flagged))
+                self.assertTrue(set(range(3180, 3240)) & set(flagged))
+
+    def test_state_round_trip(self):
+        """Test a detector restored from its state carries on identically"""
+        detector = EMADetector()
+        detector.push(self.days[0], 0)
+        detector.push(self.days[1][:700], 1440)
+
+        restored = EMADetector()
+        restored.load_state(detector.state())
+        self.assertEqual(detector.push(self.days[1][700:], 2140), restored.push(self.days[1][700:], 2140))
+        np.testing.assert_array_equal(detector.base_pattern, restored.base_pattern)
+
+    def test_detector_from_config(self):
+        """Test the detector and its parameters are read from the config"""
+        detector = detector_from_config({
+            "detector": "EMA_detector",
+            "detector_params": {"EMA_detector": {"threshold_std": 6.0}, "IF3": {"n_estimators": 5}}
+        })
+        self.assertIsInstance(detector, EMADetector)
+        self.assertEqual(detector.params["threshold_std"], 6.0)
+
+    def test_run_stream_windows_match_days(self):
+        """Test days and sliding windows give the same flags"""
+        daily = [flagged for _, flagged in run_stream(EMADetector(), iter(self.days))]
+        windowed = [flagged for _, flagged in run_stream(EMADetector(), sliding_windows(iter(self.days), 60, 5))]
+        self.assertEqual(sum(daily, []), sum(windowed, []))
+
+
+if __name__ == '__main__':
+    unittest.main()
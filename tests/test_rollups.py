@@ -0,0 +1,94 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+from src.storage import StreamStore, RollupPyramid, compare_with_baselines, load_monthly_baselines
+
+
+class TestRollupPyramid(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.values = 50 + rng.normal(0, 2, 1440 * 3)
+
+    def test_incremental_matches_batch(self):
+        """Test rollups built from uneven batches match aggregating the raw values"""
+        pyramid = RollupPyramid()
+        for start in range(0, len(self.values), 37):
+            pyramid.extend(self.values[start:start + 37], start)
+        for resolution in (5, 60, 1440):
+            with self.subTest(resolution=resolution):
+                rollup = pyramid.level(resolution).rollup()
+                buckets = self.values.reshape(-1, resolution)
+                np.testing.assert_allclose(rollup.mean, buckets.mean(axis=1))
+                np.testing.assert_array_equal(rollup.min, buckets.min(axis=1))
+                np.testing.assert_array_equal(rollup.max, buckets.max(axis=1))
+                np.testing.assert_array_equal(rollup.count, resolution)
+                np.testing.assert_array_equal(rollup.start, np.arange(0, len(self.values), resolution))
+
+    def test_choose_level(self):
+        pyramid = RollupPyramid()
+        pyramid.extend(self.values, 0)
+        self.assertEqual(pyramid.choose_level(0, 4320, resolution=60).resolution, 60)
+        self.assertEqual(pyramid.choose_level(0, 4320, resolution=100).resolution, 60)
+        self.assertEqual(pyramid.choose_level(0, 4320, max_points=1000).resolution, 5)
+        self.assertEqual(pyramid.choose_level(0, 4320, max_points=100).resolution, 60)
+        self.assertEqual(pyramid.choose_level(0, 4320, max_points=2).resolution, 1440)
+        with self.assertRaises(ValueError):
+            pyramid.choose_level(0, 4320, resolution=1)
+
+    def test_query_range(self):
+        pyramid = RollupPyramid()
+        pyramid.extend(self.values, 0)
+        rollup = pyramid.query(90, 300, resolution=60)
+        np.testing.assert_array_equal(rollup.start, [60, 120, 180, 240])
+        np.testing.assert_allclose(rollup.mean[1], self.values[120:180].mean())
+
+    def test_gaps_and_out_of_order(self):
+        """Test skipped minutes leave empty buckets and earlier minutes are refused"""
+        pyramid = RollupPyramid(resolutions=(60,))
+        pyramid.extend(self.values[:30], 0)
+        pyramid.extend(self.values[200:260], 200)
+        rollup = pyramid.level(60).rollup()
+        np.testing.assert_array_equal(rollup.count, [30, 0, 0, 40, 20])
+        self.assertTrue(np.isnan(rollup.mean[1]))
+        with self.assertRaises(ValueError):
+            pyramid.extend(self.values[:10], 100)
+
+    def test_max_buckets(self):
+        pyramid = RollupPyramid(resolutions=(5,), max_buckets=100)
+        for start in range(0, len(self.values), 60):
+            pyramid.extend(self.values[start:start + 60], start)
+        rollup = pyramid.level(5).rollup()
+        self.assertEqual(len(rollup), 100)
+        self.assertEqual(rollup.start[0], len(self.values) - 500)
+        np.testing.assert_allclose(rollup.mean[-1], self.values[-5:].mean())
+
+    def test_from_store(self):
+        with tempfile.TemporaryDirectory() as directory:
+            store = StreamStore(os.path.join(directory, "store"))
+            for day in range(3):
+                store.append_day(day, self.values[day * 1440:(day + 1) * 1440])
+            pyramid = RollupPyramid.from_store(store)
+        np.testing.assert_allclose(pyramid.level(1440).rollup().mean, self.values.reshape(3, -1).mean(axis=1))
+
+    def test_compare_with_baselines(self):
+        """Test monthly means are compared with the baseline of their month"""
+        baselines = load_monthly_baselines()
+        pyramid = RollupPyramid(resolutions=(1440,))
+        # A day at January's baseline then a day 3 deviations over February's
+        january, february = baselines.iloc[0], baselines.iloc[1]
+        pyramid.extend(np.full(1440, january["Value"]), 0)
+        pyramid.extend(np.full(1440, february["Value"] + 3 * february["Std"]), 31 * 1440)
+        comparison = compare_with_baselines(pyramid, baselines)
+        self.assertEqual(comparison["Month"].tolist(), [1, 2])
+        self.assertEqual(comparison["Days"].tolist(), [1, 1])
+        np.testing.assert_allclose(comparison["Z"], [0, 3], atol=1e-9)
+
+        shifted = compare_with_baselines(pyramid, baselines, start_day=31)
+        self.assertEqual(shifted["Month"].tolist(), [2, 3])
+        self.assertIsInstance(shifted, pd.DataFrame)
+
+
+if __name__ == '__main__':
+    unittest.main()
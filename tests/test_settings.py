@@ -0,0 +1,143 @@
+import json
+import os
+import tempfile
+import unittest
+from src.detector import EMADetector, check_detector_settings, detector_from_settings, reconfigure_detector
+from src.utils import Settings, load_settings, SettingsWatcher
+from src.utils.config_loader import CONFIG_PATH
+
+
+class TestSettings(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "config.json")
+        with open(CONFIG_PATH) as file:
+            self.config = json.load(file)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, config):
+        with open(self.path, "w") as file:
+            json.dump(config, file)
+        # Make sure the watcher sees a new modification time
+        os.utime(self.path, ns=(0, os.stat(self.path).st_mtime_ns + 1_000_000))
+
+    def test_repository_config(self):
+        """Test the shipped config is valid and round trips"""
+        settings = load_settings()
+        check_detector_settings(settings)
+        self.assertEqual(settings.simulator.multiplier_bounds()[1], (0.9, 0.95))
+        self.assertEqual(Settings.from_dict(settings.to_dict()), settings)
+
+    def test_defaults_without_file(self):
+        self.assertEqual(load_settings(self.path), Settings())
+
+    def test_validation(self):
+        """Test invalid values and unknown keys are rejected"""
+        invalid = [
+            {"simulator": {"anomaly_threshold": 2}},
+            {"simulator": {"anomaly_min_duration": 10, "anomaly_max_duration": 5}},
+            {"performance": {"window_size": 60}},
+            {"performance": {"n_treads": 4}},
+            {"output": {"metrics": "statsd"}},
+            {"retraining": {"interval_days": 0}},
+            {"detector_parameters": {}},
+            {"max_capacity": "abc"},
+            {"performance": {"n_jobs": "2"}},
+            {"performance": {"separate_processes": 1}},
+            {"simulator": {"anomaly_multiplier_bounds": {"outage": 0, "leak": [0.9, 0.95],
+                                                         "surge": [1.05, 1.1], "sensor_fault": [-5, 5]}}},
+            {"detector_params": []},
+            {"detector_params": {"EMA_detector": 8}},
+            []
+        ]
+        for config in invalid:
+            with self.subTest(config=config):
+                with self.assertRaises(ValueError):
+                    Settings.from_dict(config)
+
+        with self.assertRaises(ValueError):
+            check_detector_settings(Settings(detector="EMA"))
+        with self.assertRaises(ValueError):
+            check_detector_settings(Settings(detector_params={"EMA_detector": {"threshold": 6}}))
+        with self.assertRaises(ValueError):
+            check_detector_settings(Settings(detector_params={"EMA_detector": {"threshold_std": "8"}}))
+        with self.assertRaises(ValueError):
+            check_detector_settings(Settings(detector_params={"IF_detector2": {"contamination": "0.01"}}))
+        check_detector_settings(Settings(detector_params={"EMA_detector": {"threshold_std": 8, "jit": None}}))
+
+    def test_restart_changes(self):
+        """Test only the settings applied while running are left out of the restart notice"""
+        settings = Settings()
+        changed = Settings.from_dict({
+            "max_capacity": 80,
+            "detector_params": {"EMA_detector": {"threshold_std": 6.0}},
+            "performance": {"n_jobs": 2, "update_interval": 50, "window_size": 60, "window_step": 5},
+            "output": {"event_max_gap": 10, "alerts": ["syslog"]}
+        })
+        self.assertEqual(changed.restart_changes(settings), [
+            "simulator.max_capacity", "performance.window_size", "performance.window_step", "output.alerts"
+        ])
+
+    def test_detector_config(self):
+        """Test retraining and performance settings reach the detectors they concern"""
+        settings = Settings.from_dict({
+            "detector": "IF_detector2",
+            "detector_params": {"IF_detector2": {"contamination": 0.01, "retrain_interval": 1440}},
+            "retraining": {"interval_days": 7, "training_days": 30}
+        })
+        detector = detector_from_settings(settings)
+        self.assertEqual(detector.params["retrain_interval"], 7 * 1440)
+        self.assertEqual(detector.params["training_days"], 30)
+        self.assertEqual(detector.params["contamination"], 0.01)
+
+    def test_output_environment(self):
+        """Test environment variables take priority over the output settings"""
+        output = Settings.from_dict({"output": {"metrics": "memory", "alerts": ["syslog", "file:a.jsonl"]}}).output
+        environ = output.environ({"ANOMALY_METRICS": "jsonl:m.jsonl", "HOME": "/root"})
+        self.assertEqual(environ["ANOMALY_METRICS"], "jsonl:m.jsonl")
+        self.assertEqual(environ["ANOMALY_ALERTS"], "syslog,file:a.jsonl")
+        self.assertNotIn("HOME", environ)
+
+    def test_hot_reload(self):
+        """Test a changed config is picked up and an invalid one is ignored"""
+        self.write(self.config)
+        watcher = SettingsWatcher(self.path, validate=check_detector_settings)
+        self.assertIsNone(watcher.poll())
+
+        self.config["performance"]["update_interval"] = 50
+        self.write(self.config)
+        settings = watcher.poll()
+        self.assertEqual(settings.performance.update_interval, 50)
+        self.assertEqual(settings.changed_sections(load_settings()), ["performance"])
+
+        self.config["detector_params"]["EMA_detector"]["threshold"] = 6
+        self.write(self.config)
+        self.assertIsNone(watcher.poll())
+        self.assertIsInstance(watcher.error, ValueError)
+        self.assertIs(watcher.settings, settings)
+
+        # A value of the wrong type is ignored too, rather than raising out of the stream
+        self.config["detector_params"]["EMA_detector"] = {"threshold_std": "8"}
+        self.write(self.config)
+        self.assertIsNone(watcher.poll())
+        self.config["detector_params"] = {}
+        self.config["performance"]["n_jobs"] = "2"
+        self.write(self.config)
+        self.assertIsNone(watcher.poll())
+        self.assertIs(watcher.settings, settings)
+
+    def test_reconfigure_keeps_state(self):
+        """Test new parameters are applied to a running detector without resetting it"""
+        detector = EMADetector()
+        detector.warmup = [1.0] * 10
+        skipped = reconfigure_detector(detector, {"threshold_std": 6.0, "history_window": 60})
+        self.assertEqual(skipped, ["history_window"])
+        self.assertEqual(detector.params["threshold_std"], 6.0)
+        self.assertEqual(detector.params["history_window"], 1440 * 7)
+        self.assertEqual(detector.warmup, [1.0] * 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
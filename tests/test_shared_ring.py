@@ -0,0 +1,105 @@
+import threading
+import unittest
+import numpy as np
+from src.detector import EMADetector, run_stream
+from src.simulator import sliding_windows
+from src.storage import SharedRing, ProcessPipeline, publish, subscribe
+
+
+def nominal_days(n_days=3, seed=0):
+    """Deterministic source the pipeline's source process can rebuild"""
+    rng = np.random.default_rng(seed)
+    for day in range(n_days):
+        values = 50 + 5 * np.sin(np.arange(1440) / 200) + rng.normal(0, 0.5, 1440)
+        if day == 2:
+            values[300:360] = 0.0
+        yield values
+
+
+def failing_source():
+    yield np.ones(1440)
+    raise IOError("source failed")
+
+
+class TestSharedRing(unittest.TestCase):
+    def test_blocks_in_order(self):
+        """Test blocks are read in order with their minutes, long writes split into blocks"""
+        with SharedRing.create(slots=4, block_size=100) as ring:
+            ring.write(np.arange(250.0), 1000)
+            ring.mark_closed()
+            blocks = [(block.seq, block.start_minute, block.values.copy()) for block in subscribe(ring, 0)]
+        self.assertEqual([(seq, start) for seq, start, _ in blocks], [(0, 1000), (1, 1100), (2, 1200)])
+        np.testing.assert_array_equal(np.concatenate([values for _, _, values in blocks]), np.arange(250.0))
+
+    def test_reads_in_place(self):
+        with SharedRing.create(slots=2, block_size=10, dtype=np.float32) as ring:
+            ring.write(np.ones(10), 0)
+            block = ring.read(0)
+            self.assertEqual(block.values.dtype, np.float32)
+            self.assertTrue(np.shares_memory(block.values, ring.data))
+            del block
+
+    def test_consumers_hold_back_the_producer(self):
+        """Test a slow consumer makes the producer wait rather than lose blocks, and every consumer sees every block"""
+        ring = SharedRing.create(slots=3, block_size=10, consumers=2)
+        received = [[], []]
+
+        def consume(consumer, delay):
+            for block in subscribe(SharedRing.attach(ring.name), consumer):
+                received[consumer].append(float(block.values[0]))
+                threading.Event().wait(delay)
+
+        threads = [threading.Thread(target=consume, args=(0, 0)), threading.Thread(target=consume, args=(1, 0.002))]
+        for thread in threads:
+            thread.start()
+        publish((np.full(10, float(i)) for i in range(50)), ring, timeout=10)
+        for thread in threads:
+            thread.join(10)
+        expected = [float(i) for i in range(50)]
+        self.assertEqual(received, [expected, expected])
+        ring.close()
+
+    def test_full_ring_times_out(self):
+        with SharedRing.create(slots=2, block_size=10) as ring:
+            ring.write(np.ones(10), 0)
+            ring.write(np.ones(10), 10)
+            with self.assertRaises(TimeoutError):
+                ring.write(np.ones(10), 20, timeout=0.05)
+            ring.detach(0)
+            ring.write(np.ones(10), 20, timeout=0.05)
+
+    def test_invalid_rings(self):
+        with self.assertRaises(ValueError):
+            SharedRing.create(slots=1)
+        with self.assertRaises(ValueError):
+            SharedRing.create(dtype=np.complex128)
+
+
+class TestProcessPipeline(unittest.TestCase):
+    def test_matches_run_stream(self):
+        """Test a detector in its own process flags the same minutes as in process"""
+        pipeline = ProcessPipeline(nominal_days, {"n_days": 3}, {"EMA_detector": {}})
+        results = [(values.copy(), flagged) for values, flagged in pipeline.stream()]
+        expected = list(run_stream(EMADetector(), nominal_days(3)))
+        self.assertEqual([flagged for _, flagged in results], [flagged for _, flagged in expected])
+        for (values, _), (expected_values, _) in zip(results, expected):
+            np.testing.assert_array_equal(values, expected_values)
+        self.assertTrue(set(range(3180, 3240)) & set(results[2][1]))
+
+    def test_windows(self):
+        """Test sliding window sources publish each window's new values"""
+        with SharedRing.create(slots=8, block_size=60) as ring:
+            thread = threading.Thread(target=publish, args=(sliding_windows(nominal_days(1), 60, 30), ring))
+            thread.start()
+            starts = [block.start_minute for block in subscribe(ring, 0)]
+            thread.join()
+        self.assertEqual(starts, list(range(0, 1440, 30)))
+
+    def test_failed_stage(self):
+        pipeline = ProcessPipeline(failing_source, detectors={"EMA_detector": {}})
+        with self.assertRaises(ChildProcessError):
+            list(pipeline.stream())
+
+
+if __name__ == '__main__':
+    unittest.main()
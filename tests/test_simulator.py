@@ -5,7 +5,11 @@ import numpy as np
 from src.simulator.simulator import (
     generate_point, generate_24_hours, get_point_bounds,
     calculate_seasonal_multiplier, daily_peak_multiplier,
-    gaussian_noise, apply_patterns, setup, simulator
+    gaussian_noise, apply_patterns, setup, simulator,
+    calculate_seasonal_multipliers, daily_peak_multipliers, expected_flow_surface
+)
+from src.simulator.baseline_interpolator import (
+    get_mid_point_arrays, generate_interpolation, build_baseline
 )
 
 
@@ -83,6 +87,35 @@ class TestGasFlowSimulator(unittest.TestCase):
             places=2
         )
 
+    def test_calculate_seasonal_multipliers_matches_scalar(self):
+        """Test vectorised seasonal multipliers match the scalar version"""
+        daily_avgs = [0.0, 30.0, 50.0, 70.0, self.max_daily_avg]
+        rates = calculate_seasonal_multipliers(daily_avgs)
+        for rate, daily_avg in zip(rates, daily_avgs):
+            self.assertAlmostEqual(rate, calculate_seasonal_multiplier(daily_avg))
+
+    def test_daily_peak_multipliers_matches_scalar(self):
+        """Test vectorised daily peak multipliers match the scalar version"""
+        multipliers = daily_peak_multipliers([0.05, 0.1])
+        self.assertEqual(multipliers.shape, (2, 1440))
+        for minute in (0, 360, 720, 1080, 1439):
+            self.assertAlmostEqual(multipliers[1, minute], daily_peak_multiplier(minute, 0.1))
+
+    def test_expected_flow_surface_shape(self):
+        """Test expected flow surface covers every minute of the year"""
+        surface = expected_flow_surface(setup())
+        self.assertEqual(surface.shape, (365, 1440))
+        self.assertTrue(np.all(surface > 0))
+
+    def test_build_baseline_resolutions(self):
+        """Test daily and minute baselines agree at the start of each day"""
+        interpolation = generate_interpolation(dict(zip(*get_mid_point_arrays([50.0] * 12))))
+        daily = build_baseline(interpolation)
+        minutes = build_baseline(interpolation, points_per_day=1440)
+        self.assertEqual(len(daily), 365)
+        self.assertEqual(len(minutes), 365 * 1440)
+        np.testing.assert_allclose(minutes[::1440], daily)
+
     def test_gaussian_noise_distribution(self):
         """Test gaussian noise distribution properties"""
         samples = [gaussian_noise() for _ in range(1000)]
@@ -104,7 +137,7 @@ class TestGasFlowSimulator(unittest.TestCase):
         stream = [50.0] * 1440
         result = apply_patterns(stream, self.sample_daily_avg)
         # Check that values have been modified
-        self.assertNotEqual(result, stream)
+        self.assertNotEqual(result.tolist(), stream)
         # Check that values vary throughout the day
         self.assertNotEqual(result[0], result[720])
 
@@ -129,6 +162,8 @@ class TestGasFlowSimulator(unittest.TestCase):
         self.assertEqual(len(first_day), 1440)
         # Verify values are reasonable
         self.assertTrue(all(isinstance(x, float) for x in first_day))
+        # Days are compact float64 arrays
+        self.assertEqual(first_day.dtype, np.float64)
 
     def test_run_simulation_wrap_around(self):
         """Test run_simulation handles year wrap-around"""
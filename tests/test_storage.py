@@ -0,0 +1,108 @@
+import os
+import tempfile
+import time
+import unittest
+import numpy as np
+from src.storage import StreamStore, record, record_simulation, replay
+
+
+class TestStreamStore(unittest.TestCase):
+    def setUp(self):
+        """Set up a store with two days of data"""
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = StreamStore(self.directory.name)
+        self.day_0 = np.arange(1440, dtype=float)
+        self.day_1 = np.arange(1440, 2880, dtype=float)
+        labels = np.zeros(1440, dtype=int)
+        labels[100:200] = 1
+        self.store.append_day(0, self.day_0, labels=labels)
+        self.store.append_day(1, self.day_1)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_read_day(self):
+        """Test days are read back as memory maps"""
+        day = self.store.read_day(0)
+        self.assertIsInstance(day, np.memmap)
+        np.testing.assert_array_equal(day, self.day_0)
+        self.assertEqual(self.store.read_day(0, "labels")[150], 1)
+
+    def test_read_range_across_days(self):
+        """Test ranges can cross day boundaries"""
+        values = self.store.read_range(1400, 1500)
+        np.testing.assert_array_equal(values, np.arange(1400, 1500, dtype=float))
+
+    def test_append_only(self):
+        """Test stored days and columns cannot be overwritten"""
+        with self.assertRaises(ValueError):
+            self.store.append_day(0, self.day_0)
+        self.store.write_column(1, "flags", np.zeros(1440, dtype=bool))
+        with self.assertRaises(ValueError):
+            self.store.write_column(1, "flags", np.zeros(1440, dtype=bool))
+
+    def test_wrong_length(self):
+        """Test day blocks must be a full day"""
+        with self.assertRaises(ValueError):
+            self.store.append_day(2, [1.0, 2.0])
+
+    def test_bad_column_writes_nothing(self):
+        """Test a day with a bad second column isn't half stored"""
+        for labels in ([1, 2], ["a"] * 1440):
+            with self.assertRaises(ValueError):
+                self.store.append_day(2, self.day_0, labels=labels)
+            self.assertEqual(self.store.days, [0, 1])
+            self.assertFalse(os.path.exists(os.path.join(self.directory.name, "values", "0000002.npy")))
+        self.store.append_day(2, self.day_0)
+        self.assertEqual(StreamStore(self.directory.name).columns(2), ["values"])
+
+    def test_reopen(self):
+        """Test the index is persisted"""
+        store = StreamStore(self.directory.name)
+        self.assertEqual(store.days, [0, 1])
+        self.assertEqual(store.columns(0), ["values", "labels"])
+        days = [day for day, _ in store.iter_days(start_day=1)]
+        self.assertEqual(days, [1])
+
+
+class TestReplay(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_record_simulation_is_deterministic(self):
+        """Test the same seed records the same dataset"""
+        with tempfile.TemporaryDirectory() as other:
+            first = record_simulation(self.directory.name, duration=2, seed=3)
+            second = record_simulation(other, duration=2, seed=3)
+            np.testing.assert_array_equal(first.read_range(0, 2880), second.read_range(0, 2880))
+
+    def test_replay_matches_recording(self):
+        """Test replay yields the recorded days and labels in order"""
+        days = [([float(day)] * 1440, [day % 2] * 1440) for day in range(3)]
+        record(iter(days), StreamStore(self.directory.name))
+
+        replayed = list(replay(self.directory.name, with_labels=True))
+        self.assertEqual(len(replayed), 3)
+        for (values, labels), (expected_values, expected_labels) in zip(replayed, days):
+            np.testing.assert_array_equal(values, expected_values)
+            np.testing.assert_array_equal(labels, expected_labels)
+
+        self.assertEqual(len(list(replay(self.directory.name, start_day=1, duration=1))), 1)
+
+    def test_replay_speed(self):
+        """Test replay is paced by the speed multiplier"""
+        record(iter([([1.0] * 1440, [0] * 1440)] * 3), StreamStore(self.directory.name))
+        start = time.monotonic()
+        # 3 days at 86400 * 10 times real time is 0.1 seconds between days
+        list(replay(self.directory.name, speed=86400 * 10))
+        self.assertGreaterEqual(time.monotonic() - start, 0.2)
+
+        with self.assertRaises(ValueError):
+            next(replay(self.directory.name, speed=0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import tempfile
+import unittest
+from src.benchmark.sweep import grid, pareto_front, random_search, run_sweep
+
+
+class TestSweep(unittest.TestCase):
+    def test_grid(self):
+        params = grid({"threshold_std": [4.0, 8.0], "ema_alpha": [0.1, 0.2, 0.3]})
+        self.assertEqual(len(params), 6)
+        self.assertIn({"threshold_std": 8.0, "ema_alpha": 0.3}, params)
+        with self.assertRaises(ValueError):
+            grid({"ema_alpha": {"low": 0.01, "high": 0.5}})
+
+    def test_random_search(self):
+        """Test draws are seeded, within their ranges and not repeated"""
+        space = {"n_trees": {"low": 10, "high": 200}, "threshold": {"low": 0.001, "high": 0.1, "log": True}, "seed": [1, 2]}
+        params = random_search(space, 20, seed=3)
+        self.assertEqual(params, random_search(space, 20, seed=3))
+        self.assertEqual(len(params), 20)
+        for trial in params:
+            self.assertIsInstance(trial["n_trees"], int)
+            self.assertTrue(10 <= trial["n_trees"] <= 200)
+            self.assertTrue(0.001 <= trial["threshold"] <= 0.1)
+        self.assertEqual(len(random_search({"seed": [1, 2]}, 5)), 2)
+
+    def test_pareto_front(self):
+        """Test only trials no other beats on both accuracy and throughput are kept, most accurate first"""
+        trials = [
+            {"params": {"a": 1}, "f1": 0.9, "points_per_second": 100},
+            {"params": {"a": 2}, "f1": 0.5, "points_per_second": 1000},
+            {"params": {"a": 3}, "f1": 0.5, "points_per_second": 500},
+            {"params": {"a": 4}, "f1": 0.8, "points_per_second": 90},
+            {"params": {"a": 5}, "error": "ValueError: bad"}
+        ]
+        self.assertEqual([trial["params"]["a"] for trial in pareto_front(trials)], [1, 2])
+
+    def test_run_sweep(self):
+        """Test every parameter set is benchmarked on the cached datasets"""
+        with tempfile.TemporaryDirectory() as data_dir:
+            sweep = run_sweep("EMA_detector", {"threshold_std": [4.0, 8.0]}, duration=2, training_duration=1,
+                              data_dir=data_dir, workers=1)
+        self.assertEqual([trial["params"] for trial in sweep["trials"]], [{"threshold_std": 4.0}, {"threshold_std": 8.0}])
+        for trial in sweep["trials"]:
+            self.assertGreater(trial["points_per_second"], 0)
+            self.assertIn("f1", trial)
+            self.assertEqual(trial["workers"], 1)
+        self.assertTrue(sweep["front"])
+
+
+if __name__ == '__main__':
+    unittest.main()
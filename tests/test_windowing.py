@@ -0,0 +1,62 @@
+import unittest
+import numpy as np
+from src.simulator.windowing import sliding_windows, split_by_day
+from src.detector.EMA_detector import process_simulation, process_windows
+
+
+class TestSlidingWindows(unittest.TestCase):
+    def setUp(self):
+        """Two days where every value is its minute"""
+        self.days = [np.arange(1440, dtype=float) + 1440 * day for day in range(2)]
+
+    def test_windows_cover_stream(self):
+        """Test every value is new in exactly one window, across the day boundary"""
+        windows = list(sliding_windows(iter(self.days), window=60, step=7))
+        new_values = np.concatenate([window.new_values for window in windows])
+        np.testing.assert_array_equal(new_values, np.arange(2880))
+        for window in windows:
+            np.testing.assert_array_equal(window.values, np.arange(window.start, window.end))
+            self.assertLessEqual(len(window.values), 60)
+
+    def test_partial_last_step(self):
+        """Test the final partial step is flushed"""
+        windows = list(sliding_windows(iter(self.days), window=60, step=7))
+        self.assertEqual(windows[-1].step, 2880 % 7)
+
+    def test_invalid_sizes(self):
+        """Test the step must fit in the window"""
+        with self.assertRaises(ValueError):
+            next(sliding_windows(iter(self.days), window=5, step=10))
+
+    def test_split_by_day(self):
+        """Test chunks never cross midnight"""
+        chunks = list(split_by_day(1430, np.arange(20)))
+        self.assertEqual([(minute, start, len(chunk)) for minute, start, chunk in chunks], [(1430, 1430, 10), (0, 1440, 10)])
+
+    def test_ema_windows_match_days(self):
+        """Test EMA state carries over windows so results match whole days"""
+        rng = np.random.default_rng(3)
+        days = [50 + rng.normal(0, 0.5, 1440) for _ in range(3)]
+        days[2][100:200] = 0.0
+
+        daily = []
+        for day, (_, anomalies) in enumerate(process_simulation(duration=3, source=iter(days))):
+            daily.extend(1440 * day + minute for minute in anomalies)
+
+        windowed = []
+        for _, anomalies in process_windows(sliding_windows(iter(days), window=60, step=5)):
+            windowed.extend(anomalies)
+
+        self.assertEqual(daily, windowed)
+        self.assertIn(2 * 1440 + 100, windowed)
+
+    def test_ema_short_source(self):
+        """Test a source shorter than the duration is processed to its end"""
+        days = [50 + np.random.default_rng(day).normal(0, 0.5, 1440) for day in range(3)]
+        self.assertEqual(len(list(process_simulation(source=iter(days)))), 3)
+        with self.assertRaises(ValueError):
+            list(process_simulation(source=iter([])))
+
+
+if __name__ == '__main__':
+    unittest.main()